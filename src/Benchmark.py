@@ -0,0 +1,579 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from PIL import Image, ImageOps
+from FishInference import MODEL_PATH, IMAGE_SIZE, image_to_pixels, pixels_to_batch, random_batch, load_model, compile_predict, load_backend
+from ImagePrep import RESIZE_FILTER
+from Timing import time_calls
+
+
+def print_table(title, rows):
+    print(f"\n {title}")
+    print(f" {'path':<32}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in rows.items():
+        print(f" {name:<32}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+
+
+# --- Model.predict vs the compiled predict path, one image per call ---
+def bench_predict(model_path=MODEL_PATH, iterations=200, warmup=10):
+    model = load_model(model_path)
+    batch = random_batch(1)
+
+    # First call in a fresh process includes tracing / graph build
+    start = time.perf_counter()
+    model.predict(batch, verbose=0)
+    predict_first_ms = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    compiled = compile_predict(model, warmup=False)
+    compiled(batch)
+    compiled_first_ms = (time.perf_counter() - start) * 1000.0
+
+    results = {
+        'keras_predict': time_calls(lambda: model.predict(batch, verbose=0), iterations, warmup),
+        'compiled_predict': time_calls(lambda: compiled(batch), iterations, warmup)
+    }
+    results['keras_predict']['first_call_ms'] = predict_first_ms
+    results['compiled_predict']['first_call_ms'] = compiled_first_ms
+    print_table(f"Single-image latency over {iterations} calls ({model_path})", results)
+    return results
+
+
+# --- Accuracy vs latency per backend on the held-out split used in training ---
+def bench_backends(model_paths, data_dir, threads=None, iterations=100, tolerance=0.01, batch_size=64):
+    from sklearn.metrics import accuracy_score, classification_report
+    from FishDataset import ShardedDataset
+    from ModelSelectionFinal import group_split
+
+    dataset = ShardedDataset(data_dir)
+    _, test_idx = group_split(dataset.labels, dataset.groups)
+    y_true = dataset.labels[test_idx]
+    single = random_batch(1)
+
+    results = {}
+    reference = None
+    for path in model_paths:
+        backend = load_backend(path, num_threads=threads)
+        preds = []
+        for start in range(0, len(test_idx), batch_size):
+            x, _ = dataset.batch(test_idx[start:start + batch_size])
+            preds.append(np.argmax(backend.predict(x), axis=1))
+        y_pred = np.concatenate(preds)
+
+        stats = time_calls(lambda: backend.predict(single), iterations)
+        stats['accuracy'] = float(accuracy_score(y_true, y_pred))
+        stats['size_mb'] = os.path.getsize(path) / 1e6 if os.path.isfile(path) else None
+        stats['report'] = classification_report(y_true, y_pred, output_dict=True, zero_division=0)
+
+        # The first backend is the reference the others must stay close to
+        if reference is None:
+            reference = (stats['accuracy'], y_pred)
+        stats['accuracy_delta'] = stats['accuracy'] - reference[0]
+        stats['agreement'] = float(np.mean(y_pred == reference[1]))
+        stats['within_tolerance'] = bool(stats['accuracy_delta'] >= -tolerance)
+        results[path] = stats
+
+        print(f"\n Classification Report ({path}):")
+        print(classification_report(y_true, y_pred, zero_division=0))
+
+    print_table(f"Single-image latency over {iterations} calls", results)
+    print(f"\n {'model':<32}{'accuracy':>10}{'delta':>10}{'agree':>10}{'size MB':>10}  ok")
+    for path, stats in results.items():
+        size = f"{stats['size_mb']:.1f}" if stats['size_mb'] is not None else '-'
+        print(f" {os.path.basename(path):<32}{stats['accuracy']:>10.4f}{stats['accuracy_delta']:>+10.4f}"
+              f"{stats['agreement']:>10.4f}{size:>10}  {'yes' if stats['within_tolerance'] else 'NO'}")
+    return results
+
+
+# --- Offline suite: synthetic images and a randomly initialized MobileNetV2 ---
+def synthetic_image(rng, size=(1280, 960)):
+    # Smooth colour gradient plus noise: compresses like a photo, unlike pure noise
+    w, h = size
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    base = rng.uniform(0, 255, size=3)
+    slope = rng.uniform(-0.1, 0.1, size=(2, 3))
+    img = base + x[..., None] * slope[0] + y[..., None] * slope[1] + rng.normal(0, 12, size=(h, w, 3))
+    return Image.fromarray(np.clip(img, 0, 255).astype(np.uint8))
+
+
+def make_synthetic_source(root, num_images=200, num_classes=5, size=(1280, 960), seed=90):
+    rng = np.random.default_rng(seed)
+    for i in range(num_images):
+        folder = os.path.join(root, f'class_{i % num_classes}')
+        os.makedirs(folder, exist_ok=True)
+        synthetic_image(rng, size).save(os.path.join(folder, f'fish_{i:05d}.jpg'), quality=90)
+    return root
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def bench_preprocessing(work_dir, num_images=200, workers=None, size=(1280, 960)):
+    from Preprocessing import run_preprocessing, num_workers
+    source = make_synthetic_source(os.path.join(work_dir, 'source'), num_images, size=size)
+    workers = workers or num_workers
+    stats = run_preprocessing(source, os.path.join(work_dir, 'extracted'), os.path.join(work_dir, 'normalized'), workers)
+    return {'images': stats['images'], 'workers': workers, 'seconds': stats['seconds'],
+            'images_per_sec': stats['images_per_sec']}
+
+
+def bench_training(data_dir, steps=20, batch_size=32, warmup_steps=2, jit_compile=False):
+    from FishDataset import ShardedDataset
+    from InputPipeline import make_dataset
+    from ModelSelectionFinal import build_mobilenet_model
+
+    dataset = ShardedDataset(data_dir)
+    model = build_mobilenet_model(num_classes=dataset.num_classes, weights=None, jit_compile=jit_compile)
+    train_ds = make_dataset(dataset, np.arange(len(dataset)), batch_size=batch_size, training=True, augment=True)
+    train_ds = train_ds.repeat()
+
+    # Same setup as ModelSelectionFinal: frozen backbone, augmented streaming input
+    model.fit(train_ds, epochs=1, steps_per_epoch=warmup_steps, verbose=0)
+    start = time.perf_counter()
+    model.fit(train_ds, epochs=1, steps_per_epoch=steps, verbose=0)
+    elapsed = time.perf_counter() - start
+    return {'steps': steps, 'batch_size': batch_size, 'seconds': elapsed, 'steps_per_sec': steps / elapsed,
+            'images_per_sec': steps * batch_size / elapsed, 'peak_rss_mb': peak_rss_mb()}
+
+
+def train_worker(data_dir, steps=20, batch_size=32):
+    # Runs in a fresh process, so peak_rss_mb is the training's own peak and not the whole suite's
+    from ModelSelectionFinal import set_seeds
+    set_seeds(90)
+    print('TRAIN_RESULT ' + json.dumps(bench_training(data_dir, steps, batch_size)))
+
+
+def run_training(data_dir, steps=20, batch_size=32):
+    command = [sys.executable, os.path.abspath(__file__), 'train-worker', data_dir,
+               '--train-steps', str(steps), '--batch-size', str(batch_size)]
+    run = subprocess.run(command, capture_output=True, text=True)
+    lines = [l for l in run.stdout.splitlines() if l.startswith('TRAIN_RESULT ')]
+    if run.returncode != 0 or not lines:
+        raise RuntimeError(f"training benchmark failed: "
+                           f"{run.stderr.strip().splitlines()[-1] if run.stderr.strip() else run.returncode}")
+    return json.loads(lines[-1][len('TRAIN_RESULT '):])
+
+
+def bench_inference(model_path, batch_sizes=(1, 4, 16, 32), iterations=50, image_size=(1280, 960), jit_compile=False):
+    backend = load_backend(model_path, jit_compile=jit_compile)
+    results = {}
+    for batch_size in batch_sizes:
+        batch = random_batch(batch_size)
+        stats = time_calls(lambda: backend.predict(batch), iterations, warmup=3)
+        stats['images_per_sec'] = batch_size * 1000.0 / stats['mean_ms']
+        results[f'batch_{batch_size}'] = stats
+
+    # One camera-sized JPEG: decode/EXIF/RGB/resize/normalize + predict (check_fish without cache or UI)
+    data = camera_jpeg(np.random.default_rng(90), image_size)
+    results['decode+predict'] = time_calls(lambda: backend.predict(pixels_to_batch(image_to_pixels(data))),
+                                           iterations, warmup=3)
+    print_table(f"Inference latency ({os.path.basename(model_path)})", results)
+    return results
+
+
+# --- Shared decode path (ImagePrep): reduced-resolution decode speedup ---
+def camera_jpeg(rng, size=(4032, 3024), orientation=1):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    synthetic_image(rng, size).save(buffer, format='JPEG', quality=92, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def full_decode_pixels(data):
+    # The previous serving path: full-resolution decode, then EXIF rotation, RGB and resize
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    return np.asarray(img.convert('RGB').resize(IMAGE_SIZE, RESIZE_FILTER))
+
+
+def bench_decode(num_images=4, size=(4032, 3024), iterations=20):
+    rng = np.random.default_rng(90)
+    images = [camera_jpeg(rng, size, orientation) for orientation in (1, 3, 6, 8)[:num_images]]
+
+    def cycle(fn):
+        state = {'i': 0}
+
+        def call():
+            fn(images[state['i'] % len(images)])
+            state['i'] += 1
+        return call
+
+    results = {
+        'full_decode': time_calls(cycle(full_decode_pixels), iterations, warmup=2),
+        'draft_decode': time_calls(cycle(image_to_pixels), iterations, warmup=2)
+    }
+    diff = np.mean([np.abs(full_decode_pixels(d).astype(np.int16) - image_to_pixels(d)).mean() for d in images])
+    results['speedup'] = results['full_decode']['mean_ms'] / results['draft_decode']['mean_ms']
+    results['mean_abs_pixel_diff'] = float(diff)
+    print_table(f"Decode to {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]} from {size[0]}x{size[1]} JPEG", {
+        k: v for k, v in results.items() if isinstance(v, dict)})
+    print(f" Speedup: {results['speedup']:.1f}x, mean |pixel difference| vs full decode: {diff:.2f}")
+    return results
+
+
+def run_prep(size=(4032, 3024), iterations=20):
+    # Bit-identical train/serve pixels are checked by tests/test_image_prep.py
+    return {'decode': bench_decode(size=size, iterations=iterations)}
+
+
+def run_suite(num_images=200, workers=None, train_steps=20, batch_size=32, batch_sizes=(1, 4, 16, 32),
+              iterations=50, keep=None):
+    import tensorflow as tf
+    from ModelSelectionFinal import build_mobilenet_model, set_seeds
+
+    set_seeds(90)
+    work_dir = keep or tempfile.mkdtemp(prefix='finscan_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        results = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'tensorflow': tf.__version__,
+                'cpu_count': os.cpu_count(),
+                'num_images': num_images
+            }
+        }
+        results['preprocessing'] = bench_preprocessing(work_dir, num_images, workers)
+        results['decode'] = bench_decode(iterations=iterations // 2 or 1)
+        results['training'] = run_training(os.path.join(work_dir, 'normalized'), train_steps, batch_size)
+
+        model_path = os.path.join(work_dir, 'random_mobilenetv2.keras')
+        build_mobilenet_model(weights=None).save(model_path)
+        results['inference'] = bench_inference(model_path, batch_sizes, iterations)
+    finally:
+        if keep is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n Preprocessing: {results['preprocessing']['images_per_sec']:.1f} images/sec")
+    print(f" Training: {results['training']['steps_per_sec']:.2f} steps/sec, "
+          f"peak RSS {results['training']['peak_rss_mb'] or 0:.0f} MB")
+    return results
+
+
+# --- CPU execution modes (PerfConfig): each mode runs in a fresh process, since oneDNN
+# and thread pools are fixed once TensorFlow starts ---
+def perf_modes(cpus=None):
+    cpus = cpus or os.cpu_count() or 1
+    return {
+        'default': {},
+        'xla': {'FINSCAN_XLA': '1'},
+        'onednn_off': {'FINSCAN_ONEDNN': '0'},
+        'onednn_on': {'FINSCAN_ONEDNN': '1'},
+        'threads_1': {'FINSCAN_INTRA_THREADS': '1', 'FINSCAN_INTER_THREADS': '1'},
+        f'threads_{cpus}': {'FINSCAN_INTRA_THREADS': str(cpus), 'FINSCAN_INTER_THREADS': '2'},
+        'deterministic': {'FINSCAN_DETERMINISTIC': '1'}
+    }
+
+
+def perf_worker(work_dir, train_steps=10, batch_size=32, batch_sizes=(1, 16), iterations=30):
+    # Runs inside one mode's process: configuration comes from the FINSCAN_* environment
+    from PerfConfig import perf_config, apply_perf_config
+    config = apply_perf_config(perf_config())
+    from ModelSelectionFinal import set_seeds
+
+    # Deterministic mode refuses unseeded random ops (Dropout, augmentation)
+    set_seeds(90)
+    results = {
+        'training': bench_training(os.path.join(work_dir, 'normalized'), train_steps, batch_size,
+                                   jit_compile=config['xla']),
+        'inference': bench_inference(os.path.join(work_dir, 'random_mobilenetv2.keras'), batch_sizes, iterations,
+                                     jit_compile=config['xla'])
+    }
+    print('PERF_RESULT ' + json.dumps(results))
+
+
+def run_perf(modes=None, num_images=64, train_steps=10, batch_size=32, batch_sizes=(1, 16), iterations=30, keep=None):
+    from ModelSelectionFinal import build_mobilenet_model, set_seeds
+
+    all_modes = perf_modes()
+    modes = modes or list(all_modes)
+    work_dir = keep or tempfile.mkdtemp(prefix='finscan_perf_')
+    os.makedirs(work_dir, exist_ok=True)
+    results = {'meta': {'platform': platform.platform(), 'cpu_count': os.cpu_count()}, 'modes': {}}
+    try:
+        set_seeds(90)
+        bench_preprocessing(work_dir, num_images)
+        build_mobilenet_model(weights=None).save(os.path.join(work_dir, 'random_mobilenetv2.keras'))
+
+        for name in modes:
+            env = {k: v for k, v in os.environ.items() if not k.startswith('FINSCAN_')}
+            env.update(all_modes[name])
+            command = [sys.executable, os.path.abspath(__file__), 'perf-worker', work_dir,
+                       '--train-steps', str(train_steps), '--batch-size', str(batch_size),
+                       '--iterations', str(iterations), '--batch-sizes', *map(str, batch_sizes)]
+            print(f"\n Mode {name}: {all_modes[name] or 'TensorFlow defaults'}")
+            run = subprocess.run(command, env=env, capture_output=True, text=True)
+            lines = [l for l in run.stdout.splitlines() if l.startswith('PERF_RESULT ')]
+            if run.returncode != 0 or not lines:
+                # A mode can be unsupported on this machine (e.g. no XLA CPU backend); report and go on
+                print(f" Mode {name} failed: {run.stderr.strip().splitlines()[-1] if run.stderr.strip() else run.returncode}")
+                continue
+            results['modes'][name] = json.loads(lines[-1][len('PERF_RESULT '):])
+    finally:
+        if keep is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    reference = results['modes'].get('default')
+    single, largest = f'batch_{batch_sizes[0]}', f'batch_{batch_sizes[-1]}'
+    print(f"\n {'mode':<16}{'train steps/s':>14}{'speedup':>9}{single + ' p50 ms':>16}{'speedup':>9}"
+          f"{largest + ' img/s':>16}{'speedup':>9}")
+    for name, r in results['modes'].items():
+        train = r['training']['steps_per_sec']
+        p50 = r['inference'][single]['p50_ms']
+        throughput = r['inference'][largest]['images_per_sec']
+        if reference:
+            r['speedup'] = {
+                'training': train / reference['training']['steps_per_sec'],
+                'inference_latency': reference['inference'][single]['p50_ms'] / p50,
+                'inference_throughput': throughput / reference['inference'][largest]['images_per_sec']
+            }
+        s = r.get('speedup', {'training': 1.0, 'inference_latency': 1.0, 'inference_throughput': 1.0})
+        print(f" {name:<16}{train:>14.2f}{s['training']:>8.2f}x{p50:>16.2f}{s['inference_latency']:>8.2f}x"
+              f"{throughput:>16.1f}{s['inference_throughput']:>8.2f}x")
+    return results
+
+
+# --- Cold start: fresh process -> first prediction, for each serving artifact ---
+def coldstart_worker(model_path, compile_model=False):
+    # Runs in a fresh process that has not imported TensorFlow yet (FishInference defers it)
+    start = time.perf_counter()
+    import tensorflow
+    tf_imported = time.perf_counter()
+    if compile_model:
+        # The old app path: full Keras file including optimizer state
+        predict = compile_predict(load_model(model_path, compile=True))
+    else:
+        predict = load_backend(model_path).predict
+    loaded = time.perf_counter()
+    predict(random_batch(1))
+    done = time.perf_counter()
+    print('COLDSTART_RESULT ' + json.dumps({
+        'tf_import_ms': (tf_imported - start) * 1000.0,
+        'load_ms': (loaded - tf_imported) * 1000.0,
+        'first_predict_ms': (done - loaded) * 1000.0,
+        'ready_ms': (done - start) * 1000.0
+    }))
+
+
+def run_coldstart(model_path=MODEL_PATH, repeats=3, keep=None):
+    from TFLiteExport import export_savedmodel, export_tflite
+
+    work_dir = keep or tempfile.mkdtemp(prefix='finscan_coldstart_')
+    os.makedirs(work_dir, exist_ok=True)
+    results = {'meta': {'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'model': model_path,
+                        'repeats': repeats}, 'artifacts': {}}
+    try:
+        model = load_model(model_path, compile=False)
+        savedmodel = export_savedmodel(model, os.path.join(work_dir, 'MobileNetV2_savedmodel'))
+        tflite = export_tflite(model, work_dir)['float16']
+        artifacts = {
+            'keras_compiled': (model_path, True),
+            'keras': (model_path, False),
+            'savedmodel': (savedmodel, False),
+            'tflite_float16': (tflite, False)
+        }
+
+        for name, (path, compiled) in artifacts.items():
+            command = [sys.executable, os.path.abspath(__file__), 'coldstart-worker', os.path.abspath(path)]
+            if compiled:
+                command.append('--compile')
+            runs = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                run = subprocess.run(command, capture_output=True, text=True)
+                lines = [l for l in run.stdout.splitlines() if l.startswith('COLDSTART_RESULT ')]
+                if run.returncode != 0 or not lines:
+                    print(f" {name} failed: {run.stderr.strip().splitlines()[-1] if run.stderr.strip() else run.returncode}")
+                    break
+                result = json.loads(lines[-1][len('COLDSTART_RESULT '):])
+                # Includes interpreter start-up, which the in-process timings cannot see
+                result['process_ms'] = (time.perf_counter() - start) * 1000.0
+                runs.append(result)
+            if runs:
+                results['artifacts'][name] = {key: float(np.median([r[key] for r in runs])) for key in runs[0]}
+    finally:
+        if keep is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n Cold start, median of {repeats} fresh processes")
+    print(f" {'artifact':<18}{'tf import':>12}{'load':>10}{'1st pred':>10}{'ready':>10}{'process':>10}")
+    for name, r in results['artifacts'].items():
+        print(f" {name:<18}{r['tf_import_ms']:>10.0f}ms{r['load_ms']:>8.0f}ms"
+              f"{r['first_predict_ms']:>8.0f}ms{r['ready_ms']:>8.0f}ms{r['process_ms']:>8.0f}ms")
+    return results
+
+
+# --- Regression check against a saved baseline ---
+# Metrics ending in _per_sec are better when higher; _ms and _mb when lower.
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare_results(current, baseline, tolerance=0.10):
+    current, baseline = flatten(current), flatten(baseline)
+    regressions = []
+    print(f"\n {'metric':<44}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name in sorted(set(current) & set(baseline)):
+        if name.endswith('_per_sec'):
+            higher_is_better = True
+        elif name.endswith(('_ms', '_mb')):
+            higher_is_better = False
+        else:
+            continue
+        old, new = baseline[name], current[name]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f" {name:<44}{old:>12.2f}{new:>12.2f}{change:>+10.1%}{'  REGRESSION' if regressed else ''}")
+
+    print(f"\n {len(regressions)} regression(s) beyond {tolerance:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FinScan performance benchmarks.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('predict', help="Compare Model.predict with the compiled predict path.")
+    p.add_argument('--model', default=MODEL_PATH)
+    p.add_argument('--iterations', type=int, default=200)
+    p.add_argument('--warmup', type=int, default=10)
+    p.add_argument('--output', default=None, help="Write results as JSON to this path.")
+
+    p = sub.add_parser('backends', help="Accuracy vs latency report for .keras / .tflite models.")
+    p.add_argument('models', nargs='+', help="Model files; the first one is the accuracy reference.")
+    p.add_argument('--data', default=os.path.join('ML', 'normalized_images'))
+    p.add_argument('--threads', type=int, default=None)
+    p.add_argument('--iterations', type=int, default=100)
+    p.add_argument('--tolerance', type=float, default=0.01, help="Allowed accuracy drop vs the reference.")
+    p.add_argument('--output', default=None, help="Write results as JSON to this path.")
+
+    p = sub.add_parser('suite', help="Offline preprocessing / training / inference benchmarks on synthetic data.")
+    p.add_argument('--images', type=int, default=200)
+    p.add_argument('--workers', type=int, default=None)
+    p.add_argument('--train-steps', type=int, default=20)
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16, 32])
+    p.add_argument('--iterations', type=int, default=50)
+    p.add_argument('--keep', default=None, help="Keep synthetic data and outputs in this directory.")
+    p.add_argument('--output', default='benchmark.json', help="Write results as JSON to this path.")
+    p.add_argument('--baseline', default=None, help="Compare against this saved results file.")
+    p.add_argument('--tolerance', type=float, default=0.10)
+
+    p = sub.add_parser('train-worker', help="Internal: the 'suite' training measurement in its own process.")
+    p.add_argument('data_dir')
+    p.add_argument('--train-steps', type=int, default=20)
+    p.add_argument('--batch-size', type=int, default=32)
+
+    p = sub.add_parser('prep', help="Reduced-resolution decode speedup on camera-sized photos.")
+    p.add_argument('--size', type=int, nargs=2, default=[4032, 3024], help="Camera image size for the decode benchmark.")
+    p.add_argument('--iterations', type=int, default=20)
+    p.add_argument('--output', default=None, help="Write results as JSON to this path.")
+
+    p = sub.add_parser('perf', help="Training/inference speed under each CPU execution mode (threads, XLA, oneDNN).")
+    p.add_argument('--modes', nargs='+', default=None, help=f"Subset of: {' '.join(perf_modes())}")
+    p.add_argument('--images', type=int, default=64)
+    p.add_argument('--train-steps', type=int, default=10)
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    p.add_argument('--iterations', type=int, default=30)
+    p.add_argument('--keep', default=None, help="Keep synthetic data and outputs in this directory.")
+    p.add_argument('--output', default=None, help="Write results as JSON to this path.")
+
+    p = sub.add_parser('perf-worker', help="Internal: one mode of 'perf', configured from FINSCAN_* variables.")
+    p.add_argument('work_dir')
+    p.add_argument('--train-steps', type=int, default=10)
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    p.add_argument('--iterations', type=int, default=30)
+
+    p = sub.add_parser('coldstart', help="Fresh-process time to first prediction for .keras, SavedModel and TFLite.")
+    p.add_argument('--model', default=MODEL_PATH)
+    p.add_argument('--repeats', type=int, default=3)
+    p.add_argument('--keep', default=None, help="Keep the exported artifacts in this directory.")
+    p.add_argument('--output', default=None, help="Write results as JSON to this path.")
+
+    p = sub.add_parser('coldstart-worker', help="Internal: one fresh-process measurement for 'coldstart'.")
+    p.add_argument('model')
+    p.add_argument('--compile', action='store_true', help="Load the .keras file with its optimizer state.")
+
+    p = sub.add_parser('compare', help="Flag regressions of one results file against a baseline.")
+    p.add_argument('current')
+    p.add_argument('baseline')
+    p.add_argument('--tolerance', type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        with open(args.current, encoding='utf-8') as f:
+            current = json.load(f)
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare_results(current, baseline, args.tolerance) else 0)
+
+    if args.command == 'coldstart-worker':
+        coldstart_worker(args.model, args.compile)
+        return
+
+    if args.command == 'train-worker':
+        train_worker(args.data_dir, args.train_steps, args.batch_size)
+        return
+
+    if args.command == 'perf-worker':
+        perf_worker(args.work_dir, args.train_steps, args.batch_size, tuple(args.batch_sizes), args.iterations)
+        return
+
+    if args.command == 'predict':
+        results = bench_predict(args.model, args.iterations, args.warmup)
+    elif args.command == 'backends':
+        results = bench_backends(args.models, args.data, args.threads, args.iterations, args.tolerance)
+    elif args.command == 'suite':
+        results = run_suite(args.images, args.workers, args.train_steps, args.batch_size, args.batch_sizes,
+                            args.iterations, args.keep)
+    elif args.command == 'perf':
+        results = run_perf(args.modes, args.images, args.train_steps, args.batch_size, tuple(args.batch_sizes),
+                           args.iterations, args.keep)
+    elif args.command == 'coldstart':
+        results = run_coldstart(args.model, args.repeats, args.keep)
+    elif args.command == 'prep':
+        results = run_prep(tuple(args.size), args.iterations)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n Results saved to: {args.output}")
+
+    if getattr(args, 'baseline', None):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare_results(results, baseline, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
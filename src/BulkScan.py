@@ -0,0 +1,170 @@
+import os
+import csv
+import json
+import time
+import argparse
+import collections
+import numpy as np
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from FishInference import MODEL_PATH, CONFIDENCE_THRESHOLD, labels_list, image_to_pixels, pixels_to_batch, load_backend
+from Preprocessing import image_extensions
+
+UNABLE = "Unable to detect"
+
+
+# --- Stream image paths from a directory tree (sorted, so reruns see the same order) ---
+def iter_images(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(image_extensions):
+                yield os.path.join(dirpath, name)
+
+
+def decode(path):
+    try:
+        with Image.open(path) as img:
+            return path, image_to_pixels(img), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+# --- Decode on a thread pool with a bounded number of images in flight ---
+def iter_decoded(paths, threads, max_in_flight):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = collections.deque()
+        for path in paths:
+            pending.append(executor.submit(decode, path))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# --- Incremental CSV / JSONL output ---
+class ResultWriter:
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = path.lower().endswith(('.jsonl', '.json'))
+        self.fields = ['path', 'result', 'label', 'confidence', 'status', 'error'] + \
+                      [f'prob_{i}' for i in range(len(labels_list))]
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', encoding='utf-8', newline='')
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.file, fieldnames=self.fields)
+            if is_new:
+                self.writer.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.jsonl:
+                self.file.write(json.dumps(row) + '\n')
+            else:
+                self.writer.writerow({k: row.get(k, '') for k in self.fields})
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def completed_paths(path):
+    # Paths already in the output file are skipped on resume
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.lower().endswith(('.jsonl', '.json')):
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        done.add(json.loads(line)['path'])
+                    except (ValueError, KeyError):
+                        continue
+        else:
+            for row in csv.DictReader(f):
+                done.add(row['path'])
+    return done
+
+
+def result_rows(paths, preds, threshold):
+    rows = []
+    for path, pred in zip(paths, preds):
+        idx = int(np.argmax(pred))
+        prob = float(pred[idx])
+        ok = prob >= threshold
+        rows.append({
+            'path': path,
+            'result': labels_list[idx] if ok else UNABLE,
+            'label': labels_list[idx],
+            'confidence': round(prob, 6),
+            'status': 'ok' if ok else 'low_confidence',
+            'error': '',
+            **{f'prob_{i}': round(float(p), 6) for i, p in enumerate(pred)}
+        })
+    return rows
+
+
+def bulk_scan(root, output, model_path=MODEL_PATH, batch_size=32, decode_threads=4, threads=None,
+              threshold=CONFIDENCE_THRESHOLD, resume=True, report_every=10):
+    backend = load_backend(model_path, num_threads=threads)
+    done = completed_paths(output) if resume else set()
+    if done:
+        print(f" Resuming: {len(done)} images already in {output}")
+    elif os.path.exists(output):
+        os.remove(output)
+
+    paths = (p for p in iter_images(root) if p not in done)
+    writer = ResultWriter(output)
+    batch_paths, batch_pixels = [], []
+    scanned = errors = batches = 0
+    start = time.perf_counter()
+
+    def flush():
+        nonlocal scanned, batches
+        preds = backend.predict(pixels_to_batch(np.stack(batch_pixels)))
+        writer.write(result_rows(batch_paths, preds, threshold))
+        scanned += len(batch_paths)
+        batches += 1
+        batch_paths.clear()
+        batch_pixels.clear()
+        if batches % report_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f" {scanned} images scanned, {scanned / elapsed:.1f} images/sec")
+
+    try:
+        for path, pixels, error in iter_decoded(paths, decode_threads, max_in_flight=2 * batch_size):
+            if error is not None:
+                errors += 1
+                writer.write([{'path': path, 'result': UNABLE, 'status': 'error', 'error': error}])
+                continue
+            batch_paths.append(path)
+            batch_pixels.append(pixels)
+            if len(batch_paths) >= batch_size:
+                flush()
+        if batch_paths:
+            flush()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    rate = scanned / elapsed if elapsed > 0 else 0.0
+    print(f"\n DONE: {scanned} images scanned, {errors} unreadable, results in: {output}")
+    print(f" Throughput: {rate:.1f} images/sec (batch size {batch_size}, {decode_threads} decode threads)")
+    return {'scanned': scanned, 'errors': errors, 'seconds': elapsed, 'images_per_sec': rate}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify every fish image under a directory.")
+    parser.add_argument('root', help="Directory tree of images to scan.")
+    parser.add_argument('--output', default='scan_results.csv', help="A .csv or .jsonl results file.")
+    parser.add_argument('--model', default=MODEL_PATH, help="A .keras model or a .tflite export.")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--decode-threads', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=None, help="TFLite interpreter threads.")
+    parser.add_argument('--threshold', type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument('--no-resume', action='store_true', help="Start over instead of skipping scanned images.")
+    args = parser.parse_args()
+    bulk_scan(args.root, args.output, args.model, args.batch_size, args.decode_threads, args.threads,
+              args.threshold, not args.no_resume)
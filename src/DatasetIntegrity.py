@@ -0,0 +1,252 @@
+import os
+import io
+import csv
+import time
+import hashlib
+import argparse
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from ImagePrep import IMAGE_SIZE, request_draft, orient
+
+# --- SETTINGS ---
+image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
+num_workers = os.cpu_count() or 1
+
+# dHash: 8x8 brightness gradients = 64 bits; images within MAX_DISTANCE bits count as near-duplicates.
+# Groups for the train/test split use the tighter GROUP_DISTANCE: grouping is transitive, so a loose
+# distance chains merely similar photos into a few huge groups.
+HASH_SIZE = 8
+MAX_DISTANCE = 4
+GROUP_DISTANCE = 2
+
+report_columns = ['path', 'folder', 'bytes', 'sha256', 'format', 'width', 'height', 'mode', 'dhash', 'error',
+                  'group', 'group_size']
+
+
+# --- Perceptual hash ---
+def dhash(img):
+    # Left/right brightness differences on a 9x8 grayscale thumbnail; robust to re-encoding and resizing
+    gray = np.asarray(img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def hamming(a, b):
+    # Bit distance between uint64 hashes (broadcasts like ^)
+    x = np.ascontiguousarray(np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64)))
+    return _POPCOUNT[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.int64)
+
+
+# --- Near-duplicate index: banded LSH over the 64-bit hashes ---
+# The hash is cut into max_distance + 1 bands. Two hashes at most max_distance bits apart
+# agree exactly on at least one band, so only images sharing a band value are compared.
+# Each band is a sorted array, so lookups are binary searches and nothing is quadratic in N.
+class HashIndex:
+    def __init__(self, hashes, max_distance=MAX_DISTANCE):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.max_distance = max_distance
+        edges = np.linspace(0, HASH_SIZE * HASH_SIZE, max_distance + 2).astype(int)
+        self.bands = []
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            keys = self._band(self.hashes, lo, hi)
+            order = np.argsort(keys, kind='stable')
+            self.bands.append((lo, hi, order, keys[order]))
+
+    @staticmethod
+    def _band(hashes, lo, hi):
+        return (hashes >> np.uint64(lo)) & np.uint64((1 << (hi - lo)) - 1)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def neighbors(self, h, max_distance=None):
+        # (indices, distances) of every indexed hash within max_distance of h, nearest first
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        h = np.uint64(h)
+        candidates = []
+        for lo, hi, order, sorted_keys in self.bands:
+            key = self._band(h, lo, hi)
+            start, end = np.searchsorted(sorted_keys, key, 'left'), np.searchsorted(sorted_keys, key, 'right')
+            candidates.append(order[start:end])
+        candidates = np.unique(np.concatenate(candidates))
+        distances = hamming(self.hashes[candidates], h)
+        keep = distances <= max_distance
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return candidates[order], distances[order]
+
+    def pairs(self, block=1 << 22):
+        # Every (i, j), i < j, within max_distance; big buckets are compared in row blocks to bound memory
+        found = []
+        for _, _, order, sorted_keys in self.bands:
+            bounds = np.flatnonzero(np.diff(sorted_keys)) + 1
+            for bucket in np.split(order, bounds):
+                if len(bucket) < 2:
+                    continue
+                bucket = np.sort(bucket)
+                step = max(1, block // len(bucket))
+                for start in range(0, len(bucket), step):
+                    rows = bucket[start:start + step]
+                    distances = hamming(self.hashes[rows][:, None], self.hashes[bucket][None, :])
+                    i, j = np.nonzero((distances <= self.max_distance) & (rows[:, None] < bucket[None, :]))
+                    if len(i):
+                        found.append(np.stack([rows[i], bucket[j]], axis=1))
+        if not found:
+            return np.empty((0, 2), dtype=np.int64)
+        return np.unique(np.concatenate(found), axis=0)
+
+
+# --- Duplicate groups: exact copies (same sha256) and near-duplicates share one group id ---
+def duplicate_groups(hashes, sha256=None, max_distance=GROUP_DISTANCE):
+    parent = np.arange(len(hashes))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    if sha256 is not None:
+        first = {}
+        for i, digest in enumerate(sha256):
+            union(i, first.setdefault(digest, i))
+    for i, j in HashIndex(hashes, max_distance).pairs():
+        union(i, j)
+
+    # Renumber roots 0..G-1 in order of first appearance
+    _, groups = np.unique([find(i) for i in range(len(hashes))], return_inverse=True)
+    return groups.astype(np.int64)
+
+
+def representatives(groups):
+    # First image of every group: the de-duplicated subset
+    _, first = np.unique(groups, return_index=True)
+    return np.sort(first)
+
+
+# --- Worker: full decode verification, dimensions, format and hashes of one file ---
+def scan_file(path):
+    row = {'path': path, 'bytes': None, 'sha256': None, 'format': None, 'width': None, 'height': None,
+           'mode': None, 'dhash': None, 'error': None}
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        row['bytes'] = len(data)
+        row['sha256'] = hashlib.sha256(data).hexdigest()
+
+        with Image.open(io.BytesIO(data)) as img:
+            row.update(format=img.format, width=img.width, height=img.height, mode=img.mode)
+            # Image.open only reads the header; truncated or corrupt pixel data fails here.
+            # Same decode as Preprocessing.process_image, so both hash the same pixels
+            request_draft(img, IMAGE_SIZE)
+            img.load()
+            row['dhash'] = f'{dhash(orient(img)):016x}'
+    except Exception as e:
+        row['error'] = str(e) or type(e).__name__
+    return row
+
+
+def collect_files(source_base):
+    files = []
+    for root, _, names in os.walk(source_base):
+        for name in names:
+            if name.lower().endswith(image_extensions):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def write_report(path, rows):
+    with open(path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=report_columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(path + '.tmp', path)
+
+
+def load_report(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+# --- Scan a source tree (one sub-folder per class) ---
+def scan_dataset(source_base, output='integrity.csv', workers=num_workers, max_distance=GROUP_DISTANCE):
+    start = time.perf_counter()
+    files = collect_files(source_base)
+    print(f" Scanning {len(files)} images with {workers} workers...")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for done, row in enumerate(executor.map(scan_file, files, chunksize=64), start=1):
+            row['folder'] = os.path.relpath(os.path.dirname(row['path']), source_base)
+            row['path'] = os.path.relpath(row['path'], source_base)
+            rows.append(row)
+            if done % 10000 == 0:
+                print(f" [{done}/{len(files)}] {done / (time.perf_counter() - start):.0f} images/s")
+
+    valid = [row for row in rows if row['error'] is None]
+    groups = duplicate_groups([int(row['dhash'], 16) for row in valid], [row['sha256'] for row in valid],
+                              max_distance)
+    sizes = np.bincount(groups) if len(groups) else np.empty(0, dtype=np.int64)
+    for row, group in zip(valid, groups):
+        row['group'] = int(group)
+        row['group_size'] = int(sizes[group])
+    write_report(output, rows)
+
+    # Summary: corrupt files, exact copies, near-duplicate groups and groups that span classes
+    corrupt = [row for row in rows if row['error'] is not None]
+    exact = len(valid) - len({row['sha256'] for row in valid})
+    duplicated = [g for g in range(len(sizes)) if sizes[g] > 1]
+    folders = {}
+    for row in valid:
+        folders.setdefault(row['group'], set()).add(row['folder'])
+    conflicts = [g for g in duplicated if len(folders[g]) > 1]
+    elapsed = time.perf_counter() - start
+
+    for row in corrupt[:20]:
+        print(f" Corrupt: {row['path']} | Reason: {row['error']}")
+    print(f"\n DONE: {len(rows)} images in {elapsed:.1f}s ({len(rows) / elapsed if elapsed > 0 else 0.0:.0f}/s)")
+    print(f" {len(corrupt)} corrupt, {exact} exact copies, {len(duplicated)} duplicate groups covering "
+          f"{int(sizes[duplicated].sum()) if duplicated else 0} images, {len(conflicts)} groups spanning classes")
+    print(f" {len(sizes)} distinct images after collapsing duplicates, largest group {int(sizes.max()) if len(sizes) else 0}")
+    print(f" Report saved to: {output}")
+    return rows
+
+
+# --- Look up near-duplicates of one image in a saved report ---
+def query_report(report, image_path, max_distance=MAX_DISTANCE, top=20):
+    rows = [row for row in load_report(report) if row['dhash']]
+    index = HashIndex([int(row['dhash'], 16) for row in rows], max_distance)
+    with Image.open(image_path) as img:
+        h = dhash(orient(img))
+    matches, distances = index.neighbors(h)
+    print(f" {len(matches)} images within {max_distance} bits of {image_path}")
+    for i, distance in zip(matches[:top], distances[:top]):
+        print(f" {distance:>3}  {rows[i]['path']}")
+    return [(rows[i]['path'], int(distance)) for i, distance in zip(matches, distances)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-decode integrity scan and near-duplicate index of an image tree.")
+    parser.add_argument('source', nargs='?', default=None, help="Folder with one sub-folder per class.")
+    parser.add_argument('--output', default='integrity.csv')
+    parser.add_argument('--workers', type=int, default=num_workers)
+    parser.add_argument('--max-distance', type=int, default=None,
+                        help=f"dHash bit distance still counted as a near-duplicate (default {GROUP_DISTANCE} for "
+                             f"the report's groups, {MAX_DISTANCE} for --query).")
+    parser.add_argument('--query', default=None, help="Only list near-duplicates of this image in an existing report.")
+    args = parser.parse_args()
+
+    if args.query:
+        query_report(args.output, args.query, args.max_distance if args.max_distance is not None else MAX_DISTANCE)
+    else:
+        scan_dataset(args.source, args.output, args.workers,
+                     args.max_distance if args.max_distance is not None else GROUP_DISTANCE)
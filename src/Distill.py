@@ -0,0 +1,236 @@
+import os
+import csv
+import json
+import argparse
+import numpy as np
+from PerfConfig import preconfigure, add_perf_args, perf_config, apply_perf_config, describe
+
+# oneDNN is chosen when TensorFlow loads, so FINSCAN_ONEDNN / --onednn must be applied before this import
+preconfigure()
+import tensorflow as tf
+from tensorflow.keras import layers, models
+from tensorflow.keras.applications import MobileNetV2
+from sklearn.metrics import classification_report, accuracy_score
+from FishDataset import ShardedDataset
+from FishInference import MODEL_PATH, IMAGE_SIZE, load_model, compile_predict, random_batch, TFLiteBackend
+from InputPipeline import make_dataset
+from ModelSelectionFinal import head_layers, group_split, set_seeds, prepare_run_dir, training_callbacks
+from Timing import time_calls
+
+# === Settings ===
+data_dir = os.path.join("ML", "normalized_images")
+out_dir = "students"
+checkpoint_dir = "checkpoints"
+
+# Width multiplier @ input resolution; ImageNet weights exist for alpha 0.35/0.5/0.75/1.0 at 96-224
+default_students = ['0.75@160', '0.5@160', '0.35@128']
+
+
+def parse_student(spec):
+    alpha, resolution = spec.split('@')
+    return float(alpha), int(resolution)
+
+
+def student_name(alpha, resolution):
+    return f'MobileNetV2_a{alpha:.2f}_{resolution}'
+
+
+# === Student: smaller MobileNetV2 behind an in-graph resize ===
+# It still takes the 224x224 batches the shards, the app and every backend produce,
+# so a student is served like the teacher (FINSCAN_MODEL=students/<name>.keras).
+def build_student(alpha, resolution, num_classes=5, weights='imagenet', fine_tune=False,
+                  dense_units=128, dropout=0.3):
+    base_model = MobileNetV2(alpha=alpha, weights=weights, include_top=False, input_shape=(resolution, resolution, 3))
+    base_model.trainable = fine_tune
+    return models.Sequential([
+        layers.Input(shape=(IMAGE_SIZE[1], IMAGE_SIZE[0], 3)),
+        # Bilinear: area resizing has no TFLite kernel
+        layers.Resizing(resolution, resolution, interpolation='bilinear'),
+        base_model,
+        layers.GlobalAveragePooling2D(),
+        *head_layers(num_classes, dense_units, dropout)
+    ], name=student_name(alpha, resolution))
+
+
+# === Knowledge distillation: hard labels plus the teacher's temperature-softened outputs ===
+class Distiller(models.Model):
+    def __init__(self, student, teacher, temperature=4.0, hard_weight=0.3):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+        self.temperature = temperature
+        self.hard_weight = hard_weight
+        self.loss_tracker = tf.keras.metrics.Mean(name='loss')
+
+    @property
+    def metrics(self):
+        return [self.loss_tracker] + self.compiled_metrics.metrics
+
+    def soften(self, probs):
+        # Both models end in softmax: rescale their log-probabilities by 1/T
+        return tf.nn.softmax(tf.math.log(tf.clip_by_value(probs, 1e-7, 1.0)) / self.temperature)
+
+    def distillation_loss(self, labels, teacher_probs, student_probs):
+        hard = tf.keras.losses.categorical_crossentropy(labels, student_probs)
+        soft = tf.keras.losses.kl_divergence(self.soften(teacher_probs), self.soften(student_probs))
+        # T^2 keeps the soft term's gradients on the same scale as the hard term
+        return tf.reduce_mean(self.hard_weight * hard + (1.0 - self.hard_weight) * self.temperature ** 2 * soft)
+
+    def call(self, images, training=False):
+        return self.student(images, training=training)
+
+    def train_step(self, data):
+        images, labels = data
+        teacher_probs = self.teacher(images, training=False)
+        with tf.GradientTape() as tape:
+            student_probs = self.student(images, training=True)
+            loss = self.distillation_loss(labels, teacher_probs, student_probs)
+        gradients = tape.gradient(loss, self.student.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.student.trainable_variables))
+        self.loss_tracker.update_state(loss)
+        self.compiled_metrics.update_state(labels, student_probs)
+        return {m.name: m.result() for m in self.metrics}
+
+    def test_step(self, data):
+        images, labels = data
+        student_probs = self.student(images, training=False)
+        loss = self.distillation_loss(labels, self.teacher(images, training=False), student_probs)
+        self.loss_tracker.update_state(loss)
+        self.compiled_metrics.update_state(labels, student_probs)
+        return {m.name: m.result() for m in self.metrics}
+
+
+# === Report: per-class accuracy, size and single-image CPU latency ===
+def evaluate_model(name, model, path, test_ds, y_true, classes, iterations=100, tflite_path=None):
+    y_pred = np.argmax(model.predict(test_ds, verbose=0), axis=1)
+    report = classification_report(y_true, y_pred, labels=list(range(len(classes))), target_names=classes,
+                                   output_dict=True, zero_division=0)
+    print(f"\n Classification Report ({name}):")
+    print(classification_report(y_true, y_pred, labels=list(range(len(classes))), target_names=classes,
+                                zero_division=0))
+
+    batch = random_batch(1)
+    predict = compile_predict(model)
+    result = {
+        'name': name,
+        'params': int(model.count_params()),
+        'size_mb': os.path.getsize(path) / 1e6,
+        # The report has no 'accuracy' key when a class is missing from the split (it writes 'micro avg')
+        'accuracy': float(accuracy_score(y_true, y_pred)),
+        'per_class': {c: {k: float(report[c][k]) for k in ('precision', 'recall', 'f1-score')} for c in classes},
+        'latency': time_calls(lambda: predict(batch), iterations)
+    }
+    if tflite_path:
+        backend = TFLiteBackend(tflite_path)
+        result['tflite_size_mb'] = os.path.getsize(tflite_path) / 1e6
+        result['tflite_latency'] = time_calls(lambda: backend.predict(batch), iterations)
+    return result
+
+
+def write_report(path, results, classes):
+    with open(path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    rows = []
+    for r in results:
+        row = {'name': r['name'], 'alpha': r.get('alpha'), 'resolution': r.get('resolution'), 'params': r['params'],
+               'size_mb': round(r['size_mb'], 2), 'p50_ms': round(r['latency']['p50_ms'], 2),
+               'p95_ms': round(r['latency']['p95_ms'], 2), 'tflite_size_mb': round(r.get('tflite_size_mb', 0), 2),
+               'tflite_p50_ms': round(r.get('tflite_latency', {}).get('p50_ms', 0), 2),
+               'accuracy': round(r['accuracy'], 4)}
+        for c in classes:
+            row[f'recall[{c}]'] = round(r['per_class'][c]['recall'], 4)
+        rows.append(row)
+    with open(path + '.csv', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n {'model':<28}{'params':>10}{'MB':>8}{'p50 ms':>9}{'p95 ms':>9}{'tflite MB':>11}{'tflite ms':>11}{'acc':>8}")
+    for row in rows:
+        print(f" {row['name']:<28}{row['params']:>10}{row['size_mb']:>8.2f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+              f"{row['tflite_size_mb']:>11.2f}{row['tflite_p50_ms']:>11.2f}{row['accuracy']:>8.4f}")
+    print(f"\n Report saved to: {path}.csv / {path}.json")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distill the trained MobileNetV2 into smaller, lower-resolution students.")
+    parser.add_argument('--teacher', default=MODEL_PATH)
+    parser.add_argument('--data', default=data_dir)
+    parser.add_argument('--students', nargs='+', default=default_students, help="alpha@resolution, e.g. 0.5@160.")
+    parser.add_argument('--weights', default='imagenet', help="Student backbone weights: imagenet or none.")
+    parser.add_argument('--fine-tune', action='store_true', help="Train the student backbone too, not only its head.")
+    parser.add_argument('--epochs', type=int, default=12)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=0.001)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--hard-weight', type=float, default=0.3,
+                        help="Weight of the true-label loss; the rest goes to matching the teacher.")
+    parser.add_argument('--patience', type=int, default=3)
+    parser.add_argument('--fresh', action='store_true', help="Ignore existing checkpoints.")
+    parser.add_argument('--tflite', action='store_true', help="Also export and time a float16 TFLite per model.")
+    parser.add_argument('--iterations', type=int, default=100, help="Latency measurement calls per model.")
+    parser.add_argument('--out-dir', default=out_dir)
+    parser.add_argument('--report', default='distill_report', help="Report path prefix (.csv and .json).")
+    add_perf_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = apply_perf_config(perf_config(args))
+    print(f" CPU execution: {describe(config)}")
+    set_seeds(90)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    # === Same data and held-out split as ModelSelectionFinal ===
+    dataset = ShardedDataset(args.data)
+    train_idx, test_idx = group_split(dataset.labels, dataset.groups)
+    train_ds = make_dataset(dataset, train_idx, batch_size=args.batch_size, training=True, augment=True)
+    test_ds = make_dataset(dataset, test_idx, batch_size=args.batch_size)
+    y_true = dataset.labels[test_idx]
+
+    teacher = load_model(args.teacher, compile=False)
+    tflite = None
+    if args.tflite:
+        from TFLiteExport import export_tflite
+        tflite = export_tflite(teacher, args.out_dir, name='teacher')['float16']
+    results = [evaluate_model('teacher', teacher, args.teacher, test_ds, y_true, dataset.classes, args.iterations, tflite)]
+    results[0].update(alpha=1.0, resolution=IMAGE_SIZE[0])
+
+    weights = None if args.weights == 'none' else args.weights
+    for spec in args.students:
+        alpha, resolution = parse_student(spec)
+        name = student_name(alpha, resolution)
+        print(f"\n === Student {name} ===")
+        set_seeds(90)
+        student = build_student(alpha, resolution, dataset.num_classes, weights, args.fine_tune)
+        distiller = Distiller(student, teacher, args.temperature, args.hard_weight)
+        distiller.compile(optimizer=tf.keras.optimizers.Adam(args.learning_rate), metrics=['accuracy'],
+                          jit_compile=config['xla'])
+
+        # Resumable and early-stopped like ModelSelectionFinal
+        run_dir = os.path.join(checkpoint_dir, 'distill', name)
+        prepare_run_dir(run_dir, {
+            'student': spec, 'teacher': os.path.abspath(args.teacher), 'images': len(dataset),
+            'weights': args.weights, 'fine_tune': args.fine_tune, 'learning_rate': args.learning_rate,
+            'temperature': args.temperature, 'hard_weight': args.hard_weight, 'batch_size': args.batch_size
+        }, args.fresh)
+        distiller.fit(train_ds, epochs=args.epochs, validation_data=test_ds,
+                      callbacks=training_callbacks(run_dir, 'val_accuracy', args.patience))
+
+        path = os.path.join(args.out_dir, f'{name}.keras')
+        student.save(path)
+        tflite = None
+        if args.tflite:
+            tflite = export_tflite(student, args.out_dir, name=name)['float16']
+        result = evaluate_model(name, student, path, test_ds, y_true, dataset.classes, args.iterations, tflite)
+        result.update(alpha=alpha, resolution=resolution)
+        results.append(result)
+
+    write_report(args.report, results, dataset.classes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+from FishDataset import one_hot, save_npy_atomic, shard_name
+from InputPipeline import make_dataset
+
+# --- Cache layout (one folder per key, stale folders are pruned) ---
+#   <cache_dir>/<key>/features.npy    float32 (N, D) pooled embeddings of the clean images
+#   <cache_dir>/<key>/augmented.npy   float32 (V, N, D) embeddings of V augmented variants
+#   <cache_dir>/<key>/meta.json       what the key was computed from
+
+
+def weights_fingerprint(model):
+    digest = hashlib.sha256()
+    for weight in model.weights:
+        digest.update(weight.name.encode())
+        digest.update(np.ascontiguousarray(weight.numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(dataset):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(dataset.index).tobytes())
+    digest.update(np.ascontiguousarray(dataset.labels).tobytes())
+    for shard_id in np.unique(dataset.index[:, 0]):
+        stat = os.stat(os.path.join(dataset.data_dir, shard_name(int(shard_id))))
+        digest.update(f"{shard_id}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def cache_meta(backbone, dataset, augment_variants, seed):
+    return {
+        'backbone': backbone.name,
+        'backbone_weights': weights_fingerprint(backbone),
+        'preprocessing_version': dataset.preprocessing_version,
+        'dataset': dataset_fingerprint(dataset),
+        'augment_variants': augment_variants,
+        'seed': seed
+    }
+
+
+def build_extractor(backbone):
+    return models.Sequential([backbone, layers.GlobalAveragePooling2D()], name='feature_extractor')
+
+
+# --- Run the frozen backbone once over every image (plus optional augmented variants) ---
+def compute_features(backbone, dataset, augment_variants=0, batch_size=32, seed=90):
+    extractor = build_extractor(backbone)
+    indices = np.arange(len(dataset))
+
+    features = extractor.predict(make_dataset(dataset, indices, batch_size=batch_size), verbose=0)
+    augmented = [
+        extractor.predict(make_dataset(dataset, indices, batch_size=batch_size, augment=True, seed=seed + v), verbose=0)
+        for v in range(augment_variants)
+    ]
+    augmented = np.stack(augmented) if augmented else np.empty((0,) + features.shape, dtype=np.float32)
+    return features.astype(np.float32), augmented.astype(np.float32)
+
+
+def load_features(entry_dir):
+    # Memory-mapped, so several processes can share one copy through the page cache
+    features = np.load(os.path.join(entry_dir, 'features.npy'), mmap_mode='r')
+    augmented = np.load(os.path.join(entry_dir, 'augmented.npy'), mmap_mode='r')
+    return features, augmented
+
+
+def feature_cache_entry(cache_dir, backbone, dataset, augment_variants=0, batch_size=32, seed=90):
+    # Folder holding features.npy / augmented.npy for this backbone and dataset, computed if missing
+    meta = cache_meta(backbone, dataset, augment_variants, seed)
+    key = hashlib.sha256(json.dumps(meta, sort_keys=True).encode()).hexdigest()[:16]
+    entry_dir = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry_dir, 'meta.json')
+
+    if os.path.exists(meta_path):
+        print(f" Using cached backbone features: {entry_dir}")
+        return entry_dir
+
+    # Different weights, preprocessing or dataset: drop the old entries
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if name != key:
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+    print(f" Computing backbone features for {len(dataset)} images ({augment_variants} augmented variants)...")
+    features, augmented = compute_features(backbone, dataset, augment_variants, batch_size, seed)
+
+    os.makedirs(entry_dir, exist_ok=True)
+    save_npy_atomic(os.path.join(entry_dir, 'features.npy'), features)
+    save_npy_atomic(os.path.join(entry_dir, 'augmented.npy'), augmented)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    print(f" Backbone features cached to: {entry_dir}")
+    return entry_dir
+
+
+def load_or_compute_features(cache_dir, backbone, dataset, augment_variants=0, batch_size=32, seed=90):
+    return load_features(feature_cache_entry(cache_dir, backbone, dataset, augment_variants, batch_size, seed))
+
+
+# --- Train the classification head directly on cached embeddings ---
+def train_head_on_features(head, features, augmented, labels, num_classes, train_idx, test_idx,
+                           epochs=12, batch_size=32, seed=90, verbose='auto', callbacks=None):
+    x_train = [np.asarray(features[train_idx])]
+    for variant in augmented:
+        x_train.append(np.asarray(variant[train_idx]))
+    x_train = np.concatenate(x_train)
+    y_train = one_hot(np.tile(labels[train_idx], len(augmented) + 1), num_classes)
+
+    x_test = np.asarray(features[test_idx])
+    y_test = one_hot(labels[test_idx], num_classes)
+
+    train_ds = tf.data.Dataset.from_tensor_slices((x_train, y_train))
+    train_ds = train_ds.shuffle(len(x_train), seed=seed, reshuffle_each_iteration=True).batch(batch_size)
+
+    return head.fit(train_ds, epochs=epochs, validation_data=(x_test, y_test), batch_size=batch_size,
+                    verbose=verbose, callbacks=callbacks)
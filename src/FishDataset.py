@@ -0,0 +1,134 @@
+import os
+import json
+import numpy as np
+from ImagePrep import normalize
+
+# --- Packed dataset layout (inside normalized_base) ---
+#   images_00000.npy ...  uint8 arrays of shape (n, 224, 224, 3)
+#   labels.npy            int64 class index per sample
+#   index.npy             int64 (shard, offset) per sample, same order as labels.npy
+#   groups.npy            int64 duplicate group per sample (DatasetIntegrity); copies share one id
+#   dataset.json          class names, image shape, shard size and preprocessing version
+SHARD_SIZE = 1024
+IMAGE_SHAPE = (224, 224, 3)
+
+# Bump whenever decode/resize/normalization (ImagePrep) changes, so shards and derived caches are rebuilt
+#   2: draft-mode JPEG decode, EXIF rotation, explicit bicubic resize
+#   3: duplicate hashes (groups.npy) from the oriented source image, matching DatasetIntegrity
+PREPROCESSING_VERSION = 3
+
+
+def shard_name(shard_id):
+    return f'images_{shard_id:05d}.npy'
+
+
+def save_npy_atomic(path, array):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+# --- Normalization (ImagePrep.normalize) happens lazily, per batch ---
+def one_hot(labels, num_classes):
+    return np.eye(num_classes, dtype=np.float32)[labels]
+
+
+# --- Writer: buffers uint8 images and flushes them as fixed-size shards ---
+class ShardWriter:
+    def __init__(self, out_dir, shard_size=SHARD_SIZE, image_shape=IMAGE_SHAPE, first_shard=0, on_flush=None):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.image_shape = tuple(image_shape)
+        self.shard_id = first_shard
+        self.on_flush = on_flush
+        self.pending = []
+        os.makedirs(out_dir, exist_ok=True)
+
+    def next_location(self):
+        return self.shard_id, len(self.pending)
+
+    def add(self, image):
+        image = np.asarray(image, dtype=np.uint8)
+        if image.shape != self.image_shape:
+            raise ValueError(f"Expected image of shape {self.image_shape}, got {image.shape}")
+
+        location = self.next_location()
+        self.pending.append(image)
+        if len(self.pending) >= self.shard_size:
+            self.flush()
+        return location
+
+    def flush(self):
+        if not self.pending:
+            return None
+        shard_id = self.shard_id
+        save_npy_atomic(os.path.join(self.out_dir, shard_name(shard_id)), np.stack(self.pending))
+        self.pending = []
+        self.shard_id += 1
+        if self.on_flush is not None:
+            self.on_flush(shard_id)
+        return shard_id
+
+    def close(self):
+        return self.flush()
+
+
+def write_index(out_dir, locations, labels, classes, groups=None, shard_size=SHARD_SIZE, image_shape=IMAGE_SHAPE):
+    save_npy_atomic(os.path.join(out_dir, 'index.npy'), np.asarray(locations, dtype=np.int64).reshape(-1, 2))
+    save_npy_atomic(os.path.join(out_dir, 'labels.npy'), np.asarray(labels, dtype=np.int64))
+    if groups is not None:
+        save_npy_atomic(os.path.join(out_dir, 'groups.npy'), np.asarray(groups, dtype=np.int64))
+
+    meta = {'classes': list(classes), 'image_shape': list(image_shape), 'shard_size': shard_size,
+            'preprocessing_version': PREPROCESSING_VERSION}
+    with open(os.path.join(out_dir, 'dataset.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+
+# --- Reader: memory-maps shards and gathers any subset of samples ---
+class ShardedDataset:
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        with open(os.path.join(data_dir, 'dataset.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.classes = meta['classes']
+        self.num_classes = len(self.classes)
+        self.image_shape = tuple(meta['image_shape'])
+        self.preprocessing_version = meta.get('preprocessing_version', 0)
+        self.labels = np.load(os.path.join(data_dir, 'labels.npy'))
+        self.index = np.load(os.path.join(data_dir, 'index.npy'))
+        # Datasets built before duplicate grouping: every image is its own group
+        groups_path = os.path.join(data_dir, 'groups.npy')
+        self.groups = np.load(groups_path) if os.path.exists(groups_path) else np.arange(len(self.labels))
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def shard(self, shard_id):
+        shard_id = int(shard_id)
+        if shard_id not in self._shards:
+            path = os.path.join(self.data_dir, shard_name(shard_id))
+            self._shards[shard_id] = np.load(path, mmap_mode='r')
+        return self._shards[shard_id]
+
+    def images(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty((len(indices),) + self.image_shape, dtype=np.uint8)
+        locations = self.index[indices]
+
+        # Gather shard by shard so each memory map is touched once per call
+        for shard_id in np.unique(locations[:, 0]):
+            mask = locations[:, 0] == shard_id
+            offsets = locations[mask, 1]
+            out[mask] = self.shard(shard_id)[offsets]
+        return out
+
+    def image(self, i):
+        shard_id, offset = self.index[i]
+        return self.shard(shard_id)[offset]
+
+    def batch(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        return normalize(self.images(indices)), one_hot(self.labels[indices], self.num_classes)
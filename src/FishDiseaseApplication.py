@@ -1,56 +1,216 @@
 import streamlit as st
-import tensorflow as tf
-from PIL import Image, ImageOps
-import numpy as np
+import os
 import time
 from datetime import datetime
 import base64
-
-# --- Load model ---
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from FishInference import CONFIDENCE_THRESHOLD, correct_image, pixels_to_batch, decode_prediction, backend_from_env, ModelLoader, cascade_from_env
+from InferenceServer import InferenceClient
+from PredictionCache import PredictionCache, prediction_key
+from Metrics import metrics, start_exporters_from_env
+from SessionImages import SessionImageStore, compact_image
+from ScanHistory import ScanHistory, image_hash
+from ShadowEval import shadow_from_env
+
+# --- Optional shared inference server (see InferenceServer.py) ---
+inference_url = os.environ.get('FINSCAN_INFERENCE_URL')
+
+# --- Load model and warm up its predict path once per process, in the background ---
+# The welcome screen renders while TensorFlow imports and the model loads; the first scan waits for it.
+# FINSCAN_MODEL selects MobileNetV2.keras (default), a SavedModel directory (fastest to load)
+# or a .tflite export, FINSCAN_THREADS sets the TFLite interpreter threads.
 @st.cache_resource
-def get_model():
-    return tf.keras.models.load_model('MobileNetV2.keras')
-
-my_model = get_model()
+def get_model_loader():
+    return ModelLoader(backend_from_env)
 
-labels_list = [
-    "Bacterial Red Disease",
-    "Aeromoniasis",
-    "Healthy",
-    "Parasitic Disease",
-    "Viral White Tail Disease"
-]
+# --- Optional cascade: test-time augmentation only for low-confidence scans (local model only) ---
+# FINSCAN_CASCADE=1 turns it on, FINSCAN_ESCALATE_BELOW / FINSCAN_TTA_CROP tune it.
+@st.cache_resource
+def get_cascade():
+    return None if inference_url else cascade_from_env()
 
-# --- Predict function ---
-def check_fish(img):
-    # Correct rotation using EXIF tag
-    img = ImageOps.exif_transpose(img)
+# --- Optional shadow models: candidates score the same scans in the background, users only see production ---
+# FINSCAN_SHADOW_MODELS="name=path,..." lists them; FINSCAN_SHADOW_QUEUE bounds the backlog (extra scans are
+# skipped), FINSCAN_SHADOW_SAMPLE shadows only that fraction of scans, FINSCAN_SHADOW_THREADS limits TFLite threads.
+@st.cache_resource
+def get_shadow():
+    return shadow_from_env()
 
-    # Convert to RGB and resize
-    img = img.convert('RGB')
-    img = img.resize((224, 224))
+@st.cache_resource
+def get_inference_client(url):
+    return InferenceClient(url)
 
-    # Convert to numpy array
-    arr = np.array(img)
+# --- Prediction cache shared by every session in this process ---
+# FINSCAN_CACHE_SIZE bounds the in-memory LRU, FINSCAN_CACHE_PATH adds a SQLite copy that survives restarts.
+@st.cache_resource
+def get_prediction_cache():
+    return PredictionCache(max_entries=int(os.environ.get('FINSCAN_CACHE_SIZE', 1024)),
+                           path=os.environ.get('FINSCAN_CACHE_PATH'))
 
-    # Remove alpha if present
-    if arr.shape[-1] == 4:
-        arr = arr[..., :3]
+# --- Background executor shared by every session: scans never block the page script ---
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=int(os.environ.get('FINSCAN_WORKERS', 2)), thread_name_prefix='scan')
 
-    # Normalize pixel values to [0, 1]
-    arr = arr / 255.0
+# --- Uploads kept per session: 224x224 model input plus a JPEG thumbnail, never the full photo ---
+# FINSCAN_SESSION_BUDGET_KB caps one session, FINSCAN_IMAGE_BUDGET_MB all sessions together,
+# FINSCAN_SESSION_IDLE_MIN drops sessions that have not been touched for that long.
+@st.cache_resource
+def get_session_images():
+    return SessionImageStore(session_budget=int(os.environ.get('FINSCAN_SESSION_BUDGET_KB', 512)) * 1024,
+                             global_budget=int(os.environ.get('FINSCAN_IMAGE_BUDGET_MB', 256)) * 1024 * 1024,
+                             idle_seconds=float(os.environ.get('FINSCAN_SESSION_IDLE_MIN', 30)) * 60)
+
+# --- Every finished scan goes to a local SQLite history (written in batches by a background thread) ---
+# FINSCAN_HISTORY_PATH sets the database ('' turns it off), FINSCAN_HISTORY_KEEP_DAYS how long raw rows are kept
+# before they are rolled up into daily counts, FINSCAN_TANK tags this kiosk's scans with a tank or pond name.
+@st.cache_resource
+def get_scan_history():
+    path = os.environ.get('FINSCAN_HISTORY_PATH', 'scan_history.db')
+    if not path:
+        return None
+    return ScanHistory(path, keep_days=int(os.environ.get('FINSCAN_HISTORY_KEEP_DAYS', 365)))
 
-    # Add batch dimension
-    arr = np.expand_dims(arr, axis=0)
+scan_tank = os.environ.get('FINSCAN_TANK', '')
 
-    # Predict
-    pred = my_model.predict(arr)
+# --- Static assets are read and encoded once per process ---
+@st.cache_resource
+def get_logo_b64(path="logo.png"):
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
 
-    # Get label and probability
-    idx = np.argmax(pred)
-    prob = float(np.max(pred))
+# --- Stage timings, request counts and confidence histogram for this process ---
+# FINSCAN_METRICS_PORT serves them as JSON on localhost, FINSCAN_METRICS_FILE dumps them periodically.
+@st.cache_resource
+def get_metrics():
+    metrics.register('prediction_cache', get_prediction_cache().stats)
+    metrics.register('session_images', get_session_images().stats)
+    if not inference_url:
+        metrics.register('model', get_model_loader().stats)
+    if get_cascade() is not None:
+        metrics.register('cascade', get_cascade().stats)
+    if get_scan_history() is not None:
+        metrics.register('scan_history', get_scan_history().stats)
+    if get_shadow() is not None:
+        metrics.register('shadow', get_shadow().stats)
+    start_exporters_from_env(metrics)
+    return metrics
+
+inference_client = get_inference_client(inference_url) if inference_url else None
+model_loader = None if inference_url else get_model_loader()
+cascade = get_cascade()
+shadow = get_shadow()
+prediction_cache = get_prediction_cache()
+session_images = get_session_images()
+scan_history = get_scan_history()
+get_metrics()
+
+# --- Shrink an upload to what the session keeps ---
+def prepare_image(img, session_key):
+    # Reduced-resolution decode, EXIF rotation and RGB, then 224x224 pixels and a thumbnail
+    img = correct_image(img)
+    return session_images.put(session_key, compact_image(img, session_images.thumbnail_budget))
+
+# --- Scans started before the background load finishes wait here ---
+def wait_for_model(report):
+    if inference_client is not None:
+        return inference_client
+    if not model_loader.ready:
+        report("loading")
+        with metrics.timer('model_wait'):
+            return model_loader.result()
+    return model_loader.result()
+
+def model_version(my_model):
+    return my_model.version if cascade is None else f"{my_model.version}|{cascade.tag}"
 
-    return labels_list[idx], prob, pred
+# --- Predict function ---
+def check_fish(pixels, on_stage=None):
+    report = on_stage or (lambda stage: None)
+    metrics.count('scans')
+
+    # The 224x224 model input identifies repeat uploads
+    report("preprocessing")
+    my_model = wait_for_model(report)
+    with metrics.timer('cache_lookup'):
+        key = prediction_key(pixels, model_version(my_model))
+        cached = prediction_cache.get(key)
+    if cached is not None:
+        metrics.count('cache_hits')
+        return cached
+
+    # Let the server batch this request together with other sessions
+    report("inference")
+    start = time.perf_counter()
+    if inference_url:
+        with metrics.timer('predict'):
+            label, prob, pred = my_model.predict_pixels(pixels)
+    else:
+        # Normalize and predict; with the cascade, unsure images get one more batched pass over augmented views
+        with metrics.timer('predict'):
+            if cascade is None:
+                pred = my_model.predict(pixels_to_batch(pixels))
+            else:
+                pred, _ = cascade.predict(my_model.predict, pixels)
+
+        # Get label and probability
+        label, prob = decode_prediction(pred)
+
+    # Candidates see the same image after the answer is ready; submit() never waits
+    if shadow is not None:
+        shadow.submit(pixels, pred, time.perf_counter() - start)
+
+    return prediction_cache.put(key, (label, prob, pred))
+
+# --- Scan job: inference runs on the shared executor, the page polls its stage ---
+class ScanJob:
+    progress_by_stage = {"queued": 5, "preprocessing": 30, "loading": 40, "inference": 70, "done": 100}
+
+    def __init__(self, img, session_key):
+        self.stage = "queued"
+        # Only the key: the pixels live in session_images, under its budget
+        self.session_key = session_key
+        self.error_shown = False
+        self.lock = threading.Lock()
+        self.submitted = time.perf_counter()
+        self.future = get_executor().submit(self.scan, img)
+        self.future.add_done_callback(self.finished)
+
+    def scan(self, img):
+        self.set_stage("preprocessing")
+        compact = prepare_image(img, self.session_key)
+        return check_fish(compact.pixels, self.set_stage)
+
+    def set_stage(self, stage):
+        with self.lock:
+            if self.stage == "queued":
+                metrics.observe('queue_wait', time.perf_counter() - self.submitted)
+            self.stage = stage
+
+    def finished(self, future):
+        self.set_stage("done")
+        metrics.observe('scan_total', time.perf_counter() - self.submitted)
+        if future.exception() is not None:
+            metrics.count('scan_errors')
+            print(f" Scan failed: {future.exception()!r}")
+            return
+        label, prob, pred = future.result()
+        metrics.observe_confidence(prob, prob < CONFIDENCE_THRESHOLD)
+
+        # Runs after the page already has its result; record() only enqueues the row
+        if scan_history is not None:
+            # No hash if the session's image was already evicted from the store
+            compact = session_images.get(self.session_key)
+            pixels_hash = image_hash(compact.pixels) if compact is not None else None
+            scan_history.record(label, prob, pred, pixels_hash, model_version(wait_for_model(lambda stage: None)),
+                                tank=scan_tank)
+
+    @property
+    def progress(self):
+        with self.lock:
+            return self.progress_by_stage[self.stage]
 
 # --- Translations ---
 texts = {
@@ -168,14 +328,7 @@ def set_style(mode):
 
 # --- Welcome screen ---
 def show_welcome(txt):
-    logo_path = "logo.png"
-    
-    def img_to_b64(path_img):
-        with open(path_img, "rb") as f:
-            data = f.read()
-        return base64.b64encode(data).decode()
-
-    logo_b64 = img_to_b64(logo_path)
+    logo_b64 = get_logo_b64()
 
     st.markdown(
         f"""
@@ -189,7 +342,7 @@ def show_welcome(txt):
                 flex-direction: column;
                 justify-content: center;
                 align-items: center;
-                animation: fadeIn 2s;
+                animation: fadeIn 2s, fadeOut 1s 3s forwards;
                 z-index: 9999;
             }}
             .welcome img {{
@@ -213,6 +366,9 @@ def show_welcome(txt):
                 from {{ opacity: 0; }}
                 to {{ opacity: 1; }}
             }}
+            @keyframes fadeOut {{
+                to {{ opacity: 0; visibility: hidden; }}
+            }}
         </style>
         <div class="welcome">
             <img src="data:image/png;base64,{logo_b64}" alt="Logo"/>
@@ -223,9 +379,8 @@ def show_welcome(txt):
         unsafe_allow_html=True
     )
 
-    time.sleep(3)
+    # The splash fades out on its own in the browser; home renders underneath right away
     st.session_state.page_num = 0
-    st.rerun()
 
 # --- Home ---
 def show_home(txt):
@@ -238,19 +393,21 @@ def show_home(txt):
         st.markdown(f"**{txt['upload_file']} ({txt['your_image']})**")
         file = st.file_uploader("", type=["jpg", "jpeg", "png"])
         if file:
-            fish_img = Image.open(file)
+            # Keep the encoded bytes: the scan decodes them at reduced resolution (see ImagePrep)
+            fish_img = file.getvalue()
             st.image(fish_img, use_container_width=True, caption=txt["your_image"])
     else:
         st.warning(txt["allow_camera"])
         st.markdown(f"**{txt['camera']}**")
         cam_img = st.camera_input("")
         if cam_img:
-            fish_img = Image.open(cam_img)
+            fish_img = cam_img.getvalue()
             # 👉 Do NOT show image preview here (remove st.image)
 
     if fish_img:
-        st.session_state.img_data = fish_img
         if st.button(txt["check"]):
+            # Only the job holds the uploaded photo, and only until it is shrunk
+            st.session_state.scan_job = ScanJob(fish_img, st.session_state.session_key)
             st.session_state.page_num = 1
             st.rerun()
 
@@ -260,13 +417,34 @@ def run_scan(txt):
     st.title(txt["checking"])
     prog = st.progress(0)
     msg = st.empty()
-    for pct in range(101):
-        time.sleep(0.015)
-        prog.progress(pct)
-        msg.text(f"{txt['processing']} {pct}%")
 
-    label, prob, _ = check_fish(st.session_state.img_data)
-    if prob < 0.6:
+    job = st.session_state.get("scan_job")
+    if job is None:
+        reset_all()
+
+    # Poll the background job; progress follows its real stage
+    with metrics.timer('run_scan_wait'):
+        while not job.future.done():
+            pct = job.progress
+            prog.progress(pct)
+            msg.text(f"{txt['processing']} {pct}%")
+            time.sleep(0.05)
+    prog.progress(100)
+    msg.text(f"{txt['processing']} 100%")
+
+    # The finished job stays in the session so reruns (e.g. Go Back) reuse its result
+    try:
+        label, prob, _ = job.future.result()
+    except Exception as e:
+        # An upload that cannot be decoded or a model that failed to load: no traceback on the page
+        if not job.error_shown:
+            job.error_shown = True
+            metrics.count(f'scan_errors_shown:{type(e).__name__}')
+        st.error(txt["unable"])
+        if st.button(txt["go_back"]):
+            reset_all()
+        return
+    if prob < CONFIDENCE_THRESHOLD:
         st.error(txt["unable"])
         if st.button(txt["go_back"]):
             reset_all()
@@ -283,8 +461,13 @@ def run_scan(txt):
 
 # --- Result ---
 def show_output(txt):
+    metrics.count('results_shown')
     st.title(txt["result"])
-    st.image(st.session_state.img_data, use_container_width=True)
+    # The thumbnail may be gone if the session sat idle past its budget window
+    compact = session_images.get(st.session_state.session_key)
+    if compact is not None:
+        with metrics.timer('show_output_image'):
+            st.image(compact.thumbnail, use_container_width=True)
 
     info = st.session_state.result_info
     st.markdown(f"""
@@ -422,8 +605,9 @@ def show_guide(txt):
 # --- Reset ---
 def reset_all():
     st.session_state.page_num = 0
-    st.session_state.img_data = None
+    session_images.discard(st.session_state.session_key)
     st.session_state.result_info = None
+    st.session_state.scan_job = None
     st.rerun()
 
 # --- Main ---
@@ -437,8 +621,8 @@ def main():
 
     if "page_num" not in st.session_state:
         st.session_state.page_num = -1
-    if "img_data" not in st.session_state:
-        st.session_state.img_data = None
+    if "session_key" not in st.session_state:
+        st.session_state.session_key = uuid.uuid4().hex
 
     lang_map = {"English": "en", "Malay": "ms", "中文": "zh"}
     lang_code = lang_map[st.session_state.lang]
@@ -448,20 +632,20 @@ def main():
 
     if st.session_state.page_num == -1:
         show_welcome(txt)
-    else:
-        col1, col2 = st.columns(2)
-
-        with col1:
-            lang_selected = st.selectbox("🌐 Language", ["English", "Malay", "中文"], index=["English", "Malay", "中文"].index(st.session_state.lang))
-            if lang_selected != st.session_state.lang:
-                st.session_state.lang = lang_selected
-                st.rerun()
-
-        with col2:
-            theme_selected = st.selectbox("🌗 Theme", ["Light", "Dark"], index=["Light", "Dark"].index(st.session_state.theme_mode))
-            if theme_selected != st.session_state.theme_mode:
-                st.session_state.theme_mode = theme_selected
-                st.rerun()
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        lang_selected = st.selectbox("🌐 Language", ["English", "Malay", "中文"], index=["English", "Malay", "中文"].index(st.session_state.lang))
+        if lang_selected != st.session_state.lang:
+            st.session_state.lang = lang_selected
+            st.rerun()
+
+    with col2:
+        theme_selected = st.selectbox("🌗 Theme", ["Light", "Dark"], index=["Light", "Dark"].index(st.session_state.theme_mode))
+        if theme_selected != st.session_state.theme_mode:
+            st.session_state.theme_mode = theme_selected
+            st.rerun()
 
     # Refresh translations again after possible update
     lang_code = lang_map[st.session_state.lang]
@@ -0,0 +1,308 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+import numpy as np
+from PIL import Image
+import ImagePrep
+from ImagePrep import IMAGE_SIZE
+from Metrics import metrics
+
+MODEL_PATH = 'MobileNetV2.keras'
+CONFIDENCE_THRESHOLD = 0.6
+
+labels_list = [
+    "Bacterial Red Disease",
+    "Aeromoniasis",
+    "Healthy",
+    "Parasitic Disease",
+    "Viral White Tail Disease"
+]
+
+
+# --- Serving side of ImagePrep (the same code builds the training shards), timed per stage ---
+def correct_image(img):
+    # Reduced-resolution JPEG decode and EXIF rotation, then convert to RGB
+    img = ImagePrep.request_draft(ImagePrep.open_image(img))
+    with metrics.timer('decode_exif'):
+        img = ImagePrep.orient(img)
+    with metrics.timer('convert_rgb'):
+        return ImagePrep.to_rgb(img)
+
+
+def resize_pixels(img):
+    # Resize an already corrected image
+    with metrics.timer('resize'):
+        img = ImagePrep.resize_image(img)
+
+    # Convert to numpy array
+    with metrics.timer('to_array'):
+        return ImagePrep.to_array(img)
+
+
+def image_to_pixels(img):
+    return resize_pixels(correct_image(img))
+
+
+def pixels_to_batch(pixels):
+    # Normalize pixel values to [0, 1] and add batch dimension if needed
+    with metrics.timer('normalize'):
+        arr = ImagePrep.normalize(pixels)
+    if arr.ndim == 3:
+        arr = np.expand_dims(arr, axis=0)
+    return arr
+
+
+def random_batch(batch_size=1, seed=90):
+    # Synthetic normalized batch for warmup and latency measurements
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.uint8)
+    return pixels_to_batch(pixels)
+
+
+# --- Confidence-gated cascade: one cheap pass, test-time augmentation only when unsure ---
+# Escalated images get flipped and cropped views (crops resized back to the model input)
+# predicted as one batch, averaged with the first pass. FINSCAN_CASCADE=1 turns it on in the app,
+# FINSCAN_ESCALATE_BELOW sets the first-pass confidence that triggers it, FINSCAN_TTA_CROP the crop size.
+# Views tta_views returns per image: two flips and five crops
+TTA_BATCH_SIZE = 7
+
+
+def tta_views(pixels, crop=0.875):
+    h, w = pixels.shape[:2]
+    ch, cw = int(round(h * crop)), int(round(w * crop))
+    top, left = (h - ch) // 2, (w - cw) // 2
+    crops = [pixels[top:top + ch, left:left + cw], pixels[:ch, :cw], pixels[:ch, w - cw:],
+             pixels[h - ch:, :cw], pixels[h - ch:, w - cw:]]
+    crops = [ImagePrep.to_array(ImagePrep.resize_image(Image.fromarray(np.ascontiguousarray(c)), (w, h)))
+             for c in crops]
+    # Horizontal flips of the full image and the center crop, then the five crops
+    return np.stack([pixels[:, ::-1], crops[0][:, ::-1]] + crops)
+
+
+class Cascade:
+    def __init__(self, escalate_below=0.8, crop=0.875):
+        self.escalate_below = escalate_below
+        self.crop = crop
+        # Part of the prediction cache key: cascaded results differ from single-pass ones
+        self.tag = f'cascade{escalate_below:g}/{crop:g}'
+
+    def predict(self, predict, pixels):
+        # (pred, escalated) for one uint8 image
+        with metrics.timer('first_pass'):
+            pred = predict(pixels_to_batch(pixels))
+        first = float(np.max(pred))
+        if first >= self.escalate_below:
+            metrics.count('cascade_first_pass')
+            return pred, False
+
+        metrics.count('cascade_escalated')
+        with metrics.timer('tta'):
+            views = pixels_to_batch(tta_views(pixels, self.crop))
+            pred = np.concatenate([pred, predict(views)]).mean(axis=0, keepdims=True)
+        if first < CONFIDENCE_THRESHOLD <= float(np.max(pred)):
+            metrics.count('cascade_rescued')
+        return pred, True
+
+    def stats(self):
+        first, escalated = metrics.counter('cascade_first_pass'), metrics.counter('cascade_escalated')
+        total = first + escalated
+        return {'escalate_below': self.escalate_below, 'crop': self.crop,
+                'escalation_rate': escalated / total if total else 0.0,
+                'rescued': metrics.counter('cascade_rescued')}
+
+
+def cascade_from_env():
+    from PerfConfig import env_flag
+    if not env_flag('FINSCAN_CASCADE'):
+        return None
+    return Cascade(float(os.environ.get('FINSCAN_ESCALATE_BELOW', 0.8)), float(os.environ.get('FINSCAN_TTA_CROP', 0.875)))
+
+
+def decode_prediction(pred):
+    # Get label and probability for a single (1, num_classes) prediction
+    idx = int(np.argmax(pred))
+    prob = float(np.max(pred))
+    return labels_list[idx], prob
+
+
+def load_model(path=MODEL_PATH, compile=True):
+    # compile=False skips restoring the optimizer and loss: enough for inference and faster to load
+    import tensorflow as tf
+    return tf.keras.models.load_model(path, compile=compile)
+
+
+# --- Compiled fixed-signature predict path ---
+# Calls the model directly inside one tf.function instead of going through
+# Model.predict (data adapter, callbacks, per-call setup). The batch axis is
+# left open so the same trace serves single scans and micro-batches, and the
+# warmup call pays the tracing cost at load time instead of on the first scan.
+def compile_predict(model, warmup=True, jit_compile=False):
+    import tensorflow as tf
+
+    # jit_compile: XLA-compile the forward pass (recompiled once per distinct batch size)
+    @tf.function(input_signature=[tf.TensorSpec([None, IMAGE_SIZE[1], IMAGE_SIZE[0], 3], tf.float32)],
+                 jit_compile=jit_compile)
+    def serve(batch):
+        return model(batch, training=False)
+
+    def predict(batch):
+        return serve(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+    if warmup:
+        predict(np.zeros((1, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32))
+    return predict
+
+
+# --- Pluggable inference backends: predict(batch) -> (n, num_classes) probabilities ---
+class KerasBackend:
+    name = 'keras'
+
+    def __init__(self, path=MODEL_PATH, jit_compile=False):
+        from PredictionCache import file_version
+        self.path = path
+        self.version = file_version(path)
+        self.model = load_model(path, compile=False)
+        self.predict = compile_predict(self.model, jit_compile=jit_compile)
+
+
+class SavedModelBackend:
+    # Inference-only export (TFLiteExport.export_savedmodel): already traced, no Keras objects to rebuild
+    name = 'savedmodel'
+
+    def __init__(self, path):
+        import tensorflow as tf
+        from PredictionCache import file_version
+        self.path = path
+        self.version = file_version(path)
+        self.model = tf.saved_model.load(path)
+        self.serve = self.model.serve
+        self.predict(np.zeros((1, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32))
+
+    def predict(self, batch):
+        import tensorflow as tf
+        return self.serve(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+
+class TFLiteInterpreter:
+    # One interpreter allocated for one batch size; resizing reallocates every tensor
+    def __init__(self, path, batch_size, num_threads=None):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads)
+        self.batch_size = None
+        # One interpreter is not safe to invoke from several threads at once
+        self.lock = threading.Lock()
+        with self.lock:
+            self._resize(batch_size)
+            self._invoke(np.zeros((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32))
+
+    def _resize(self, batch_size):
+        if batch_size != self.batch_size:
+            input_index = self.interpreter.get_input_details()[0]['index']
+            self.interpreter.resize_tensor_input(input_index, [batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3])
+            self.interpreter.allocate_tensors()
+            self.input = self.interpreter.get_input_details()[0]
+            self.output = self.interpreter.get_output_details()[0]
+            self.batch_size = batch_size
+            metrics.count('tflite_allocations')
+
+    def _invoke(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        scale, zero_point = self.input['quantization']
+        if self.input['dtype'] != np.float32 and scale:
+            batch = np.round(batch / scale + zero_point)
+        self.interpreter.set_tensor(self.input['index'], batch.astype(self.input['dtype']))
+        self.interpreter.invoke()
+
+        out = self.interpreter.get_tensor(self.output['index'])
+        scale, zero_point = self.output['quantization']
+        if self.output['dtype'] != np.float32 and scale:
+            out = (out.astype(np.float32) - zero_point) * scale
+        return np.array(out, dtype=np.float32)
+
+    def predict(self, batch):
+        with self.lock:
+            self._resize(len(batch))
+            return self._invoke(batch)
+
+
+class TFLiteBackend:
+    name = 'tflite'
+    # Single scans and the cascade's TTA views each keep an interpreter at their own batch size, so
+    # switching between them never reallocates. Other sizes (micro-batches, bulk scans) share one
+    # more interpreter that is resized when the size changes. Each is created on first use.
+    fixed_batch_sizes = (1, TTA_BATCH_SIZE)
+
+    def __init__(self, path, num_threads=None):
+        from PredictionCache import file_version
+        self.path = path
+        self.version = file_version(path)
+        self.num_threads = num_threads
+        self.interpreters = {}
+        self.lock = threading.Lock()
+        self.interpreter_for(1)
+
+    def interpreter_for(self, batch_size):
+        key = batch_size if batch_size in self.fixed_batch_sizes else None
+        with self.lock:
+            if key not in self.interpreters:
+                self.interpreters[key] = TFLiteInterpreter(self.path, batch_size, self.num_threads)
+            return self.interpreters[key]
+
+    def predict(self, batch):
+        return self.interpreter_for(len(batch)).predict(batch)
+
+
+def load_backend(path=MODEL_PATH, num_threads=None, jit_compile=False):
+    if path.endswith('.tflite'):
+        return TFLiteBackend(path, num_threads=num_threads)
+    if os.path.isdir(path):
+        return SavedModelBackend(path)
+    return KerasBackend(path, jit_compile=jit_compile)
+
+
+def backend_from_env():
+    # FINSCAN_MODEL picks the artifact (.keras, .tflite or a SavedModel directory), FINSCAN_THREADS the TFLite thread count;
+    # FINSCAN_INTRA_THREADS / _INTER_THREADS / _XLA / _ONEDNN / _DETERMINISTIC are applied first (PerfConfig)
+    from PerfConfig import perf_config, apply_perf_config
+    config = apply_perf_config(perf_config())
+    threads = os.environ.get('FINSCAN_THREADS')
+    threads = int(threads) if threads else (config['intra_threads'] or None)
+    return load_backend(os.environ.get('FINSCAN_MODEL', MODEL_PATH), threads, config['xla'])
+
+
+# --- Background model loading: the page renders while TensorFlow imports and the model loads ---
+class ModelLoader:
+    def __init__(self, factory, name='model'):
+        self.future = Future()
+        self.started = time.perf_counter()
+        self.seconds = None
+        threading.Thread(target=self._load, args=(factory,), name=f'{name}-loader', daemon=True).start()
+
+    def _load(self, factory):
+        try:
+            backend = factory()
+        except Exception as e:
+            self.seconds = time.perf_counter() - self.started
+            self.future.set_exception(e)
+            return
+        self.seconds = time.perf_counter() - self.started
+        metrics.observe('model_load', self.seconds)
+        self.future.set_result(backend)
+
+    @property
+    def ready(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        # Blocks until the model is ready; re-raises a failed load
+        return self.future.result(timeout)
+
+    def stats(self):
+        if not self.future.done():
+            return {'state': 'loading', 'elapsed_seconds': round(time.perf_counter() - self.started, 3)}
+        if self.future.exception() is not None:
+            return {'state': 'failed', 'error': repr(self.future.exception()), 'load_seconds': round(self.seconds, 3)}
+        backend = self.future.result()
+        return {'state': 'ready', 'backend': getattr(backend, 'name', type(backend).__name__),
+                'artifact': getattr(backend, 'path', None), 'load_seconds': round(self.seconds, 3)}
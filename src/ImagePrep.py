@@ -0,0 +1,65 @@
+import io
+import numpy as np
+from PIL import Image, ImageOps
+
+# --- One decode/resize/normalize path for the dataset build and every serving entry point ---
+# Changing anything here changes the pixels the model sees: bump FishDataset.PREPROCESSING_VERSION.
+IMAGE_SIZE = (224, 224)
+RESIZE_FILTER = Image.Resampling.BICUBIC
+
+# JPEGs are decoded with DCT scaling (1/2, 1/4, 1/8) to no less than this multiple of the
+# target size, so a 12 MP photo never materializes at full resolution but the resize still
+# has enough pixels to antialias from.
+DRAFT_OVERSAMPLE = 2
+
+
+def open_image(source):
+    # source: a path, raw bytes, a file-like object or an already opened PIL image
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+def request_draft(img, size=IMAGE_SIZE):
+    # Only takes effect before the pixels are loaded; a no-op for non-JPEG or loaded images
+    if img.format == 'JPEG':
+        img.draft('RGB', (size[0] * DRAFT_OVERSAMPLE, size[1] * DRAFT_OVERSAMPLE))
+    return img
+
+
+def orient(img):
+    # Apply the EXIF orientation (this is where a lazily opened image is actually decoded)
+    return ImageOps.exif_transpose(img)
+
+
+def to_rgb(img):
+    return img if img.mode == 'RGB' else img.convert('RGB')
+
+
+def decode_image(source, size=IMAGE_SIZE):
+    # Reduced-resolution decode, EXIF rotation and RGB
+    return to_rgb(orient(request_draft(open_image(source), size)))
+
+
+def resize_image(img, size=IMAGE_SIZE):
+    return img.resize(size, RESIZE_FILTER)
+
+
+def to_array(img):
+    arr = np.asarray(img, dtype=np.uint8)
+    # Remove alpha if present
+    if arr.shape[-1] == 4:
+        arr = arr[..., :3]
+    return arr
+
+
+def load_pixels(source, size=IMAGE_SIZE):
+    # uint8 (h, w, 3) model input: what the shards store and what serving predicts on
+    return to_array(resize_image(decode_image(source, size), size))
+
+
+def normalize(pixels):
+    # uint8 -> float32 in [0, 1]
+    return np.asarray(pixels, dtype=np.float32) / np.float32(255.0)
@@ -0,0 +1,225 @@
+import io
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.request
+import numpy as np
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from FishInference import MODEL_PATH, IMAGE_SIZE, image_to_pixels, pixels_to_batch, decode_prediction, load_backend
+from PerfConfig import add_perf_args, perf_config, apply_perf_config, describe
+
+
+# --- Micro-batcher: groups concurrent requests into one model call ---
+def batch_rows(pixels):
+    # A (N, 224, 224, 3) stack is N images, anything else one
+    return len(pixels) if np.ndim(pixels) == 4 else 1
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.carry = None
+        self.batches = 0
+        self.items = 0
+        self.worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self.worker.start()
+
+    def submit(self, pixels):
+        future = Future()
+        self.requests.put((pixels, future))
+        return future
+
+    def _collect(self):
+        # Block for the first request, then wait at most max_wait for more. max_batch_size counts
+        # image rows, not requests; a request that would overflow the budget starts the next batch.
+        first, self.carry = self.carry or self.requests.get(), None
+        batch, rows = [first], batch_rows(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if rows + batch_rows(item[0]) > self.max_batch_size:
+                self.carry = item
+                break
+            batch.append(item)
+            rows += batch_rows(item[0])
+        return batch
+
+    def _predict(self, batch):
+        # One model call for the whole micro-batch; each request gets back its own rows
+        inputs = [pixels_to_batch(pixels) for pixels, _ in batch]
+        preds = np.asarray(self.predict_fn(np.concatenate(inputs)))
+        results, start = [], 0
+        for rows in inputs:
+            results.append(preds[start:start + len(rows)])
+            start += len(rows)
+        return results
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self._predict(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # Retry each request alone, so only the one that broke the batch fails
+                results = []
+                for item in batch:
+                    try:
+                        results.append(self._predict([item])[0])
+                    except Exception as item_error:
+                        results.append(item_error)
+
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def check_pixels(pixels):
+    # One (224, 224, 3) image or an (N, 224, 224, 3) stack of uint8 pixels, as image_to_pixels produces
+    shape = (IMAGE_SIZE[1], IMAGE_SIZE[0], 3)
+    if pixels.dtype != np.uint8:
+        raise ValueError(f'expected uint8 pixels, got {pixels.dtype}')
+    if pixels.shape != shape and not (pixels.ndim == 4 and pixels.shape[1:] == shape and len(pixels) > 0):
+        raise ValueError(f'expected shape {shape} or (N, {", ".join(map(str, shape))}), got {pixels.shape}')
+    return pixels
+
+
+# --- HTTP front end ---
+# POST /predict with either an encoded image (any PIL format) or a .npy uint8
+# array from image_to_pixels (Content-Type: application/x-npy); a stack of N images gets N labels back.
+# GET /health reports batching statistics.
+def make_handler(batcher, timeout, model_version=None):
+    class PredictHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/health':
+                self._send_json(404, {'error': 'not found'})
+                return
+            avg = batcher.items / batcher.batches if batcher.batches else 0.0
+            self._send_json(200, {'status': 'ok', 'model_version': model_version, 'requests': batcher.items,
+                                  'batches': batcher.batches, 'avg_batch_size': avg})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.headers.get('Content-Type') == 'application/x-npy':
+                    pixels = check_pixels(np.load(io.BytesIO(body), allow_pickle=False))
+                else:
+                    pixels = image_to_pixels(Image.open(io.BytesIO(body)))
+            except Exception as e:
+                self._send_json(400, {'error': f'bad image: {e}'})
+                return
+
+            try:
+                pred = batcher.submit(pixels).result(timeout=timeout)
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+
+            if pixels.ndim == 4:
+                labels, probs = zip(*(decode_prediction(row) for row in pred))
+                self._send_json(200, {'label': list(labels), 'prob': list(probs), 'pred': pred.tolist()})
+                return
+            label, prob = decode_prediction(pred)
+            self._send_json(200, {'label': label, 'prob': prob, 'pred': pred.tolist()})
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictHandler
+
+
+class BatchingHTTPServer(ThreadingHTTPServer):
+    # Many sessions connect at once; the default listen backlog of 5 is too small
+    request_queue_size = 128
+    daemon_threads = True
+
+
+# --- Client used by the Streamlit app (same return values as check_fish) ---
+class InferenceClient:
+    def __init__(self, url, timeout=30.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._version = None
+
+    @property
+    def version(self):
+        # Model version reported by the server, used to key cached predictions
+        if self._version is None:
+            with urllib.request.urlopen(self.url + '/health', timeout=self.timeout) as response:
+                self._version = json.loads(response.read())['model_version']
+        return self._version
+
+    def predict_pixels(self, pixels):
+        buf = io.BytesIO()
+        np.save(buf, np.asarray(pixels, dtype=np.uint8), allow_pickle=False)
+        request = urllib.request.Request(self.url + '/predict', data=buf.getvalue(),
+                                         headers={'Content-Type': 'application/x-npy'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read())
+        return result['label'], result['prob'], np.asarray(result['pred'], dtype=np.float32)
+
+    def check_fish(self, img):
+        return self.predict_pixels(image_to_pixels(img))
+
+
+def serve(model_path=MODEL_PATH, host='127.0.0.1', port=8502, max_batch_size=16, max_wait_ms=5.0, timeout=30.0,
+          threads=None, jit_compile=False):
+    backend = load_backend(model_path, num_threads=threads, jit_compile=jit_compile)
+    batcher = MicroBatcher(backend.predict, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server = BatchingHTTPServer((host, port), make_handler(batcher, timeout, backend.version))
+    print(f" Serving {model_path} on http://{host}:{port} (max batch {max_batch_size}, max wait {max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching inference server for the fish disease model.")
+    parser.add_argument('--model', default=MODEL_PATH, help="A .keras model or a .tflite export.")
+    parser.add_argument('--threads', type=int, default=None, help="TFLite interpreter threads.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--max-batch-size', type=int, default=16, help="Images (rows) per model call.")
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    add_perf_args(parser)
+    args = parser.parse_args()
+    config = apply_perf_config(perf_config(args))
+    print(f" CPU execution: {describe(config)}")
+    serve(args.model, args.host, args.port, args.max_batch_size, args.max_wait_ms, args.timeout,
+          args.threads or config['intra_threads'] or None, config['xla'])
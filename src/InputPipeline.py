@@ -0,0 +1,64 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+from FishDataset import one_hot
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+# --- Same settings as the old ImageDataGenerator, as parallel Keras layers ---
+def build_augmenter(seed=90):
+    return tf.keras.Sequential([
+        layers.RandomRotation(20 / 360, fill_mode='nearest', seed=seed),                 # rotation_range=20
+        layers.RandomZoom((-0.2, 0.2), (-0.2, 0.2), fill_mode='nearest', seed=seed),     # zoom_range=0.2
+        layers.RandomTranslation(0.2, 0.2, fill_mode='nearest', seed=seed),              # width/height_shift_range=0.2
+        layers.RandomFlip('horizontal', seed=seed)                                       # horizontal_flip=True
+    ], name='augmentation')
+
+
+# --- Streaming dataset over a ShardedDataset subset ---
+# Only the indices live in memory; pixels are gathered from the memory-mapped
+# shards one batch at a time, normalized (and augmented) in parallel, and
+# prefetched while the model trains. cache=None disables caching, '' caches
+# the uint8 pixels in memory and any other string caches them to that file.
+def make_dataset(dataset, indices, batch_size=32, training=False, augment=False, cache=None, seed=90):
+    indices = np.asarray(indices, dtype=np.int64)
+    image_shape = tuple(dataset.image_shape)
+    num_classes = dataset.num_classes
+
+    def load_batch(batch_idx):
+        return dataset.images(batch_idx), one_hot(dataset.labels[batch_idx], num_classes)
+
+    def tf_load_batch(batch_idx):
+        images, labels = tf.numpy_function(load_batch, [batch_idx], [tf.uint8, tf.float32])
+        images.set_shape((None,) + image_shape)
+        labels.set_shape((None, num_classes))
+        return images, labels
+
+    if training and cache is not None:
+        # The cache keeps the order it is filled in and is only shuffled with a bounded buffer on top;
+        # indices arrive class-sorted, so mix them once before the cache is written
+        indices = np.random.default_rng(seed).permutation(indices)
+
+    ds = tf.data.Dataset.from_tensor_slices(indices)
+    if training and cache is None:
+        ds = ds.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(tf_load_batch, num_parallel_calls=AUTOTUNE)
+
+    if cache is not None:
+        # Cache the uint8 samples once, then shuffle per epoch on top of the cache
+        ds = ds.unbatch().cache(cache)
+        if training:
+            ds = ds.shuffle(min(len(indices), 2048), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+
+    augmenter = build_augmenter(seed) if augment else None
+
+    def prepare(images, labels):
+        images = tf.cast(images, tf.float32) / 255.0
+        if augmenter is not None:
+            images = augmenter(images, training=True)
+        return images, labels
+
+    ds = ds.map(prepare, num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
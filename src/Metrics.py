@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency bucket upper bounds in milliseconds (last bucket is everything above); the top ones cover model loading
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+CONFIDENCE_BINS = 10
+
+
+# --- Low-overhead in-process metrics: fixed-size histograms under one lock ---
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.confidence = [0] * CONFIDENCE_BINS
+        self.providers = {}
+
+    def observe(self, stage, seconds):
+        ms = seconds * 1000.0
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, ms)
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                              'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            if ms > entry['max_ms']:
+                entry['max_ms'] = ms
+            entry['buckets'][bucket] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe_confidence(self, prob, rejected):
+        bin_index = min(int(prob * CONFIDENCE_BINS), CONFIDENCE_BINS - 1)
+        with self.lock:
+            self.confidence[bin_index] += 1
+            self.counters['predictions'] = self.counters.get('predictions', 0) + 1
+            if rejected:
+                self.counters['low_confidence_rejections'] = self.counters.get('low_confidence_rejections', 0) + 1
+
+    def register(self, name, provider):
+        # provider() returns a JSON-able dict merged into every snapshot (e.g. cache stats)
+        self.providers[name] = provider
+
+    def counter(self, name):
+        with self.lock:
+            return self.counters.get(name, 0)
+
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for name, entry in self.stages.items():
+                stages[name] = {
+                    'count': entry['count'],
+                    'mean_ms': entry['total_ms'] / entry['count'],
+                    'max_ms': entry['max_ms'],
+                    'p50_ms': bucket_percentile(entry['buckets'], 0.50),
+                    'p95_ms': bucket_percentile(entry['buckets'], 0.95),
+                    'p99_ms': bucket_percentile(entry['buckets'], 0.99),
+                    'buckets_ms': dict(zip([str(b) for b in LATENCY_BUCKETS_MS] + ['inf'], entry['buckets']))
+                }
+            counters = dict(self.counters)
+            confidence = list(self.confidence)
+
+        predictions = counters.get('predictions', 0)
+        snapshot = {
+            'timestamp': time.time(),
+            'uptime_s': time.time() - self.started,
+            'stages': stages,
+            'counters': counters,
+            'confidence_histogram': {f'{i / CONFIDENCE_BINS:.1f}-{(i + 1) / CONFIDENCE_BINS:.1f}': n
+                                     for i, n in enumerate(confidence)},
+            'rejection_rate': counters.get('low_confidence_rejections', 0) / predictions if predictions else 0.0
+        }
+        for name, provider in list(self.providers.items()):
+            try:
+                snapshot[name] = provider()
+            except Exception as e:
+                snapshot[name] = {'error': str(e)}
+        return snapshot
+
+    # --- Exporters ---
+    def start_dump(self, path, interval=60.0):
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.dump(path)
+        thread = threading.Thread(target=loop, name='metrics-dump', daemon=True)
+        thread.start()
+        return thread
+
+    def dump(self, path):
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def serve(self, port, host='127.0.0.1'):
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(registry.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+        thread.start()
+        return server
+
+
+def bucket_percentile(buckets, q):
+    # Upper bound of the bucket holding the q-th observation (coarse, but constant cost)
+    total = sum(buckets)
+    if total == 0:
+        return 0.0
+    target = q * total
+    running = 0
+    for bound, n in zip(LATENCY_BUCKETS_MS + [float('inf')], buckets):
+        running += n
+        if running >= target:
+            return float(bound)
+    return float('inf')
+
+
+# --- Process-wide registry used by the inference path ---
+metrics = Metrics()
+
+
+def start_exporters_from_env(registry=metrics):
+    # FINSCAN_METRICS_PORT serves /metrics, FINSCAN_METRICS_FILE is rewritten every FINSCAN_METRICS_INTERVAL s
+    port = os.environ.get('FINSCAN_METRICS_PORT')
+    path = os.environ.get('FINSCAN_METRICS_FILE')
+    if port:
+        registry.serve(int(port))
+    if path:
+        registry.start_dump(path, float(os.environ.get('FINSCAN_METRICS_INTERVAL', 60)))
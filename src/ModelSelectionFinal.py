@@ -1,99 +1,314 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 import zipfile
 import os
+import json
+import time
 import random
+import shutil
+import argparse
+from PerfConfig import preconfigure, add_perf_args, perf_config, apply_perf_config, describe
+
+# oneDNN is chosen when TensorFlow loads, so FINSCAN_ONEDNN / --onednn must be applied before this import
+preconfigure()
 import tensorflow as tf
 from tensorflow.keras import layers, models
 from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedGroupKFold
 from sklearn.metrics import classification_report
+from FishDataset import ShardedDataset
+from InputPipeline import make_dataset
 
-os.environ['PYTHONHASHSEED'] = '90'
-random.seed(90)
-np.random.seed(90)
-tf.random.set_seed(90)
-
-# === Extract ML.zip ===
+# === Settings ===
 zip_path = "ML.zip"
 extract_to = "ML"
+feature_cache_dir = "feature_cache"
+checkpoint_dir = "checkpoints"
+
+
+def set_seeds(seed=90):
+    os.environ['PYTHONHASHSEED'] = str(seed)
+    random.seed(seed)
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+
+
+# === Classification head hyperparameters (SweepRunner.py searches over these) ===
+def head_layers(num_classes, dense_units=128, dropout=0.3):
+    return [
+        layers.Dense(dense_units, activation='relu'),
+        layers.Dropout(dropout),
+        layers.Dense(num_classes, activation='softmax')
+    ]
+
+
+def compile_model(model, learning_rate=0.001, jit_compile=False):
+    # jit_compile: XLA-compile the whole train step (see PerfConfig / --xla)
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate), loss='categorical_crossentropy',
+                  metrics=['accuracy'], jit_compile=jit_compile)
+    return model
 
-if not os.path.exists(extract_to):
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_to)
-
-# === Load labels CSV ===
-label_csv_path = os.path.join(extract_to, 'normalized_images', 'normalized_labels.csv')
-df = pd.read_csv(label_csv_path)
-
-# === Load .npy image arrays and labels ===
-X, y = [], []
-for _, row in df.iterrows():
-    npy_path = os.path.join(extract_to, 'normalized_images', row['filename'])
-    arr = np.load(npy_path)
-    X.append(arr)
-    y.append([row[f'class_{i}'] for i in range(len(row) - 2)])
-
-X = np.array(X)
-y = np.array(y)
-
-# === Train-test split ===
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# === Data augmentation ===
-datagen = ImageDataGenerator(
-    rotation_range=20,
-    zoom_range=0.2,
-    width_shift_range=0.2,
-    height_shift_range=0.2,
-    horizontal_flip=True
-)
 
 # === Build MobileNetV2 model ===
-def build_mobilenet_model(input_shape=(224, 224, 3), num_classes=5):
-    base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=input_shape)
+def build_mobilenet_model(input_shape=(224, 224, 3), num_classes=5, weights='imagenet',
+                          dense_units=128, dropout=0.3, learning_rate=0.001, jit_compile=False):
+    base_model = MobileNetV2(weights=weights, include_top=False, input_shape=input_shape)
     base_model.trainable = False
 
     model = models.Sequential([
         base_model,
         layers.GlobalAveragePooling2D(),
-        layers.Dense(128, activation='relu'),
-        layers.Dropout(0.3),
-        layers.Dense(num_classes, activation='softmax')
+        *head_layers(num_classes, dense_units, dropout)
     ])
+    return compile_model(model, learning_rate, jit_compile)
+
+
+# === Head alone, on pooled backbone features ===
+def build_head(feature_dim, num_classes=5, dense_units=128, dropout=0.3, learning_rate=0.001):
+    head = models.Sequential([layers.Input(shape=(feature_dim,))] + head_layers(num_classes, dense_units, dropout))
+    return compile_model(head, learning_rate)
+
+
+# === Head only: the Dense/Dropout/Dense layers, shared with the full model ===
+def head_of(model, learning_rate=0.001, jit_compile=False):
+    backbone = model.layers[0]
+    head = models.Sequential([layers.Input(shape=(backbone.output_shape[-1],))] + model.layers[2:])
+    return compile_model(head, learning_rate, jit_compile)
+
+
+# === Train-test split: duplicates stay on one side, classes stay balanced as far as groups allow ===
+# Large duplicate groups make folds uneven, so every fold is tried and the one that keeps the most
+# classes in the test set with the test fraction closest to test_size is used.
+def group_split(labels, groups, indices=None, test_size=0.2, seed=42, tolerance=0.5):
+    indices = np.arange(len(labels)) if indices is None else np.asarray(indices)
+    splitter = StratifiedGroupKFold(n_splits=round(1 / test_size), shuffle=True, random_state=seed)
+    present = np.unique(labels[indices])
+
+    def score(fold):
+        test_labels = labels[indices[fold[1]]]
+        return len(np.setdiff1d(present, test_labels)), abs(len(fold[1]) / len(indices) - test_size)
+
+    train, test = min(splitter.split(indices, labels[indices], groups[indices]), key=score)
+    missing, _ = score((train, test))
+    fraction = len(test) / len(indices)
+    counts = np.bincount(labels[indices[test]], minlength=int(labels.max()) + 1)
+    print(f" Test split: {len(test)} of {len(indices)} images ({fraction:.1%}), per class {counts.tolist()}")
+    if missing or abs(fraction - test_size) > tolerance * test_size:
+        print(f" Warning: test split is {fraction:.1%} instead of {test_size:.0%} with {missing} classes missing; "
+              f"duplicate groups are too large for a balanced split (see groups.npy)")
+    return indices[train], indices[test]
+
+
+# === Training callbacks: per-epoch backup (resume), early stopping, epoch timing ===
+class EpochTimer(tf.keras.callbacks.Callback):
+    # Adds 'epoch_seconds' to the epoch logs, so History and CSVLogger record it
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is not None:
+            logs['epoch_seconds'] = time.perf_counter() - self.start
+
+
+def prepare_run_dir(run_dir, run_config, fresh=False):
+    # A backup is only resumed by the same configuration; anything else starts over
+    config_path = os.path.join(run_dir, 'run.json')
+    if os.path.exists(config_path) and not fresh:
+        with open(config_path, encoding='utf-8') as f:
+            if json.load(f) != run_config:
+                print(f" Checkpoint in {run_dir} is from a different configuration: starting over")
+                fresh = True
+    if fresh and os.path.isdir(run_dir):
+        shutil.rmtree(run_dir)
+    os.makedirs(run_dir, exist_ok=True)
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(run_config, f, indent=2)
+    # BackupAndRestore empties its folder once a run completes
+    backup_dir = os.path.join(run_dir, 'backup')
+    if os.path.isdir(backup_dir) and os.listdir(backup_dir):
+        print(f" Resuming from the last epoch checkpoint in {run_dir}")
+
+
+class ResumableEarlyStopping(tf.keras.callbacks.EarlyStopping):
+    # BackupAndRestore does not restore EarlyStopping's wait/best counters or best weights, so they are
+    # saved in the run dir after every epoch and reloaded when an interrupted run resumes
+    def __init__(self, run_dir, **kwargs):
+        super().__init__(**kwargs)
+        self.state_path = os.path.join(run_dir, 'early_stopping.json')
+        self.weights_path = os.path.join(run_dir, 'early_stopping_best.npz')
+
+    def on_train_begin(self, logs=None):
+        super().on_train_begin(logs)
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        self.wait, self.best, self.best_epoch = state['wait'], state['best'], state['best_epoch']
+        if self.restore_best_weights and os.path.exists(self.weights_path):
+            with np.load(self.weights_path) as weights:
+                self.best_weights = [weights[f'arr_{i}'] for i in range(len(weights.files))]
+
+    def on_epoch_end(self, epoch, logs=None):
+        super().on_epoch_end(epoch, logs)
+        if self.restore_best_weights and self.best_epoch == epoch and self.best_weights is not None:
+            np.savez(self.weights_path, *self.best_weights)
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump({'wait': self.wait, 'best': float(self.best), 'best_epoch': self.best_epoch}, f)
+
+    def on_train_end(self, logs=None):
+        # Like the backup, the state only outlives an interrupted run
+        super().on_train_end(logs)
+        for path in (self.state_path, self.weights_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def training_callbacks(run_dir, monitor='val_accuracy', patience=3, min_delta=0.001):
+    # BackupAndRestore saves weights, optimizer state and epoch after every epoch and restores them
+    # on the next fit() with the same run_dir; the backup is deleted once training finishes.
+    # Early stopping keeps its own state in run_dir (ResumableEarlyStopping).
+    callbacks = [
+        EpochTimer(),
+        tf.keras.callbacks.BackupAndRestore(os.path.join(run_dir, 'backup')),
+        tf.keras.callbacks.CSVLogger(os.path.join(run_dir, 'history.csv'), append=True)
+    ]
+    if patience > 0:
+        callbacks.append(ResumableEarlyStopping(run_dir, monitor=monitor, patience=patience, min_delta=min_delta,
+                                                restore_best_weights=True, verbose=1))
+    return callbacks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the MobileNetV2 fish disease classifier.")
+    parser.add_argument('--epochs', type=int, default=12)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--dense-units', type=int, default=128)
+    parser.add_argument('--dropout', type=float, default=0.3)
+    parser.add_argument('--learning-rate', type=float, default=0.001)
+    parser.add_argument('--cache', default=None,
+                        help="Cache decoded pixels: '' for memory, or a file path prefix.")
+    parser.add_argument('--feature-cache', action='store_true',
+                        help="Compute frozen MobileNetV2 embeddings once and train only the head on them.")
+    parser.add_argument('--feature-augment', type=int, default=0,
+                        help="Number of augmented variants per image to embed in feature-cache mode.")
+    parser.add_argument('--patience', type=int, default=3,
+                        help="Stop after this many epochs without improvement (0 = always run every epoch).")
+    parser.add_argument('--monitor', default='val_accuracy', help="Metric watched by early stopping.")
+    parser.add_argument('--min-delta', type=float, default=0.001, help="Smallest change that counts as improvement.")
+    parser.add_argument('--checkpoint-dir', default=checkpoint_dir,
+                        help="Per-epoch backups; an interrupted run resumes from here.")
+    parser.add_argument('--fresh', action='store_true', help="Ignore any existing checkpoint and start over.")
+    parser.add_argument('--output', default='MobileNetV2.keras', help="Trained model file the app loads.")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="Train and evaluate on one image per duplicate group (see DatasetIntegrity.py).")
+    parser.add_argument('--skip-tflite', action='store_true',
+                        help="Do not write the float16/int8 TFLite exports after training.")
+    parser.add_argument('--calibration-samples', type=int, default=200,
+                        help="Preprocessed images used to calibrate the int8 TFLite export.")
+    add_perf_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = apply_perf_config(perf_config(args))
+    print(f" CPU execution: {describe(config)}")
+    set_seeds(90)
+
+    # === Extract ML.zip ===
+    if not os.path.exists(extract_to):
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(extract_to)
+
+    # === Open packed uint8 shards (memory-mapped) ===
+    data_dir = os.path.join(extract_to, 'normalized_images')
+    dataset = ShardedDataset(data_dir)
+
+    # === Train-test split on indices only, grouped by duplicate (groups.npy from Preprocessing) ===
+    indices = np.arange(len(dataset))
+    if args.dedupe:
+        from DatasetIntegrity import representatives
+        indices = representatives(dataset.groups)
+        print(f" Dedupe: {len(indices)} of {len(dataset)} images kept")
+    train_idx, test_idx = group_split(dataset.labels, dataset.groups, indices)
+
+    # === Streaming input pipeline with parallel data augmentation ===
+    cache = args.cache
+    test_ds = make_dataset(dataset, test_idx, batch_size=args.batch_size,
+                           cache=f"{cache}.test" if cache else cache)
+
+    model = build_mobilenet_model(num_classes=dataset.num_classes, dense_units=args.dense_units,
+                                  dropout=args.dropout, learning_rate=args.learning_rate, jit_compile=config['xla'])
+
+    # === Checkpoints: one folder per training mode, resumed only with the same settings ===
+    mode = 'head' if args.feature_cache else 'full'
+    run_dir = os.path.join(args.checkpoint_dir, mode)
+    prepare_run_dir(run_dir, {
+        'mode': mode, 'images': len(dataset), 'classes': dataset.classes, 'dedupe': args.dedupe,
+        'dense_units': args.dense_units, 'dropout': args.dropout, 'learning_rate': args.learning_rate,
+        'batch_size': args.batch_size, 'feature_augment': args.feature_augment
+    }, args.fresh)
+    callbacks = training_callbacks(run_dir, args.monitor, args.patience, args.min_delta)
+
+    # === Train model ===
+    if args.feature_cache:
+        from FeatureCache import load_or_compute_features, train_head_on_features
+
+        # The backbone is frozen, so its embeddings are computed once and reused
+        features, augmented = load_or_compute_features(
+            feature_cache_dir, model.layers[0], dataset,
+            augment_variants=args.feature_augment, batch_size=args.batch_size
+        )
+        history = train_head_on_features(
+            head_of(model, args.learning_rate, config['xla']), features, augmented, dataset.labels, dataset.num_classes,
+            train_idx, test_idx, epochs=args.epochs, batch_size=args.batch_size, callbacks=callbacks
+        )
+    else:
+        train_ds = make_dataset(dataset, train_idx, batch_size=args.batch_size, training=True, augment=True,
+                                cache=f"{cache}.train" if cache else cache)
+        history = model.fit(
+            train_ds,
+            epochs=args.epochs,
+            validation_data=test_ds,
+            callbacks=callbacks
+        )
+
+    # === Wall-clock time per epoch (also in <checkpoint-dir>/<mode>/history.csv) ===
+    epoch_seconds = history.history.get('epoch_seconds', [])
+    if epoch_seconds:
+        print(f" Trained {len(epoch_seconds)} epochs this run: {sum(epoch_seconds):.1f}s total, "
+              f"{np.mean(epoch_seconds):.1f}s per epoch")
+
+    # === Evaluate ===
+    y_pred_probs = model.predict(test_ds)
+    y_pred = np.argmax(y_pred_probs, axis=1)
+    y_true = dataset.labels[test_idx]
+
+    # === Save model (before the report and plot, so closing or losing the plot window loses nothing) ===
+    model.save(args.output)
+    print(f"Model saved as '{args.output}'")
+
+    # === Inference-only SavedModel next to the .keras file, for fast app start (FINSCAN_MODEL=MobileNetV2_savedmodel) ===
+    from TFLiteExport import export_savedmodel, export_tflite
+    export_savedmodel(model, os.path.splitext(args.output)[0] + '_savedmodel')
+
+    # === Export quantized TFLite models for CPU-only kiosks ===
+    if not args.skip_tflite:
+        export_tflite(model, '.', dataset, num_calibration=args.calibration_samples)
+
+    print("\nClassification Report:")
+    print(classification_report(y_true, y_pred))
+
+    # === Plot accuracy ===
+    plt.plot(history.history['accuracy'], label='Train Accuracy')
+    plt.plot(history.history['val_accuracy'], label='Validation Accuracy')
+    plt.xlabel('Epoch')
+    plt.ylabel('Accuracy')
+    plt.title('Training vs Validation Accuracy')
+    plt.legend()
+    plt.grid(True)
+    plt.show()
 
-    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-    return model
 
-model = build_mobilenet_model()
-
-# === Train model ===
-history = model.fit(
-    datagen.flow(X_train, y_train, batch_size=32),
-    epochs=12,
-    validation_data=(X_test, y_test)
-)
-
-# === Evaluate ===
-y_pred_probs = model.predict(X_test)
-y_pred = np.argmax(y_pred_probs, axis=1)
-y_true = np.argmax(y_test, axis=1)
-
-print("\nClassification Report:")
-print(classification_report(y_true, y_pred))
-
-# === Plot accuracy ===
-plt.plot(history.history['accuracy'], label='Train Accuracy')
-plt.plot(history.history['val_accuracy'], label='Validation Accuracy')
-plt.xlabel('Epoch')
-plt.ylabel('Accuracy')
-plt.title('Training vs Validation Accuracy')
-plt.legend()
-plt.grid(True)
-plt.show()
-
-# === Save model ===
-#model.save('MobileNetV2.keras')
-#print("Model saved as 'MobileNetV2.keras'")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
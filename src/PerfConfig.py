@@ -0,0 +1,95 @@
+import os
+import sys
+
+# --- CPU execution modes shared by training, the app, the inference server and the benchmarks ---
+#   FINSCAN_INTRA_THREADS   threads inside one op (matmul/conv); 0 = TensorFlow default (all cores)
+#   FINSCAN_INTER_THREADS   ops run concurrently; 0 = TensorFlow default
+#   FINSCAN_XLA             1 = XLA JIT-compile the model (training step and predict function)
+#   FINSCAN_ONEDNN          1/0 = force oneDNN kernels on/off (TF_ENABLE_ONEDNN_OPTS); unset = TF default
+#   FINSCAN_DETERMINISTIC   1 = deterministic kernels (slower; reproducible runs beyond seeding)
+# Several app processes on one box should split the cores: FINSCAN_INTRA_THREADS = cores / processes.
+
+
+def env_flag(name, environ=os.environ):
+    value = environ.get(name, '').strip().lower()
+    if value in ('1', 'true', 'on', 'yes'):
+        return True
+    if value in ('0', 'false', 'off', 'no'):
+        return False
+    return None
+
+
+def perf_config(args=None, environ=os.environ):
+    # Environment first, command-line flags (add_perf_args) override
+    config = {
+        'intra_threads': int(environ.get('FINSCAN_INTRA_THREADS', 0)),
+        'inter_threads': int(environ.get('FINSCAN_INTER_THREADS', 0)),
+        'xla': bool(env_flag('FINSCAN_XLA', environ)),
+        'onednn': env_flag('FINSCAN_ONEDNN', environ),
+        'deterministic': bool(env_flag('FINSCAN_DETERMINISTIC', environ))
+    }
+    if args is not None:
+        for key in ('intra_threads', 'inter_threads'):
+            if getattr(args, key, None) is not None:
+                config[key] = getattr(args, key)
+        if getattr(args, 'onednn', None) is not None:
+            config['onednn'] = args.onednn == 'on'
+        config['xla'] = config['xla'] or bool(getattr(args, 'xla', False))
+        config['deterministic'] = config['deterministic'] or bool(getattr(args, 'deterministic', False))
+    return config
+
+
+def add_perf_args(parser):
+    group = parser.add_argument_group('CPU execution (defaults come from FINSCAN_* environment variables)')
+    group.add_argument('--intra-threads', type=int, default=None, help="Threads per op (0 = TensorFlow default).")
+    group.add_argument('--inter-threads', type=int, default=None, help="Concurrent ops (0 = TensorFlow default).")
+    group.add_argument('--xla', action='store_true', help="JIT-compile the model with XLA.")
+    group.add_argument('--onednn', choices=['on', 'off'], default=None, help="Force oneDNN kernels on or off.")
+    group.add_argument('--deterministic', action='store_true', help="Use deterministic kernels.")
+    return parser
+
+
+def set_onednn(enabled):
+    # Read once when TensorFlow is imported, so this must run first
+    if enabled is None:
+        return
+    if 'tensorflow' in sys.modules and os.environ.get('TF_ENABLE_ONEDNN_OPTS') != ('1' if enabled else '0'):
+        print(" Warning: TensorFlow is already imported; set FINSCAN_ONEDNN before starting the process")
+    os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if enabled else '0'
+
+
+def preconfigure(argv=None):
+    # For scripts that import TensorFlow at module level: honour FINSCAN_ONEDNN / --onednn before that import
+    argv = sys.argv[1:] if argv is None else argv
+    enabled = env_flag('FINSCAN_ONEDNN')
+    for i, arg in enumerate(argv):
+        if arg == '--onednn' and i + 1 < len(argv):
+            enabled = argv[i + 1] == 'on'
+        elif arg.startswith('--onednn='):
+            enabled = arg.split('=', 1)[1] == 'on'
+    set_onednn(enabled)
+
+
+def apply_perf_config(config):
+    set_onednn(config['onednn'])
+    import tensorflow as tf
+
+    # Thread pools can only be sized before the runtime starts executing ops
+    try:
+        if config['intra_threads']:
+            tf.config.threading.set_intra_op_parallelism_threads(config['intra_threads'])
+        if config['inter_threads']:
+            tf.config.threading.set_inter_op_parallelism_threads(config['inter_threads'])
+    except RuntimeError as e:
+        print(f" Warning: thread settings ignored, TensorFlow is already running ({e})")
+
+    if config['deterministic']:
+        tf.config.experimental.enable_op_determinism()
+    return config
+
+
+def describe(config):
+    threads = f"intra={config['intra_threads'] or 'default'} inter={config['inter_threads'] or 'default'}"
+    onednn = {None: 'default', True: 'on', False: 'off'}[config['onednn']]
+    return (f"{threads} xla={'on' if config['xla'] else 'off'} onednn={onednn} "
+            f"deterministic={'on' if config['deterministic'] else 'off'}")
@@ -0,0 +1,112 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+
+
+# --- Cache key: decoded, EXIF-corrected pixels (a PIL image or uint8 array) plus the model that scored them ---
+def prediction_key(img, model_version):
+    digest = hashlib.sha256()
+    if isinstance(img, np.ndarray):
+        digest.update(f"{model_version}|{img.dtype}|{'x'.join(map(str, img.shape))}|".encode())
+        digest.update(np.ascontiguousarray(img).tobytes())
+    else:
+        digest.update(f"{model_version}|{img.mode}|{img.size[0]}x{img.size[1]}|".encode())
+        digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def file_version(path):
+    # Content hash of a model artifact (a file or every file under a directory)
+    digest = hashlib.sha256()
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    for p in paths:
+        digest.update(os.path.relpath(p, path).encode())
+        with open(p, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+# --- Bounded, thread-safe LRU of (label, prob, pred), optionally backed by SQLite ---
+class PredictionCache:
+    def __init__(self, max_entries=1024, path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, label TEXT, prob REAL, pred BLOB, used REAL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS predictions_used ON predictions (used)")
+            self.db.commit()
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+            if self.db is not None:
+                row = self.db.execute("SELECT label, prob, pred FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    label, prob, blob = row
+                    value = (label, prob, np.frombuffer(blob, dtype=np.float32).reshape(1, -1))
+                    self.db.execute("UPDATE predictions SET used = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+                    self._remember(key, value)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        label, prob, pred = value
+        pred = np.asarray(pred, dtype=np.float32).reshape(1, -1)
+        value = (label, float(prob), pred)
+        with self.lock:
+            self._remember(key, value)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                                (key, label, float(prob), pred.tobytes(), time.time()))
+                # Keep the disk copy bounded too, dropping the least recently used rows
+                self.puts += 1
+                if self.puts % 256 == 0:
+                    self.db.execute(
+                        "DELETE FROM predictions WHERE key IN ("
+                        "SELECT key FROM predictions ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                        (self.max_disk_entries,)
+                    )
+                self.db.commit()
+        return value
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self.entries)
+            }
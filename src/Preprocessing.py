@@ -1,7 +1,14 @@
 import os
+import json
+import time
+import hashlib
 import numpy as np
 import pandas as pd
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from FishDataset import ShardWriter, write_index, shard_name, PREPROCESSING_VERSION
+from ImagePrep import IMAGE_SIZE, open_image, request_draft, orient, load_pixels
+from DatasetIntegrity import dhash, duplicate_groups
 
 # --- INPUT FOLDER ---
 source_base = r'C:\Users\User\Desktop\MayDegree\sem6\machine learning\Assignment\dataset\SB-FishDisease\SB-FishDisease'
@@ -9,119 +16,309 @@ source_base = r'C:\Users\User\Desktop\MayDegree\sem6\machine learning\Assignment
 # --- OUTPUT FOLDERS ---
 target_base = r'C:\Users\User\Desktop\MayDegree\sem6\machine learning\Assignment\dataset\SB-FishDisease\Extracted'
 normalized_base = r'C:\Users\User\Desktop\MayDegree\sem6\machine learning\Assignment\dataset\SB-FishDisease\normalize_images'
-os.makedirs(target_base, exist_ok=True)
-os.makedirs(normalized_base, exist_ok=True)
 
-# --- CORRUPTED LOG FILE ---
-corrupted_log_path = os.path.join(target_base, 'corrupted_images.txt')
-corrupted_images = []
+# --- SETTINGS ---
+image_size = IMAGE_SIZE
+image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
+num_workers = os.cpu_count() or 1
+# Rewrite a shard once fewer than this fraction of its rows still belong to the dataset
+compact_below = 0.5
 
-# --- For intermediate CSV ---
-csv_rows = []
+# --- MANIFEST: source file -> output artifacts, rewritten after every shard ---
+manifest_name = 'manifest.csv'
+manifest_columns = ['Source Path', 'Size', 'Mtime', 'Sha256', 'Dhash', 'Folder Name', 'Count',
+                    'Image Filename', 'Shard', 'Offset']
 
-# --- Step 1: Preprocess and save resized .jpgs ---
-for folder_name in os.listdir(source_base):
-    source_folder = os.path.join(source_base, folder_name)
-    if not os.path.isdir(source_folder):
-        continue
 
-    target_folder = os.path.join(target_base, folder_name)
-    os.makedirs(target_folder, exist_ok=True)
+def load_manifest(normalized_base):
+    manifest_path = os.path.join(normalized_base, manifest_name)
+    if not os.path.exists(manifest_path):
+        return {}
+    df = pd.read_csv(manifest_path, dtype={'Sha256': str, 'Dhash': str})
+    return {row['Source Path']: row for row in df.to_dict('records')}
 
-    count = 1
-    for file_name in os.listdir(source_folder):
-        file_path = os.path.join(source_folder, file_name)
 
-        # Only handle image files
-        if not file_name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')):
+def save_manifest(normalized_base, manifest):
+    manifest_path = os.path.join(normalized_base, manifest_name)
+    df = pd.DataFrame(list(manifest.values()), columns=manifest_columns)
+    df = df.sort_values(['Folder Name', 'Count'])
+    df.to_csv(manifest_path + '.tmp', index=False)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def built_version(normalized_base):
+    # Preprocessing version the existing shards were written with (None if nothing was built yet)
+    meta_path = os.path.join(normalized_base, 'dataset.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        return json.load(f).get('preprocessing_version', 0)
+
+
+# --- Collect work: only new or modified source images become tasks (all of them when forced) ---
+def collect_tasks(source_base, target_base, manifest, force=False):
+    tasks = []
+    seen = set()
+
+    # Names stay stable: known files keep theirs, new files continue the folder's numbering
+    next_count = {}
+    for entry in manifest.values():
+        folder = entry['Folder Name']
+        next_count[folder] = max(next_count.get(folder, 1), int(entry['Count']) + 1)
+
+    for folder_name in sorted(os.listdir(source_base)):
+        source_folder = os.path.join(source_base, folder_name)
+        if not os.path.isdir(source_folder):
             continue
 
-        try:
-            img = Image.open(file_path).convert('RGB')
-            img = img.resize((224, 224))
+        target_folder = os.path.join(target_base, folder_name)
+        os.makedirs(target_folder, exist_ok=True)
 
-            new_filename = f"{folder_name} ({count}).jpg"
-            save_path = os.path.join(target_folder, new_filename)
-            img.save(save_path, format='JPEG')
+        for file_name in sorted(os.listdir(source_folder)):
+            # Only handle image files
+            if not file_name.lower().endswith(image_extensions):
+                continue
+
+            file_path = os.path.join(source_folder, file_name)
+            source_key = f"{folder_name}/{file_name}"
+            stat = os.stat(file_path)
+            seen.add(source_key)
 
-            relative_path = os.path.relpath(save_path, target_base).replace("\\", "/")
+            # Entries from before the perceptual hash was recorded are decoded once more to get it
+            entry = manifest.get(source_key)
+            hashed = entry is not None and isinstance(entry.get('Dhash'), str)
+            if not force and hashed and entry['Size'] == stat.st_size and entry['Mtime'] == stat.st_mtime_ns:
+                continue
 
-            csv_rows.append({
+            if entry is not None:
+                count = int(entry['Count'])
+                known_hash = None if force or not hashed else entry['Sha256']
+            else:
+                count = next_count.get(folder_name, 1)
+                next_count[folder_name] = count + 1
+                known_hash = None
+
+            new_filename = f"{folder_name} ({count}).jpg"
+            tasks.append({
+                'Source Key': source_key,
                 'Folder Name': folder_name,
+                'Count': count,
                 'Image Filename': new_filename,
-                'Image Path': relative_path
+                'Source Path': file_path,
+                'Save Path': os.path.join(target_folder, new_filename),
+                'Size': stat.st_size,
+                'Mtime': stat.st_mtime_ns,
+                'Known Hash': known_hash
             })
 
-            count += 1
+    deleted = [key for key in manifest if key not in seen]
+    return tasks, deleted
 
-        except Exception as e:
-            error_message = f"{file_path} | Reason: {e}"
-            print(f" Failed to process: {error_message}")
-            corrupted_images.append(error_message)
 
-# --- Save intermediate CSV ---
-csv_path = os.path.join(target_base, 'image_index.csv')
-df = pd.DataFrame(csv_rows)
-df.to_csv(csv_path, index=False)
+# --- Worker: hash, decode (ImagePrep, same as serving), resize and save .jpg in one pass ---
+def process_image(task):
+    try:
+        with open(task['Source Path'], 'rb') as f:
+            data = f.read()
+        sha256 = hashlib.sha256(data).hexdigest()
 
-if corrupted_images:
-    with open(corrupted_log_path, 'w', encoding='utf-8') as f:
-        for item in corrupted_images:
-            f.write(item + '\n')
-    print(f"\n {len(corrupted_images)} corrupted images logged to: {corrupted_log_path}")
-else:
-    print("\n No corrupted images found.")
+        # Touched but identical content: keep the existing artifacts
+        if sha256 == task['Known Hash']:
+            return None, sha256, None, None
 
-print(f"\n STEP 1 DONE: {len(csv_rows)} images processed, resized, and saved to: {target_base}")
-print(f" CSV saved to: {csv_path}")
+        # Duplicate hash on the decoded, EXIF-oriented source (as DatasetIntegrity.scan_file), not the resized copy
+        with open_image(data) as source:
+            img = orient(request_draft(source, image_size))
+            image_hash = f'{dhash(img):016x}'
+            # Keep raw uint8 pixels; normalization happens at batch time
+            pixels = load_pixels(img, image_size)
+        Image.fromarray(pixels).save(task['Save Path'], format='JPEG')
+        return None, sha256, image_hash, pixels
 
-# --- Step 2: Normalize pixels and one-hot encode labels ---
+    except Exception as e:
+        return f"{task['Source Path']} | Reason: {e}", None, None, None
 
-# Reload the CSV just to be sure
-df = pd.read_csv(csv_path)
 
-# Unique class names
-classes = sorted(df['Folder Name'].unique())
-class_to_index = {label: i for i, label in enumerate(classes)}
-num_classes = len(classes)
+# --- Compaction: live rows of mostly-dead shards move to new shards, the old ones are then unreferenced ---
+def compact_shards(normalized_base, manifest, first_shard, threshold=compact_below):
+    live = {}
+    for entry in manifest.values():
+        live.setdefault(int(entry['Shard']), []).append(entry)
+    sparse = [shard_id for shard_id, entries in sorted(live.items())
+              if len(entries) < threshold * len(np.load(os.path.join(normalized_base, shard_name(shard_id)), mmap_mode='r'))]
+    if not sparse:
+        return first_shard, 0
 
-rows = []
-for _, row in df.iterrows():
-    try:
-        label = row['Folder Name']
-        filename = row['Image Filename']
-        image_path = os.path.join(target_base, row['Image Path'].replace('/', '\\'))
-
-        # Load and normalize
-        img = Image.open(image_path).convert('RGB')
-        img_array = np.asarray(img) / 255.0  # normalize to [0, 1]
-
-        # Save as .npy
-        base_name = os.path.splitext(filename)[0]
-        npy_filename = base_name + '.npy'
-        npy_path = os.path.join(normalized_base, npy_filename)
-        np.save(npy_path, img_array)
-
-        # One-hot encoding
-        label_index = class_to_index[label]
-        one_hot = [0] * num_classes
-        one_hot[label_index] = 1
+    pending_moves = []
+
+    def commit_shard(shard_id):
+        # Same rule as new images: entries point at the new shard only once it is on disk
+        for entry, (new_shard, new_offset) in pending_moves:
+            entry['Shard'], entry['Offset'] = new_shard, new_offset
+        pending_moves.clear()
+        save_manifest(normalized_base, manifest)
+
+    writer = ShardWriter(normalized_base, first_shard=first_shard, on_flush=commit_shard)
+    for shard_id in sparse:
+        shard = np.load(os.path.join(normalized_base, shard_name(shard_id)), mmap_mode='r')
+        for entry in sorted(live[shard_id], key=lambda e: int(e['Offset'])):
+            pending_moves.append((entry, writer.next_location()))
+            writer.add(np.array(shard[int(entry['Offset'])]))
+        del shard
+    writer.close()
+    moved = sum(len(live[shard_id]) for shard_id in sparse)
+    print(f" Compacted {len(sparse)} shards: {moved} live images moved to new shards")
+    return writer.shard_id, moved
+
+
+def run_preprocessing(source_base, target_base, normalized_base, workers=num_workers):
+    os.makedirs(target_base, exist_ok=True)
+    os.makedirs(normalized_base, exist_ok=True)
+
+    start = time.perf_counter()
+    manifest = load_manifest(normalized_base)
+
+    # Shards written by an older decode/resize would not match what serving feeds the model.
+    # No dataset.json yet means an interrupted first build: its committed shards are current.
+    built = built_version(normalized_base)
+    force = bool(manifest) and built is not None and built != PREPROCESSING_VERSION
+    if force:
+        print(f" Preprocessing version changed (now {PREPROCESSING_VERSION}): reprocessing every image")
+    tasks, deleted = collect_tasks(source_base, target_base, manifest, force)
 
-        # Save row
-        row_data = {
-            'filename': npy_filename,
+    # --- Drop images that disappeared from the source tree ---
+    for key in deleted:
+        entry = manifest.pop(key)
+        stale_jpg = os.path.join(target_base, entry['Folder Name'], entry['Image Filename'])
+        if os.path.exists(stale_jpg):
+            os.remove(stale_jpg)
+
+    # --- New pixels always go to fresh shards; existing shards are only rewritten by compact_shards ---
+    first_shard = max((int(entry['Shard']) + 1 for entry in manifest.values()), default=0)
+    pending_entries = []
+
+    def commit_shard(shard_id):
+        # Entries become visible only once their shard is safely on disk
+        for entry in pending_entries:
+            manifest[entry['Source Path']] = entry
+        pending_entries.clear()
+        save_manifest(normalized_base, manifest)
+
+    writer = ShardWriter(normalized_base, first_shard=first_shard, on_flush=commit_shard)
+    corrupted_images = []
+    processed = 0
+
+    # --- Decode and resize across a process pool, pack pixels into shards ---
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for task, (error, sha256, image_hash, img_array) in zip(tasks, executor.map(process_image, tasks, chunksize=32)):
+            if error is not None:
+                print(f" Failed to process: {error}")
+                corrupted_images.append(error)
+                continue
+
+            if img_array is None:
+                entry = manifest[task['Source Key']]
+                entry['Size'] = task['Size']
+                entry['Mtime'] = task['Mtime']
+                continue
+
+            # Record the entry before add(), which may flush and commit this shard
+            shard_id, offset = writer.next_location()
+            pending_entries.append({
+                'Source Path': task['Source Key'],
+                'Size': task['Size'],
+                'Mtime': task['Mtime'],
+                'Sha256': sha256,
+                'Dhash': image_hash,
+                'Folder Name': task['Folder Name'],
+                'Count': task['Count'],
+                'Image Filename': task['Image Filename'],
+                'Shard': shard_id,
+                'Offset': offset
+            })
+            writer.add(img_array)
+            processed += 1
+
+    writer.close()
+    save_manifest(normalized_base, manifest)
+    next_shard, compacted = compact_shards(normalized_base, manifest, writer.shard_id)
+
+    # --- Remove shards no longer referenced by any manifest entry ---
+    live_shards = {int(entry['Shard']) for entry in manifest.values()}
+    for shard_id in range(next_shard):
+        shard_path = os.path.join(normalized_base, shard_name(shard_id))
+        if shard_id not in live_shards and os.path.exists(shard_path):
+            os.remove(shard_path)
+
+    # --- Rebuild index and CSVs from the manifest ---
+    entries = sorted(manifest.values(), key=lambda e: (e['Folder Name'], int(e['Count'])))
+    classes = sorted({entry['Folder Name'] for entry in entries})
+    class_to_index = {label: i for i, label in enumerate(classes)}
+    num_classes = len(classes)
+
+    locations = [(int(entry['Shard']), int(entry['Offset'])) for entry in entries]
+    labels = [class_to_index[entry['Folder Name']] for entry in entries]
+
+    # Exact copies and near-duplicate shots share a group, so the training split keeps them on one side
+    groups = duplicate_groups([int(entry['Dhash'], 16) for entry in entries], [entry['Sha256'] for entry in entries])
+    write_index(normalized_base, locations, labels, classes, groups)
+    elapsed = time.perf_counter() - start
+
+    # --- Save image index CSV ---
+    csv_path = os.path.join(target_base, 'image_index.csv')
+    csv_rows = [{
+        'Folder Name': entry['Folder Name'],
+        'Image Filename': entry['Image Filename'],
+        'Image Path': f"{entry['Folder Name']}/{entry['Image Filename']}"
+    } for entry in entries]
+    df = pd.DataFrame(csv_rows, columns=['Folder Name', 'Image Filename', 'Image Path'])
+    df.to_csv(csv_path, index=False)
+
+    # --- Save corrupted log file ---
+    corrupted_log_path = os.path.join(target_base, 'corrupted_images.txt')
+    if corrupted_images:
+        with open(corrupted_log_path, 'w', encoding='utf-8') as f:
+            for item in corrupted_images:
+                f.write(item + '\n')
+        print(f"\n {len(corrupted_images)} corrupted images logged to: {corrupted_log_path}")
+    else:
+        print("\n No corrupted images found.")
+
+    # --- One-hot encode labels (row order matches labels.npy / index.npy) ---
+    rows = []
+    for entry in entries:
+        label = entry['Folder Name']
+        one_hot = [0] * num_classes
+        one_hot[class_to_index[label]] = 1
+        rows.append({
+            'filename': entry['Image Filename'],
             'label': label,
             **{f'class_{i}': one_hot[i] for i in range(num_classes)}
-        }
-        rows.append(row_data)
+        })
 
-    except Exception as e:
-        print(f" Error processing {row['Image Path']}: {e}")
+    # Save final CSV
+    final_df = pd.DataFrame(rows)
+    output_csv_path = os.path.join(normalized_base, 'normalized_labels.csv')
+    final_df.to_csv(output_csv_path, index=False)
+
+    rate = len(tasks) / elapsed if elapsed > 0 else 0.0
+    print(f"\n DONE: {processed} new or changed, {len(deleted)} removed, {len(entries)} images in dataset")
+    sizes = np.bincount(groups) if len(groups) else np.zeros(1, dtype=np.int64)
+    print(f" {len(entries) - len(sizes)} exact or near-duplicate images grouped with another (groups.npy), "
+          f"largest group {int(sizes.max())} images")
+    # One group holding a big share of the data means near-duplicates chained together; the split suffers
+    if len(entries) and sizes.max() > max(10, 0.05 * len(entries)):
+        print(f" Warning: the largest duplicate group has {int(sizes.max())} of {len(entries)} images; "
+              f"check it with DatasetIntegrity.py before training")
+    print(f" Resized images saved to: {target_base}")
+    print(f" Packed uint8 shards saved to: {normalized_base}")
+    print(f" CSV saved to: {csv_path}")
+    print(f" One-hot encoded CSV saved to: {output_csv_path}")
+    print(f" Throughput: {rate:.1f} images/sec with {workers} workers ({elapsed:.1f}s)")
+
+    return {'images': len(tasks), 'processed': processed, 'removed': len(deleted), 'compacted': compacted,
+            'total': len(entries), 'seconds': elapsed, 'images_per_sec': rate}
 
-# Save final CSV
-final_df = pd.DataFrame(rows)
-output_csv_path = os.path.join(normalized_base, 'normalized_labels.csv')
-final_df.to_csv(output_csv_path, index=False)
 
-print(f"\n STEP 2 DONE: Normalized .npy files saved to: {normalized_base}")
-print(f" One-hot encoded CSV saved to: {output_csv_path}")
+if __name__ == "__main__":
+    run_preprocessing(source_base, target_base, normalized_base)
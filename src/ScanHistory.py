@@ -0,0 +1,217 @@
+import time
+import queue
+import atexit
+import sqlite3
+import hashlib
+import argparse
+import threading
+import numpy as np
+from datetime import date, datetime, timedelta
+from Metrics import metrics
+
+# --- Layout ---
+#   scans          one row per scan; (day, label) and (tank, day, label) indexes cover the count queries
+#   daily_counts   rollup of scans older than the retention window (compact), same counts, no raw rows
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS scans ("
+    "id INTEGER PRIMARY KEY, ts REAL NOT NULL, day TEXT NOT NULL, tank TEXT NOT NULL DEFAULT '', "
+    "source TEXT NOT NULL DEFAULT 'app', label TEXT NOT NULL, prob REAL NOT NULL, pred BLOB, "
+    "image_hash TEXT, model_version TEXT)",
+    "CREATE INDEX IF NOT EXISTS scans_day_label ON scans (day, label)",
+    "CREATE INDEX IF NOT EXISTS scans_tank_day_label ON scans (tank, day, label)",
+    "CREATE TABLE IF NOT EXISTS daily_counts ("
+    "day TEXT NOT NULL, tank TEXT NOT NULL, label TEXT NOT NULL, scans INTEGER NOT NULL, prob_sum REAL NOT NULL, "
+    "PRIMARY KEY (day, tank, label)) WITHOUT ROWID"
+]
+
+
+def connect(path):
+    # WAL: readers (dashboards, the CLI) never block the writer thread
+    db = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    for statement in SCHEMA:
+        db.execute(statement)
+    db.commit()
+    return db
+
+
+def image_hash(pixels):
+    return hashlib.sha256(np.ascontiguousarray(pixels).tobytes()).hexdigest()[:16]
+
+
+def day_of(ts):
+    # Local calendar day, so "per day" matches the farm's clock
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d')
+
+
+# How often a waiting writer thread checks whether close() was called
+STOP_POLL_SECONDS = 0.1
+
+
+# --- Persistent scan history; record() only enqueues, a background thread writes in batches ---
+class ScanHistory:
+    def __init__(self, path, batch_size=256, flush_seconds=1.0, queue_size=10000, keep_days=None,
+                 compact_every_seconds=3600.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.keep_days = keep_days
+        self.compact_every = compact_every_seconds
+        self.rows = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.counts = {'queued': 0, 'written': 0, 'failed': 0, 'dropped': 0, 'batches': 0, 'compacted': 0}
+        self.db = connect(path)
+        self.stopping = threading.Event()
+        self.writer = threading.Thread(target=self._run, name='scan-history', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def record(self, label, prob, pred=None, image_hash=None, model_version=None, tank='', source='app', ts=None):
+        # Never blocks the scan: a full queue drops the row and counts it
+        ts = time.time() if ts is None else ts
+        pred = None if pred is None else np.asarray(pred, dtype=np.float32).ravel().tobytes()
+        row = (ts, day_of(ts), tank or '', source, label, float(prob), pred, image_hash, model_version)
+        try:
+            self.rows.put_nowait(row)
+        except queue.Full:
+            with self.lock:
+                self.counts['dropped'] += 1
+            metrics.count('history_dropped')
+            return False
+        with self.lock:
+            self.counts['queued'] += 1
+        return True
+
+    def _collect(self):
+        # Up to batch_size rows, waiting at most flush_seconds after the first one. Waits in short
+        # steps, so close() never sits out a long flush_seconds before the last rows are written.
+        try:
+            batch = [self.rows.get(timeout=min(self.flush_seconds, STOP_POLL_SECONDS))]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.rows.get(timeout=min(remaining, STOP_POLL_SECONDS)))
+            except queue.Empty:
+                if self.stopping.is_set():
+                    break
+        return batch
+
+    def _write(self, batch):
+        with metrics.timer('history_flush'):
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO scans (ts, day, tank, source, label, prob, pred, image_hash, model_version) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        with self.lock:
+            self.counts['written'] += len(batch)
+            self.counts['batches'] += 1
+
+    def _run(self):
+        next_compact = time.monotonic()
+        while not (self.stopping.is_set() and self.rows.empty()):
+            batch = self._collect()
+            if batch:
+                try:
+                    self._write(batch)
+                except sqlite3.Error as e:
+                    with self.lock:
+                        self.counts['failed'] += len(batch)
+                    print(f" Warning: scan history write failed, {len(batch)} rows lost ({e})")
+            if self.keep_days is not None and time.monotonic() >= next_compact:
+                next_compact = time.monotonic() + self.compact_every
+                try:
+                    self.compact(self.keep_days)
+                except sqlite3.Error as e:
+                    print(f" Warning: scan history compaction failed ({e})")
+
+    # --- Retention: roll raw rows older than keep_days into daily_counts, then delete them ---
+    def compact(self, keep_days):
+        cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+        with self.db:
+            self.db.execute(
+                "INSERT INTO daily_counts (day, tank, label, scans, prob_sum) "
+                "SELECT day, tank, label, COUNT(*), SUM(prob) FROM scans WHERE day < ? GROUP BY day, tank, label "
+                "ON CONFLICT (day, tank, label) DO UPDATE SET "
+                "scans = scans + excluded.scans, prob_sum = prob_sum + excluded.prob_sum", (cutoff,))
+            deleted = self.db.execute("DELETE FROM scans WHERE day < ?", (cutoff,)).rowcount
+        with self.lock:
+            self.counts['compacted'] += deleted
+        return deleted
+
+    def flush(self, timeout=10.0):
+        # Wait until everything recorded so far is on disk
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if self.counts['written'] + self.counts['failed'] >= self.counts['queued']:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def close(self, timeout=5.0):
+        self.stopping.set()
+        self.writer.join(timeout)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counts, 'pending': self.rows.qsize()}
+
+
+# --- Queries (own connection, so they can run from any thread or process) ---
+def disease_counts(path, start_day=None, end_day=None, tank=None):
+    # {(day, label): scans}, raw rows plus compacted rollups; tank=None sums every tank
+    start_day = start_day or '0000-00-00'
+    end_day = end_day or '9999-99-99'
+    where, params = "day BETWEEN ? AND ?", [start_day, end_day]
+    if tank is not None:
+        where, params = "tank = ? AND " + where, [tank] + params
+    db = connect(path)
+    try:
+        rows = db.execute(
+            f"SELECT day, label, SUM(n) FROM ("
+            f"SELECT day, label, COUNT(*) AS n FROM scans WHERE {where} GROUP BY day, label "
+            f"UNION ALL SELECT day, label, SUM(scans) FROM daily_counts WHERE {where} GROUP BY day, label"
+            f") GROUP BY day, label ORDER BY day, label", params + params).fetchall()
+    finally:
+        db.close()
+    return {(day, label): int(n) for day, label, n in rows}
+
+
+def print_counts(counts):
+    if not counts:
+        print(" No scans in this period.")
+        return
+    labels = sorted({label for _, label in counts})
+    days = sorted({day for day, _ in counts})
+    print(f"\n {'day':<12}" + ''.join(f"{label[:22]:>24}" for label in labels))
+    for day in days:
+        print(f" {day:<12}" + ''.join(f"{counts.get((day, label), 0):>24}" for label in labels))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query and maintain the scan history database.")
+    parser.add_argument('path', nargs='?', default='scan_history.db')
+    parser.add_argument('--days', type=int, default=30, help="Show counts for the last N days.")
+    parser.add_argument('--tank', default=None, help="Only this tank ('' = scans from the app).")
+    parser.add_argument('--compact', type=int, default=None, metavar='KEEP_DAYS',
+                        help="Roll rows older than KEEP_DAYS into daily counts and delete them.")
+    parser.add_argument('--vacuum', action='store_true', help="Return the space freed by compaction to the disk.")
+    args = parser.parse_args()
+
+    if args.compact is not None:
+        history = ScanHistory(args.path)
+        print(f" Compacted {history.compact(args.compact)} rows older than {args.compact} days")
+        history.close()
+    if args.vacuum:
+        db = connect(args.path)
+        db.execute("VACUUM")
+        db.close()
+
+    start = (date.today() - timedelta(days=args.days - 1)).isoformat()
+    print_counts(disease_counts(args.path, start, tank=args.tank))
@@ -0,0 +1,106 @@
+import io
+import time
+import threading
+from collections import OrderedDict
+from FishInference import IMAGE_SIZE, resize_pixels
+
+THUMBNAIL_SIZE = (480, 480)
+THUMBNAIL_QUALITY = 80
+MIN_THUMBNAIL_QUALITY = 35
+
+
+# --- What a session keeps of an upload: the 224x224 model input and a JPEG thumbnail ---
+class CompactImage:
+    def __init__(self, pixels, thumbnail):
+        self.pixels = pixels
+        self.thumbnail = thumbnail
+
+    @property
+    def nbytes(self):
+        return self.pixels.nbytes + len(self.thumbnail)
+
+
+def encode_thumbnail(img, max_bytes, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    # img is already EXIF-corrected RGB; lower the quality, then the size, until it fits max_bytes
+    scale = min(1.0, size[0] / img.width, size[1] / img.height)
+    width, height = max(1, round(img.width * scale)), max(1, round(img.height * scale))
+    thumb = img.resize((width, height), reducing_gap=2.0)
+    while True:
+        buffer = io.BytesIO()
+        thumb.save(buffer, format='JPEG', quality=quality, optimize=True)
+        data = buffer.getvalue()
+        if len(data) <= max_bytes or (quality <= MIN_THUMBNAIL_QUALITY and min(thumb.size) <= 32):
+            return data
+        if quality > MIN_THUMBNAIL_QUALITY:
+            quality = max(MIN_THUMBNAIL_QUALITY, quality - 15)
+        else:
+            thumb = thumb.resize((max(1, thumb.width // 2), max(1, thumb.height // 2)))
+
+
+def compact_image(img, thumbnail_budget):
+    return CompactImage(resize_pixels(img), encode_thumbnail(img, thumbnail_budget))
+
+
+# --- Process-wide store: per-session budget, global budget, idle sessions evicted first ---
+class SessionImageStore:
+    def __init__(self, session_budget=512 * 1024, global_budget=256 * 1024 * 1024, idle_seconds=1800):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.idle_seconds = idle_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.total = 0
+        self.evicted = 0
+
+    @property
+    def thumbnail_budget(self):
+        # The model input has a fixed size; whatever is left of the session budget goes to the thumbnail
+        return max(4096, self.session_budget - IMAGE_SIZE[0] * IMAGE_SIZE[1] * 3)
+
+    def _drop(self, session_id):
+        compact, _ = self.entries.pop(session_id)
+        self.total -= compact.nbytes
+
+    def _evict(self, now):
+        # entries are kept in last-used order, so idle sessions sit at the front
+        while self.entries:
+            session_id, (compact, used) = next(iter(self.entries.items()))
+            if now - used <= self.idle_seconds and self.total <= self.global_budget:
+                break
+            self._drop(session_id)
+            self.evicted += 1
+
+    def put(self, session_id, compact):
+        now = time.time()
+        with self.lock:
+            if session_id in self.entries:
+                self._drop(session_id)
+            self.entries[session_id] = (compact, now)
+            self.total += compact.nbytes
+            self._evict(now)
+        return compact
+
+    def get(self, session_id):
+        now = time.time()
+        with self.lock:
+            self._evict(now)
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return None
+            self.entries[session_id] = (entry[0], now)
+            self.entries.move_to_end(session_id)
+            return entry[0]
+
+    def discard(self, session_id):
+        with self.lock:
+            if session_id in self.entries:
+                self._drop(session_id)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sessions': len(self.entries),
+                'bytes': self.total,
+                'global_budget': self.global_budget,
+                'evicted': self.evicted
+            }
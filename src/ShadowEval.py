@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import queue
+import random
+import argparse
+import threading
+import collections
+import numpy as np
+from PIL import Image
+from FishInference import MODEL_PATH, labels_list, pixels_to_batch, image_to_pixels, load_backend
+from Metrics import metrics
+from Timing import latency_stats
+
+# Latencies kept per model for the percentiles in stats()
+LATENCY_WINDOW = 1000
+
+
+def parse_candidates(spec):
+    # "name=path,path2" -> {name: path}; a bare path is named after its file
+    candidates = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, path = item.partition('=') if '=' in item else (os.path.basename(item.rstrip('/\\')), '', item)
+        candidates[name] = path
+    return candidates
+
+
+class Candidate:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.backend = None
+        self.error = None
+        self.compared = 0
+        self.agreed = 0
+        self.delta_sum = 0.0
+        self.abs_delta_sum = 0.0
+        self.disagreements = collections.Counter()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def compare(self, production_pred, pred, seconds):
+        production, candidate = int(np.argmax(production_pred)), int(np.argmax(pred))
+        delta = float(np.max(pred)) - float(np.max(production_pred))
+        self.compared += 1
+        self.agreed += production == candidate
+        self.delta_sum += delta
+        self.abs_delta_sum += abs(delta)
+        if production != candidate:
+            self.disagreements[f'{labels_list[production]} -> {labels_list[candidate]}'] += 1
+        self.latencies.append(seconds * 1000.0)
+
+    def stats(self, production_p50):
+        if self.error is not None:
+            return {'state': 'failed', 'artifact': self.path, 'error': self.error}
+        if self.backend is None:
+            return {'state': 'loading', 'artifact': self.path}
+        n = self.compared
+        result = {'state': 'ready', 'artifact': self.path, 'compared': n,
+                  'agreement': self.agreed / n if n else None,
+                  # Candidate top-1 confidence minus production's, on the same images
+                  'mean_confidence_delta': self.delta_sum / n if n else None,
+                  'mean_abs_confidence_delta': self.abs_delta_sum / n if n else None,
+                  'top_disagreements': dict(self.disagreements.most_common(5))}
+        if self.latencies:
+            result['latency'] = latency_stats(list(self.latencies))
+            if production_p50:
+                result['speedup_p50'] = production_p50 / result['latency']['p50_ms']
+        return result
+
+
+# --- Shadow evaluation: candidates see the same images as production, off the request path ---
+# submit() only enqueues; one worker thread loads the candidates and runs them on each queued image.
+# The user always gets the production answer. When the worker falls behind, images are dropped
+# (counted) instead of queued without bound, so shadow models never add to scan latency.
+class ShadowEvaluator:
+    def __init__(self, candidates, queue_size=64, sample=1.0, num_threads=None):
+        self.candidates = [Candidate(name, path) for name, path in candidates.items()]
+        self.sample = sample
+        self.num_threads = num_threads
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.production_latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        threading.Thread(target=self._run, name='shadow-eval', daemon=True).start()
+
+    def submit(self, pixels, production_pred, production_seconds):
+        if self.sample < 1.0 and random.random() >= self.sample:
+            return False
+        try:
+            self.jobs.put_nowait((pixels, np.asarray(production_pred).ravel(), production_seconds))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            metrics.count('shadow_dropped')
+            return False
+        return True
+
+    def _load(self):
+        for candidate in self.candidates:
+            try:
+                backend = load_backend(candidate.path, self.num_threads)
+            except Exception as e:
+                candidate.error = repr(e)
+                print(f" Warning: shadow model {candidate.name} failed to load ({e})")
+                continue
+            with self.lock:
+                candidate.backend = backend
+
+    def _run(self):
+        self._load()
+        while True:
+            pixels, production_pred, production_seconds = self.jobs.get()
+            batch = pixels_to_batch(pixels)
+            for candidate in self.candidates:
+                if candidate.backend is None:
+                    continue
+                start = time.perf_counter()
+                try:
+                    pred = candidate.backend.predict(batch)
+                except Exception as e:
+                    metrics.count('shadow_errors')
+                    print(f" Warning: shadow model {candidate.name} failed ({e})")
+                    continue
+                seconds = time.perf_counter() - start
+                with self.lock:
+                    candidate.compare(production_pred, np.asarray(pred).ravel(), seconds)
+            with self.lock:
+                self.production_latencies.append(production_seconds * 1000.0)
+            metrics.count('shadow_compared')
+            self.jobs.task_done()
+
+    def wait(self, timeout=60.0):
+        # Until every candidate has loaded (or failed) and the queue is empty
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            loaded = all(c.backend is not None or c.error is not None for c in self.candidates)
+            if loaded and self.jobs.unfinished_tasks == 0:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def stats(self):
+        with self.lock:
+            production = latency_stats(list(self.production_latencies)) if self.production_latencies else None
+            p50 = production['p50_ms'] if production else None
+            return {'pending': self.jobs.qsize(), 'dropped': self.dropped, 'sample': self.sample,
+                    'production_latency': production,
+                    'candidates': {c.name: c.stats(p50) for c in self.candidates}}
+
+
+def shadow_from_env():
+    # FINSCAN_SHADOW_MODELS="int8=MobileNetV2_int8.tflite,small=students/MobileNetV2_a0.50_160.keras"
+    candidates = parse_candidates(os.environ.get('FINSCAN_SHADOW_MODELS'))
+    if not candidates:
+        return None
+    threads = os.environ.get('FINSCAN_SHADOW_THREADS')
+    return ShadowEvaluator(candidates, queue_size=int(os.environ.get('FINSCAN_SHADOW_QUEUE', 64)),
+                           sample=float(os.environ.get('FINSCAN_SHADOW_SAMPLE', 1.0)),
+                           num_threads=int(threads) if threads else None)
+
+
+if __name__ == "__main__":
+    # Only the replay CLI needs the dataset tools
+    from DatasetIntegrity import collect_files
+
+    parser = argparse.ArgumentParser(description="Replay a folder of photos through production and candidate models.")
+    parser.add_argument('images', help="Folder of photos (searched recursively).")
+    parser.add_argument('candidates', nargs='+', help="name=path or path of a .keras, SavedModel or .tflite model.")
+    parser.add_argument('--model', default=MODEL_PATH, help="Production model.")
+    parser.add_argument('--threads', type=int, default=None, help="TFLite interpreter threads.")
+    parser.add_argument('--output', default=None, help="Write the comparison as JSON to this path.")
+    args = parser.parse_args()
+
+    production = load_backend(args.model, args.threads)
+    files = collect_files(args.images)
+    shadow = ShadowEvaluator(parse_candidates(','.join(args.candidates)), num_threads=args.threads)
+    shadow.wait(timeout=600.0)
+    for path in files:
+        with Image.open(path) as img:
+            pixels = image_to_pixels(img)
+        start = time.perf_counter()
+        pred = production.predict(pixels_to_batch(pixels))
+        shadow.submit(pixels, pred, time.perf_counter() - start)
+        # One photo at a time, so production and candidates are not timed while competing for the CPU
+        shadow.jobs.join()
+
+    stats = shadow.stats()
+    print(f"\n {len(files)} photos, production p50 "
+          f"{stats['production_latency']['p50_ms'] if stats['production_latency'] else 0:.2f} ms")
+    print(f" {'candidate':<24}{'agree':>8}{'conf delta':>12}{'p50 ms':>9}{'p95 ms':>9}{'speedup':>9}")
+    for name, s in stats['candidates'].items():
+        if s['state'] != 'ready' or not s['compared']:
+            print(f" {name:<24}  {s['state']} {s.get('error', '')}")
+            continue
+        print(f" {name:<24}{s['agreement']:>8.3f}{s['mean_confidence_delta']:>+12.3f}{s['latency']['p50_ms']:>9.2f}"
+              f"{s['latency']['p95_ms']:>9.2f}{s.get('speedup_p50', 0):>9.2f}")
+        for pair, n in s['top_disagreements'].items():
+            print(f"   {n:>5}  {pair}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2)
+        print(f" Report saved to: {args.output}")
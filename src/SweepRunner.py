@@ -0,0 +1,190 @@
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.model_selection import StratifiedGroupKFold
+
+# === Settings ===
+data_dir = os.path.join("ML", "normalized_images")
+feature_cache_dir = "feature_cache"
+
+# === Head hyperparameters searched by default (ModelSelectionFinal uses 128 / 0.3 / 0.001 / 32 / 12) ===
+search_space = {
+    'dense_units': [64, 128, 256],
+    'dropout': [0.2, 0.3, 0.5],
+    'learning_rate': [0.001, 0.0003],
+    'batch_size': [32, 64],
+    'epochs': [12]
+}
+
+
+def grid_configs(space):
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+
+
+def random_configs(space, trials, seed=90):
+    # Sample distinct grid points; falls back to the full grid when it is smaller than trials
+    grid = grid_configs(space)
+    if trials >= len(grid):
+        return grid
+    return random.Random(seed).sample(grid, trials)
+
+
+# === Worker process: one fold of one configuration on cached backbone features ===
+_worker = {}
+
+
+def init_worker(entry_dir, labels, num_classes, threads, seed):
+    # Runs before any TF op in this process, so the thread pools are created at this size
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    from FeatureCache import load_features
+    features, augmented = load_features(entry_dir)
+    _worker.update(features=features, augmented=augmented, labels=labels, num_classes=num_classes, seed=seed)
+
+
+def run_fold(trial, fold, config, train_idx, val_idx):
+    from ModelSelectionFinal import build_head, set_seeds
+    from FeatureCache import train_head_on_features
+
+    set_seeds(_worker['seed'] + fold)
+    features = _worker['features']
+    head = build_head(features.shape[1], _worker['num_classes'], config['dense_units'], config['dropout'],
+                      config['learning_rate'])
+    start = time.perf_counter()
+    history = train_head_on_features(head, features, _worker['augmented'], _worker['labels'], _worker['num_classes'],
+                                     train_idx, val_idx, epochs=config['epochs'], batch_size=config['batch_size'],
+                                     seed=_worker['seed'] + fold, verbose=0)
+    return {
+        'trial': trial,
+        'fold': fold,
+        'val_accuracy': float(history.history['val_accuracy'][-1]),
+        'best_val_accuracy': float(max(history.history['val_accuracy'])),
+        'val_loss': float(history.history['val_loss'][-1]),
+        'seconds': time.perf_counter() - start
+    }
+
+
+# === Aggregate folds into one row per configuration ===
+def summarize(configs, fold_results):
+    rows = []
+    for trial, config in enumerate(configs):
+        folds = [r for r in fold_results if r['trial'] == trial]
+        if not folds:
+            continue
+        acc = np.array([r['val_accuracy'] for r in folds])
+        rows.append({
+            'trial': trial,
+            **config,
+            'folds': len(folds),
+            'cv_accuracy_mean': float(acc.mean()),
+            'cv_accuracy_std': float(acc.std()),
+            'cv_best_accuracy_mean': float(np.mean([r['best_val_accuracy'] for r in folds])),
+            'cv_loss_mean': float(np.mean([r['val_loss'] for r in folds])),
+            'fold_seconds_mean': float(np.mean([r['seconds'] for r in folds])),
+            'trial_seconds': float(np.sum([r['seconds'] for r in folds]))
+        })
+    return rows
+
+
+def write_results(path, rows, sort_by='cv_accuracy_mean'):
+    # Accuracy columns sort best-first descending; losses, spreads and timings ascending
+    ascending = 'loss' in sort_by or 'seconds' in sort_by or sort_by.endswith('_std')
+    rows = sorted(rows, key=lambda r: r[sort_by], reverse=not ascending)
+    for rank, row in enumerate(rows, start=1):
+        row['rank'] = rank
+    fields = ['rank'] + [k for k in rows[0] if k != 'rank'] if rows else ['rank']
+    with open(path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(path + '.tmp', path)
+    return rows
+
+
+def print_top(rows, names, top=10):
+    print(f"\n {'rank':>4}  " + ''.join(f"{n:>15}" for n in names) + f"{'cv acc':>10}{'std':>8}{'sec':>8}")
+    for row in rows[:top]:
+        print(f" {row['rank']:>4}  " + ''.join(f"{row[n]:>15}" for n in names) +
+              f"{row['cv_accuracy_mean']:>10.4f}{row['cv_accuracy_std']:>8.4f}{row['trial_seconds']:>8.1f}")
+
+
+def run_sweep(data_dir=data_dir, output='sweep_results.csv', folds=5, trials=None, space=None, workers=None,
+              threads_per_worker=1, feature_augment=0, sort_by='cv_accuracy_mean', seed=90):
+    from FishDataset import ShardedDataset
+    from FeatureCache import feature_cache_entry
+    from ModelSelectionFinal import build_mobilenet_model, set_seeds
+
+    space = space or search_space
+    configs = random_configs(space, trials, seed) if trials else grid_configs(space)
+    cpus = os.cpu_count() or 1
+    workers = workers or max(1, cpus // threads_per_worker)
+
+    # The backbone is frozen, so every trial reuses one set of cached embeddings
+    set_seeds(seed)
+    dataset = ShardedDataset(data_dir)
+    backbone = build_mobilenet_model(num_classes=dataset.num_classes).layers[0]
+    entry_dir = feature_cache_entry(feature_cache_dir, backbone, dataset, augment_variants=feature_augment, seed=seed)
+
+    # Duplicate groups (groups.npy) never straddle a fold boundary
+    splitter = StratifiedGroupKFold(n_splits=folds, shuffle=True, random_state=42)
+    splits = list(splitter.split(np.zeros(len(dataset)), dataset.labels, dataset.groups))
+
+    print(f" {len(configs)} configurations x {folds} folds on {workers} workers "
+          f"({threads_per_worker} TF threads each, {cpus} CPUs)")
+    start = time.perf_counter()
+    fold_results = []
+
+    # spawn: workers must not inherit the parent's already initialized TF runtime
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                             initargs=(entry_dir, dataset.labels, dataset.num_classes, threads_per_worker, seed)) as executor:
+        futures = [executor.submit(run_fold, trial, fold, config, train_idx, val_idx)
+                   for trial, config in enumerate(configs)
+                   for fold, (train_idx, val_idx) in enumerate(splits)]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            fold_results.append(result)
+            print(f" [{done}/{len(futures)}] trial {result['trial']} fold {result['fold']}: "
+                  f"val_accuracy {result['val_accuracy']:.4f} ({result['seconds']:.1f}s)")
+
+    rows = write_results(output, summarize(configs, fold_results), sort_by)
+    elapsed = time.perf_counter() - start
+    print_top(rows, sorted(space))
+    print(f"\n DONE: {len(fold_results)} fits in {elapsed:.1f}s, results in: {output}")
+    if rows:
+        best = {k: rows[0][k] for k in sorted(space)}
+        print(f" Best: {json.dumps(best)}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="K-fold cross-validated sweep over the classification head.")
+    parser.add_argument('--data', default=data_dir)
+    parser.add_argument('--output', default='sweep_results.csv')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--trials', type=int, default=None, help="Random search over this many configurations "
+                                                                  "instead of the full grid.")
+    parser.add_argument('--space', default=None, help="JSON file mapping hyperparameter -> list of values.")
+    parser.add_argument('--workers', type=int, default=None, help="Trial processes (default: CPUs / threads).")
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--feature-augment', type=int, default=0)
+    parser.add_argument('--sort-by', default='cv_accuracy_mean')
+    args = parser.parse_args()
+
+    space = None
+    if args.space:
+        with open(args.space, encoding='utf-8') as f:
+            space = {**search_space, **json.load(f)}
+    run_sweep(args.data, args.output, args.folds, args.trials, space, args.workers, args.threads_per_worker,
+              args.feature_augment, args.sort_by)
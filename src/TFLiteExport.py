@@ -0,0 +1,67 @@
+import os
+import argparse
+import numpy as np
+import tensorflow as tf
+from FishDataset import normalize
+
+
+# --- Representative sample for int8 calibration, drawn from the preprocessed shards ---
+def representative_dataset(dataset, num_samples=200, seed=90):
+    rng = np.random.default_rng(seed)
+    indices = np.sort(rng.choice(len(dataset), size=min(num_samples, len(dataset)), replace=False))
+
+    def generator():
+        for i in indices:
+            yield [normalize(dataset.image(i))[np.newaxis]]
+    return generator
+
+
+# --- Post-training quantized TFLite exports ---
+# float16: weights stored as float16, computation stays float on CPU.
+# int8: weights and activations quantized, calibrated on the representative
+# sample; inputs/outputs stay float32 so callers pass the usual [0, 1] batch.
+def export_tflite(model, out_dir='.', dataset=None, num_calibration=200, name='MobileNetV2'):
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    paths['float16'] = os.path.join(out_dir, f'{name}_float16.tflite')
+    with open(paths['float16'], 'wb') as f:
+        f.write(converter.convert())
+
+    if dataset is not None:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(dataset, num_calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        paths['int8'] = os.path.join(out_dir, f'{name}_int8.tflite')
+        with open(paths['int8'], 'wb') as f:
+            f.write(converter.convert())
+
+    for kind, path in paths.items():
+        print(f" {kind} TFLite model saved as '{path}' ({os.path.getsize(path) / 1e6:.1f} MB)")
+    return paths
+
+
+# --- Inference-only SavedModel: no optimizer state or Keras config to rebuild, so the app starts faster ---
+def export_savedmodel(model, path='MobileNetV2_savedmodel'):
+    model.export(path)
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    print(f" SavedModel saved as '{path}' ({size / 1e6:.1f} MB)")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write serving artifacts (SavedModel, float16 TFLite) from a trained .keras model.")
+    parser.add_argument('model', nargs='?', default='MobileNetV2.keras')
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--skip-tflite', action='store_true')
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    name = os.path.splitext(os.path.basename(args.model))[0]
+    export_savedmodel(model, os.path.join(args.out_dir, f'{name}_savedmodel'))
+    if not args.skip_tflite:
+        export_tflite(model, args.out_dir, name=name)
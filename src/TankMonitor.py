@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import collections
+import numpy as np
+from PIL import Image, ImageSequence
+from FishInference import MODEL_PATH, CONFIDENCE_THRESHOLD, labels_list, resize_pixels, pixels_to_batch, load_backend
+from Metrics import metrics, start_exporters_from_env
+from PerfConfig import add_perf_args, perf_config, apply_perf_config, describe
+from ScanHistory import ScanHistory, image_hash
+
+# --- SETTINGS ---
+image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
+HEALTHY = "Healthy"
+
+# --- Frame sources: (fps, live, iterator of (seconds, RGB uint8 frame)) ---
+# Video files, camera indices and stream URLs need OpenCV (opencv-python-headless, optional in requirements.txt);
+# a folder of frames or an animated GIF is read with Pillow alone (tests/test_tank_monitor.py uses folders).
+def open_source(spec, folder_fps=5.0):
+    if os.path.isdir(spec):
+        names = sorted(n for n in os.listdir(spec) if n.lower().endswith(image_extensions))
+
+        def folder_frames():
+            for i, name in enumerate(names):
+                with Image.open(os.path.join(spec, name)) as img:
+                    yield i / folder_fps, np.asarray(img.convert('RGB'))
+        return folder_fps, False, folder_frames()
+
+    if spec.lower().endswith('.gif'):
+        def gif_frames():
+            t = 0.0
+            with Image.open(spec) as img:
+                for frame in ImageSequence.Iterator(img):
+                    yield t, np.asarray(frame.convert('RGB'))
+                    t += frame.info.get('duration', 100) / 1000.0
+        with Image.open(spec) as img:
+            fps = 1000.0 / (img.info.get('duration') or 100)
+        return fps, False, gif_frames()
+
+    live = spec.isdigit() or '://' in spec
+    if not live and not os.path.exists(spec):
+        raise FileNotFoundError(f"No such video, GIF or frame folder: '{spec}'")
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError(f"Reading '{spec}' needs OpenCV, which is not installed: "
+                          f"pip install opencv-python-headless (or use a folder of frames or a GIF)") from None
+
+    capture = cv2.VideoCapture(int(spec) if spec.isdigit() else spec)
+    if not capture.isOpened():
+        raise OSError(f"Could not open video source '{spec}'")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+
+    def video_frames():
+        start, index = time.monotonic(), 0
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                # Files are timed by frame number, live streams by the clock
+                t = time.monotonic() - start if live or not fps else index / fps
+                index += 1
+                yield t, frame[:, :, ::-1]
+        finally:
+            capture.release()
+    return fps, live, video_frames()
+
+
+# --- Cheap change detector: mean absolute difference of a 32x32 grayscale thumbnail ---
+def frame_signature(frame, size=32):
+    small = Image.fromarray(frame).convert('L').resize((size, size), Image.BOX)
+    return np.asarray(small, dtype=np.int16)
+
+
+# --- Per-tank alerting: a disease label must hold across a time window, not a single frame ---
+class AlertTracker:
+    def __init__(self, tank, window_seconds=10.0, min_frames=5, min_fraction=0.6, threshold=CONFIDENCE_THRESHOLD):
+        self.tank = tank
+        self.window_seconds = window_seconds
+        self.min_frames = min_frames
+        self.min_fraction = min_fraction
+        self.threshold = threshold
+        self.window = collections.deque()
+        self.active = None
+
+    def update(self, t, label, prob):
+        # Returns an alert event when an episode starts or ends, otherwise None
+        self.window.append((t, label if prob >= self.threshold else None))
+        while self.window and self.window[0][0] < t - self.window_seconds:
+            self.window.popleft()
+
+        counts = collections.Counter(l for _, l in self.window if l is not None and l != HEALTHY)
+        label, hits = counts.most_common(1)[0] if counts else (None, 0)
+        persistent = hits >= self.min_frames and hits / len(self.window) >= self.min_fraction
+
+        if persistent and label != self.active:
+            self.active = label
+            return {'tank': self.tank, 'event': 'alert', 'label': label, 'time_s': round(t, 2),
+                    'frames': hits, 'window_frames': len(self.window)}
+        if not persistent and self.active is not None:
+            event = {'tank': self.tank, 'event': 'clear', 'label': self.active, 'time_s': round(t, 2)}
+            self.active = None
+            return event
+        return None
+
+
+# --- Reader: one thread per tank; decodes, skips unchanged frames, shrinks to model input ---
+class TankReader(threading.Thread):
+    def __init__(self, tank, spec, frames_queue, diff_threshold=4.0, keyframe_seconds=2.0, realtime=False,
+                 folder_fps=5.0):
+        super().__init__(name=f'tank-{tank}', daemon=True)
+        self.tank = tank
+        self.fps, self.live, self.frames = open_source(spec, folder_fps)
+        self.frames_queue = frames_queue
+        self.diff_threshold = diff_threshold
+        self.keyframe_seconds = keyframe_seconds
+        # Live cameras (and --realtime replays) never wait for the model: a full queue drops the frame
+        self.drop_when_full = self.live or realtime
+        self.realtime = realtime
+        self.stats = collections.Counter()
+        self.last_t = 0.0
+
+    def run(self):
+        last_signature, last_kept = None, None
+        start = time.monotonic()
+        for t, frame in self.frames:
+            if self.realtime and not self.live:
+                # Replay a file at its own frame rate, like a camera would deliver it
+                time.sleep(max(0.0, t - (time.monotonic() - start)))
+            self.stats['read'] += 1
+            metrics.count('frames_read')
+            self.last_t = t
+
+            with metrics.timer('frame_diff'):
+                signature = frame_signature(frame)
+                changed = last_signature is None or np.abs(signature - last_signature).mean() >= self.diff_threshold
+            if not changed and t - last_kept < self.keyframe_seconds:
+                self.stats['skipped'] += 1
+                metrics.count('frames_skipped')
+                continue
+
+            with metrics.timer('frame_prep'):
+                pixels = resize_pixels(Image.fromarray(frame))
+            item = (self.tank, t, time.monotonic(), pixels)
+            if self.drop_when_full:
+                try:
+                    self.frames_queue.put_nowait(item)
+                except queue.Full:
+                    self.stats['dropped'] += 1
+                    metrics.count('frames_dropped')
+                    continue
+            else:
+                self.frames_queue.put(item)
+            last_signature, last_kept = signature, t
+            self.stats['queued'] += 1
+
+
+# --- Monitor: shared inference worker batching frames from every tank ---
+class TankMonitor:
+    def __init__(self, backend, sources, queue_size=32, max_batch_size=16, max_wait_ms=50.0, diff_threshold=4.0,
+                 keyframe_seconds=2.0, realtime=False, folder_fps=5.0, window_seconds=10.0, min_frames=5,
+                 min_fraction=0.6, on_alert=None, history=None):
+        self.backend = backend
+        self.history = history
+        self.frames_queue = queue.Queue(maxsize=queue_size)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.readers = [TankReader(tank, spec, self.frames_queue, diff_threshold, keyframe_seconds, realtime,
+                                   folder_fps) for tank, spec in sources.items()]
+        self.trackers = {tank: AlertTracker(tank, window_seconds, min_frames, min_fraction) for tank in sources}
+        self.on_alert = on_alert or (lambda event: None)
+        self.scored = collections.Counter()
+        self.batches = 0
+        self.alerts = []
+
+    def _collect(self):
+        # Wait briefly for the first frame, then up to max_wait for a fuller batch
+        try:
+            batch = [self.frames_queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.frames_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        start = time.monotonic()
+        for reader in self.readers:
+            reader.start()
+
+        while any(r.is_alive() for r in self.readers) or not self.frames_queue.empty():
+            batch = self._collect()
+            if not batch:
+                continue
+            with metrics.timer('monitor_batch'):
+                preds = self.backend.predict(pixels_to_batch(np.stack([pixels for *_, pixels in batch])))
+            self.batches += 1
+
+            now = time.monotonic()
+            for (tank, t, queued_at, pixels), pred in zip(batch, preds):
+                metrics.observe('frame_latency', now - queued_at)
+                metrics.count('frames_scored')
+                self.scored[tank] += 1
+                label, prob = labels_list[int(np.argmax(pred))], float(np.max(pred))
+                if self.history is not None:
+                    self.history.record(label, prob, pred, image_hash(pixels), self.backend.version, tank=tank,
+                                        source='monitor')
+                event = self.trackers[tank].update(t, label, prob)
+                if event is not None:
+                    metrics.count('alerts' if event['event'] == 'alert' else 'alerts_cleared')
+                    self.alerts.append(event)
+                    self.on_alert(event)
+
+        return self.report(time.monotonic() - start)
+
+    def report(self, elapsed):
+        tanks = {}
+        for reader in self.readers:
+            s = reader.stats
+            tanks[reader.tank] = {
+                'read': s['read'], 'skipped': s['skipped'], 'dropped': s['dropped'], 'scored': self.scored[reader.tank],
+                'source_fps': reader.fps, 'source_seconds': reader.last_t,
+                # Above 1.0: the monitor processed the stream faster than it plays
+                'realtime_factor': reader.last_t / elapsed if elapsed > 0 else 0.0
+            }
+        return {'seconds': elapsed, 'batches': self.batches, 'tanks': tanks, 'alerts': self.alerts}
+
+
+def parse_sources(specs):
+    # tank=source pairs; a bare source is named after its file
+    sources = {}
+    for spec in specs:
+        tank, _, source = spec.partition('=') if '=' in spec else (os.path.splitext(os.path.basename(spec))[0], '', spec)
+        sources[tank] = source
+    return sources
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuous disease screening of fixed tank cameras or recorded video.")
+    parser.add_argument('sources', nargs='+', help="tank=source; source is a video file, camera index, stream URL, "
+                                                   "animated GIF or folder of frames.")
+    parser.add_argument('--model', default=MODEL_PATH, help=".keras, SavedModel directory or .tflite model.")
+    parser.add_argument('--threads', type=int, default=None, help="TFLite interpreter threads.")
+    parser.add_argument('--diff-threshold', type=float, default=4.0,
+                        help="Mean grayscale change (0-255) below which a frame counts as unchanged.")
+    parser.add_argument('--keyframe-seconds', type=float, default=2.0,
+                        help="Score at least one frame this often even when nothing changes.")
+    parser.add_argument('--queue-size', type=int, default=32)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=50.0)
+    parser.add_argument('--realtime', action='store_true', help="Replay files at their frame rate and drop frames "
+                                                                 "the model cannot keep up with, like a live camera.")
+    parser.add_argument('--folder-fps', type=float, default=5.0, help="Frame rate assumed for a folder of frames.")
+    parser.add_argument('--window-seconds', type=float, default=10.0)
+    parser.add_argument('--min-frames', type=int, default=5, help="Detections needed inside the window to alert.")
+    parser.add_argument('--min-fraction', type=float, default=0.6, help="Share of the window's frames that must agree.")
+    parser.add_argument('--alerts', default='alerts.jsonl', help="Alert events are appended here.")
+    parser.add_argument('--output', default=None, help="Write the run summary as JSON to this path.")
+    parser.add_argument('--history', default=None, help="Also record every scored frame in this scan history database.")
+    add_perf_args(parser)
+    args = parser.parse_args()
+
+    config = apply_perf_config(perf_config(args))
+    print(f" CPU execution: {describe(config)}")
+    start_exporters_from_env(metrics)
+    backend = load_backend(args.model, args.threads or config['intra_threads'] or None, config['xla'])
+
+    def on_alert(event):
+        print(f" [{event['tank']}] {event['event'].upper()} {event['label']} at {event['time_s']}s")
+        with open(args.alerts, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event) + '\n')
+
+    try:
+        monitor = TankMonitor(backend, parse_sources(args.sources), args.queue_size, args.max_batch_size, args.max_wait_ms,
+                              args.diff_threshold, args.keyframe_seconds, args.realtime, args.folder_fps,
+                              args.window_seconds, args.min_frames, args.min_fraction, on_alert,
+                              ScanHistory(args.history) if args.history else None)
+    except (ImportError, OSError) as e:
+        raise SystemExit(f" {e}")
+    summary = monitor.run()
+    if monitor.history is not None:
+        monitor.history.flush()
+
+    print(f"\n {'tank':<16}{'read':>8}{'skipped':>9}{'dropped':>9}{'scored':>8}{'x realtime':>12}")
+    for tank, s in summary['tanks'].items():
+        print(f" {tank:<16}{s['read']:>8}{s['skipped']:>9}{s['dropped']:>9}{s['scored']:>8}{s['realtime_factor']:>12.2f}")
+    print(f"\n DONE: {summary['batches']} batches in {summary['seconds']:.1f}s, {len(summary['alerts'])} alert events")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f" Summary saved to: {args.output}")
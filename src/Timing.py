@@ -0,0 +1,26 @@
+import time
+import numpy as np
+
+
+# --- Latency summaries shared by the benchmarks and the serving code (no model or TensorFlow imports) ---
+def latency_stats(samples_ms):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        'count': int(len(samples)),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max())
+    }
+
+
+def time_calls(fn, iterations=200, warmup=10):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return latency_stats(samples)
@@ -0,0 +1,92 @@
+import os
+import csv
+import json
+import numpy as np
+import pytest
+from PIL import Image
+import BulkScan
+from FishInference import labels_list
+from BulkScan import bulk_scan, UNABLE
+
+HEALTHY = labels_list.index('Healthy')
+
+
+class FakeBackend:
+    # Bright images are Healthy with high confidence, dark ones unsure; records every batch size
+    def __init__(self, fail_after=None):
+        self.batch_sizes = []
+        self.fail_after = fail_after
+
+    def predict(self, batch):
+        if self.fail_after is not None and len(self.batch_sizes) >= self.fail_after:
+            raise KeyboardInterrupt
+        self.batch_sizes.append(len(batch))
+        preds = np.full((len(batch), len(labels_list)), 0.1, dtype=np.float32)
+        bright = batch.reshape(len(batch), -1).mean(axis=1) > 0.5
+        preds[:, HEALTHY] = np.where(bright, 0.9, 0.3)
+        return preds
+
+
+def use_backend(monkeypatch, backend):
+    monkeypatch.setattr(BulkScan, 'load_backend', lambda *args, **kwargs: backend)
+    return backend
+
+
+@pytest.fixture
+def photos(tmp_path):
+    # 7 bright and 3 dark images in two folders, plus one file that is not an image
+    root = tmp_path / 'photos'
+    for i in range(10):
+        folder = root / f'pond_{i % 2}'
+        folder.mkdir(parents=True, exist_ok=True)
+        value = 255 if i < 7 else 0
+        Image.new('RGB', (80, 60), (value, value, value)).save(folder / f'fish_{i:02d}.jpg')
+    (root / 'pond_0' / 'broken.jpg').write_bytes(b'not a jpeg')
+    (root / 'pond_0' / 'notes.txt').write_text('skip me')
+    return str(root)
+
+
+def read_rows(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize('name', ['results.csv', 'results.jsonl'])
+def test_every_image_gets_one_row(photos, tmp_path, monkeypatch, name):
+    backend = use_backend(monkeypatch, FakeBackend())
+    output = str(tmp_path / name)
+    stats = bulk_scan(photos, output, batch_size=4, decode_threads=2)
+
+    rows = {os.path.basename(row['path']): row for row in read_rows(output)}
+    assert stats['scanned'] == 10 and stats['errors'] == 1
+    assert len(rows) == 11 and 'notes.txt' not in rows
+    assert rows['broken.jpg']['status'] == 'error' and rows['broken.jpg']['result'] == UNABLE
+    assert rows['fish_00.jpg']['result'] == 'Healthy' and rows['fish_00.jpg']['status'] == 'ok'
+    assert rows['fish_09.jpg']['result'] == UNABLE and rows['fish_09.jpg']['status'] == 'low_confidence'
+    assert max(backend.batch_sizes) <= 4 and sum(backend.batch_sizes) == 10
+
+
+def test_interrupted_scan_resumes_without_duplicates(photos, tmp_path, monkeypatch):
+    output = str(tmp_path / 'results.csv')
+    use_backend(monkeypatch, FakeBackend(fail_after=1))
+    with pytest.raises(KeyboardInterrupt):
+        bulk_scan(photos, output, batch_size=4, decode_threads=1)
+    first = {row['path'] for row in read_rows(output)}
+    assert 0 < len(first) < 11
+
+    backend = use_backend(monkeypatch, FakeBackend())
+    stats = bulk_scan(photos, output, batch_size=4, decode_threads=1)
+    paths = [row['path'] for row in read_rows(output)]
+    assert len(paths) == len(set(paths)) == 11
+    assert stats['scanned'] == 10 - len({p for p in first if not p.endswith('broken.jpg')})
+    assert sum(backend.batch_sizes) == stats['scanned']
+
+
+def test_no_resume_starts_over(photos, tmp_path, monkeypatch):
+    output = str(tmp_path / 'results.csv')
+    use_backend(monkeypatch, FakeBackend())
+    bulk_scan(photos, output, batch_size=4)
+    stats = bulk_scan(photos, output, batch_size=4, resume=False)
+    assert stats['scanned'] == 10 and len(read_rows(output)) == 11
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from FishInference import Cascade, CONFIDENCE_THRESHOLD, TTA_BATCH_SIZE, tta_views, cascade_from_env, labels_list
+from Metrics import metrics
+
+
+def gradient():
+    # Distinct values per row and column, so flips and crops are easy to tell apart
+    y, x = np.mgrid[0:224, 0:224]
+    return np.stack([x, y, (x + y) // 2], axis=-1).astype(np.uint8)
+
+
+class FakePredict:
+    # First pass returns `first`, the TTA batch returns `views` for every view; records batch sizes
+    def __init__(self, first, views):
+        self.first, self.views = first, views
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        pred = np.full(len(labels_list), (1.0 - (self.first if len(batch) == 1 else self.views)) / (len(labels_list) - 1))
+        pred[0] = self.first if len(batch) == 1 else self.views
+        return np.tile(pred.astype(np.float32), (len(batch), 1))
+
+
+def test_tta_views_are_flips_and_crops_at_model_size():
+    pixels = gradient()
+    views = tta_views(pixels, crop=0.875)
+    assert views.shape == (TTA_BATCH_SIZE, 224, 224, 3) and views.dtype == np.uint8
+    assert np.array_equal(views[0], pixels[:, ::-1])
+    # The center crop and its mirror image
+    assert np.array_equal(views[1], views[2][:, ::-1])
+    # Crops are zoomed in: the top-left crop starts at the image corner but spans fewer values
+    assert views[3][0, 0, 0] == pixels[0, 0, 0] and views[3][0, -1, 0] < pixels[0, -1, 0]
+    assert len({view.tobytes() for view in views}) == TTA_BATCH_SIZE
+
+
+def counters():
+    return {name: metrics.counter(name) for name in ('cascade_first_pass', 'cascade_escalated', 'cascade_rescued')}
+
+
+def test_confident_first_pass_is_not_escalated():
+    predict, before = FakePredict(first=0.9, views=0.1), counters()
+    pred, escalated = Cascade(escalate_below=0.8).predict(predict, gradient())
+    assert not escalated and predict.batch_sizes == [1]
+    assert float(pred[0, 0]) == pytest.approx(0.9)
+    assert counters()['cascade_first_pass'] == before['cascade_first_pass'] + 1
+
+
+def test_unsure_first_pass_averages_in_the_tta_views():
+    predict, before = FakePredict(first=0.5, views=0.9), counters()
+    pred, escalated = Cascade(escalate_below=0.8).predict(predict, gradient())
+    assert escalated and predict.batch_sizes == [1, TTA_BATCH_SIZE]
+    # One first-pass row and seven view rows, averaged
+    assert float(pred[0, 0]) == pytest.approx((0.5 + 7 * 0.9) / 8)
+    assert pred.shape == (1, len(labels_list))
+    after = counters()
+    assert after['cascade_escalated'] == before['cascade_escalated'] + 1
+    # Below the app's threshold before TTA, above it after: counted as rescued
+    assert 0.5 < CONFIDENCE_THRESHOLD <= float(pred[0, 0])
+    assert after['cascade_rescued'] == before['cascade_rescued'] + 1
+
+
+def test_cascade_tag_and_environment(monkeypatch):
+    assert Cascade(0.8, 0.875).tag == 'cascade0.8/0.875'
+    monkeypatch.delenv('FINSCAN_CASCADE', raising=False)
+    assert cascade_from_env() is None
+    monkeypatch.setenv('FINSCAN_CASCADE', '1')
+    monkeypatch.setenv('FINSCAN_ESCALATE_BELOW', '0.7')
+    monkeypatch.setenv('FINSCAN_TTA_CROP', '0.9')
+    cascade = cascade_from_env()
+    assert (cascade.escalate_below, cascade.crop) == (0.7, 0.9)
@@ -0,0 +1,74 @@
+import io
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from FishInference import image_to_pixels
+from FishDataset import ShardedDataset
+from Preprocessing import run_preprocessing, load_manifest
+from DatasetIntegrity import scan_file
+
+ORIENTATIONS = (1, 3, 6, 8)
+
+
+def photo(rng, size):
+    # Smooth gradient plus noise, so the JPEG decodes like a photo
+    w, h = size
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    img = rng.uniform(0, 255, 3) + x[..., None] * rng.uniform(-0.1, 0.1, 3) + y[..., None] * rng.uniform(-0.1, 0.1, 3)
+    return Image.fromarray(np.clip(img + rng.normal(0, 12, (h, w, 3)), 0, 255).astype(np.uint8))
+
+
+def camera_jpeg(rng, size, orientation):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    photo(rng, size).save(buffer, format='JPEG', quality=92, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope='module')
+def built(tmp_path_factory):
+    # Large enough JPEGs that the reduced-resolution (draft) decode actually kicks in
+    root = tmp_path_factory.mktemp('prep')
+    rng = np.random.default_rng(90)
+    source = root / 'source'
+    for i, orientation in enumerate(ORIENTATIONS):
+        folder = source / f'class_{i % 2}'
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f'fish_{i}.jpg').write_bytes(camera_jpeg(rng, (2016, 1512), orientation))
+    photo(rng, (504, 378)).convert('RGBA').save(source / 'class_0' / 'fish_alpha.png')
+
+    normalized = root / 'normalized'
+    run_preprocessing(str(source), str(root / 'extracted'), str(normalized), workers=1)
+    return str(source), str(normalized)
+
+
+def test_shards_match_serving_pixels_bit_for_bit(built):
+    source, normalized = built
+    dataset = ShardedDataset(normalized)
+    entries = list(load_manifest(normalized).values())
+    assert len(entries) == len(ORIENTATIONS) + 1
+
+    for entry in entries:
+        with open(os.path.join(source, entry['Source Path']), 'rb') as f:
+            served = image_to_pixels(f.read())
+        stored = dataset.shard(int(entry['Shard']))[int(entry['Offset'])]
+        assert served.dtype == np.uint8 and served.shape == (224, 224, 3)
+        assert np.array_equal(stored, served), entry['Source Path']
+
+
+def test_duplicate_hash_matches_dataset_integrity(built):
+    # groups.npy and the DatasetIntegrity report must agree on which images are near-duplicates
+    source, normalized = built
+    for key, entry in load_manifest(normalized).items():
+        assert scan_file(os.path.join(source, key))['dhash'] == entry['Dhash'], key
+
+
+def test_exif_rotation_is_applied():
+    # A portrait-rotated photo must not come out identical to its unrotated pixels
+    rng = np.random.default_rng(1)
+    data = camera_jpeg(rng, (2016, 1512), 6)
+    upright = image_to_pixels(data)
+    raw = np.asarray(Image.open(io.BytesIO(data)).convert('RGB').resize((224, 224)))
+    assert not np.array_equal(upright, raw)
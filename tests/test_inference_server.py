@@ -0,0 +1,77 @@
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+from InferenceServer import MicroBatcher, BatchingHTTPServer, make_handler
+
+NUM_CLASSES = 5
+
+
+def fake_predict(batch):
+    # Fails the whole call when any image in it is all white
+    if (batch.reshape(len(batch), -1) == 1.0).all(axis=1).any():
+        raise ValueError('poisoned image')
+    return np.tile(np.eye(NUM_CLASSES, dtype=np.float32)[:1], (len(batch), 1))
+
+
+def image(value=0):
+    return np.full((224, 224, 3), value, dtype=np.uint8)
+
+
+def test_bad_request_fails_alone_in_a_mixed_batch():
+    batcher = MicroBatcher(fake_predict, max_batch_size=8, max_wait_ms=200.0)
+    good, bad, stack = batcher.submit(image()), batcher.submit(image(255)), batcher.submit(np.stack([image()] * 3))
+
+    assert good.result(timeout=10).shape == (1, NUM_CLASSES)
+    assert stack.result(timeout=10).shape == (3, NUM_CLASSES)
+    assert isinstance(bad.exception(timeout=10), ValueError)
+    assert batcher.items == 3
+
+
+def test_batch_size_counts_rows_not_requests():
+    sizes = []
+    batcher = MicroBatcher(lambda batch: sizes.append(len(batch)) or fake_predict(batch),
+                           max_batch_size=8, max_wait_ms=200.0)
+    futures = [batcher.submit(np.stack([image()] * 3)) for _ in range(4)] + [batcher.submit(image())]
+
+    assert [f.result(timeout=10).shape[0] for f in futures] == [3, 3, 3, 3, 1]
+    assert max(sizes) <= 8 and sum(sizes) == 13
+
+
+def post_npy(url, array):
+    buf = io.BytesIO()
+    np.save(buf, array, allow_pickle=False)
+    request = urllib.request.Request(url, data=buf.getvalue(), headers={'Content-Type': 'application/x-npy'})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_malformed_arrays_are_rejected_before_batching():
+    batcher = MicroBatcher(fake_predict, max_wait_ms=50.0)
+    server = BatchingHTTPServer(('127.0.0.1', 0), make_handler(batcher, timeout=10))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/predict'
+    try:
+        results = {}
+        cases = {'good': image(), 'float': image().astype(np.float32), 'shape': np.zeros((100, 100, 3), np.uint8),
+                 'stack': np.stack([image(), image()])}
+        threads = [threading.Thread(target=lambda k=k, a=a: results.__setitem__(k, post_npy(url, a)))
+                   for k, a in cases.items()]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert results['good'][0] == 200
+        assert results['float'][0] == 400 and 'uint8' in results['float'][1]['error']
+        assert results['shape'][0] == 400
+        assert results['stack'][0] == 200 and len(results['stack'][1]['label']) == 2
+        assert batcher.items == 2
+    finally:
+        server.shutdown()
+        server.server_close()
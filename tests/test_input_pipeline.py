@@ -0,0 +1,35 @@
+import numpy as np
+from InputPipeline import make_dataset
+
+NUM_CLASSES = 5
+PER_CLASS = 1000
+
+
+class SortedDataset:
+    # Class-sorted like the manifest; every pixel holds the image's class id
+    image_shape = (2, 2, 3)
+    num_classes = NUM_CLASSES
+
+    def __init__(self):
+        self.labels = np.repeat(np.arange(NUM_CLASSES), PER_CLASS)
+
+    def images(self, idx):
+        return np.broadcast_to(self.labels[idx].astype(np.uint8)[:, None, None, None], (len(idx),) + self.image_shape)
+
+
+def classes_in_first_batches(cache, batches=4, batch_size=32):
+    dataset = SortedDataset()
+    ds = make_dataset(dataset, np.arange(len(dataset.labels)), batch_size=batch_size, training=True, cache=cache)
+    seen = set()
+    for _, labels in ds.take(batches):
+        seen.update(np.argmax(labels.numpy(), axis=1).tolist())
+    return seen
+
+
+def test_cached_training_batches_mix_classes():
+    # A 2048-sample shuffle buffer over class-sorted input would only reach the first two or three classes
+    assert len(classes_in_first_batches(cache='')) == NUM_CLASSES
+
+
+def test_uncached_training_batches_mix_classes():
+    assert len(classes_in_first_batches(cache=None)) == NUM_CLASSES
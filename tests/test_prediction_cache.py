@@ -0,0 +1,74 @@
+import threading
+import numpy as np
+from FishInference import Cascade
+from PredictionCache import PredictionCache, prediction_key
+
+
+def pixels(value=0):
+    return np.full((224, 224, 3), value, dtype=np.uint8)
+
+
+def result(i):
+    pred = np.zeros((1, 5), dtype=np.float32)
+    pred[0, i % 5] = 1.0
+    return f'label_{i}', 1.0, pred
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_entries=2)
+    cache.put('a', result(0))
+    cache.put('b', result(1))
+    assert cache.get('a')[0] == 'label_0'
+    cache.put('c', result(2))
+
+    assert cache.get('b') is None
+    assert cache.get('a')[0] == 'label_0' and cache.get('c')[0] == 'label_2'
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'hit_rate': 0.75, 'entries': 2}
+
+
+def test_disk_copy_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    PredictionCache(max_entries=1, path=path).put('a', result(3))
+
+    label, prob, pred = PredictionCache(path=path).get('a')
+    assert (label, prob) == ('label_3', 1.0)
+    assert pred.shape == (1, 5) and pred[0, 3] == 1.0
+
+
+def test_key_covers_pixels_model_version_and_cascade():
+    img = pixels(7)
+    key = prediction_key(img, 'v1')
+    assert key == prediction_key(img.copy(), 'v1')
+    assert key != prediction_key(pixels(8), 'v1')
+    assert key != prediction_key(img, 'v2')
+    # Cascaded results are cached apart from single-pass ones, and per cascade setting
+    tags = {Cascade(0.8).tag, Cascade(0.9).tag, Cascade(0.8, crop=0.75).tag}
+    keys = {prediction_key(img, f'v1|{tag}') for tag in tags} | {key}
+    assert len(keys) == 4
+
+
+def test_concurrent_readers_and_writers(tmp_path):
+    cache = PredictionCache(max_entries=64, path=str(tmp_path / 'cache.db'))
+    errors = []
+
+    def worker(offset):
+        try:
+            for i in range(200):
+                key = f'k{(offset + i) % 100}'
+                if cache.get(key) is None:
+                    cache.put(key, result(int(key[1:])))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n * 25,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 8 * 200
+    assert stats['entries'] == 64
+    # Whatever was evicted from memory is still answered, correctly, from disk
+    assert all(cache.get(f'k{i}')[0] == f'label_{i}' for i in range(100))
@@ -0,0 +1,140 @@
+import os
+import json
+import functools
+import numpy as np
+import pytest
+from PIL import Image
+import FishDataset
+import Preprocessing
+from FishDataset import ShardedDataset
+from Preprocessing import run_preprocessing, load_manifest
+
+
+def write_images(source, indices, seed=0):
+    for i in indices:
+        folder = os.path.join(source, f'class_{i % 2}')
+        os.makedirs(folder, exist_ok=True)
+        rng = np.random.default_rng(seed * 1000 + i)
+        Image.fromarray(rng.integers(0, 256, (64, 80, 3), dtype=np.uint8)).save(os.path.join(folder, f'fish_{i:03d}.png'))
+
+
+def remove_images(source, indices):
+    for i in indices:
+        os.remove(os.path.join(source, f'class_{i % 2}', f'fish_{i:03d}.png'))
+
+
+def stored_pixels(normalized):
+    # Source key -> the pixels its manifest entry points at
+    dataset = ShardedDataset(normalized)
+    return {key: np.array(dataset.shard(int(e['Shard']))[int(e['Offset'])])
+            for key, e in load_manifest(normalized).items()}
+
+
+def shard_files(normalized):
+    return sorted(f for f in os.listdir(normalized) if f.startswith('images_'))
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    # Shards of 4 images, so a dozen images spans several of them
+    monkeypatch.setattr(Preprocessing, 'ShardWriter', functools.partial(FishDataset.ShardWriter, shard_size=4))
+    return str(tmp_path / 'source'), str(tmp_path / 'extracted'), str(tmp_path / 'normalized')
+
+
+def test_mostly_deleted_shards_are_compacted(dirs):
+    source, extracted, normalized = dirs
+    write_images(source, range(12))
+    run_preprocessing(source, extracted, normalized, workers=1)
+    before = stored_pixels(normalized)
+    assert shard_files(normalized) == ['images_00000.npy', 'images_00001.npy', 'images_00002.npy']
+
+    # Shard 0 keeps 1 of 4 rows (compacted), shard 1 keeps 3 of 4 (left alone)
+    manifest = load_manifest(normalized)
+    in_shard = lambda shard_id: sorted(k for k, e in manifest.items() if int(e['Shard']) == shard_id)
+    removed = in_shard(0)[1:] + in_shard(1)[:1]
+    for key in removed:
+        os.remove(os.path.join(source, key))
+    stats = run_preprocessing(source, extracted, normalized, workers=1)
+
+    assert stats['compacted'] == 1 and stats['total'] == 8
+    assert shard_files(normalized) == ['images_00001.npy', 'images_00002.npy', 'images_00003.npy']
+    after = stored_pixels(normalized)
+    assert set(after) == set(before) - set(removed)
+    assert all(np.array_equal(after[key], before[key]) for key in after)
+    assert ShardedDataset(normalized).images(np.arange(8)).shape == (8, 224, 224, 3)
+
+
+def test_rerun_without_changes_does_nothing(dirs):
+    source, extracted, normalized = dirs
+    write_images(source, range(6))
+    run_preprocessing(source, extracted, normalized, workers=1)
+    shards = {name: os.path.getmtime(os.path.join(normalized, name)) for name in shard_files(normalized)}
+    before = stored_pixels(normalized)
+
+    stats = run_preprocessing(source, extracted, normalized, workers=1)
+    assert (stats['processed'], stats['removed'], stats['total']) == (0, 0, 6)
+    assert {name: os.path.getmtime(os.path.join(normalized, name)) for name in shard_files(normalized)} == shards
+    assert stored_pixels(normalized).keys() == before.keys()
+
+
+def test_changed_touched_and_new_images(dirs):
+    source, extracted, normalized = dirs
+    write_images(source, range(6))
+    run_preprocessing(source, extracted, normalized, workers=1)
+    before, names = stored_pixels(normalized), {k: e['Image Filename'] for k, e in load_manifest(normalized).items()}
+
+    write_images(source, [0], seed=1)                                  # new content
+    os.utime(os.path.join(source, 'class_1', 'fish_001.png'), (1, 1))  # same content, new mtime
+    write_images(source, [6])                                          # new file
+    stats = run_preprocessing(source, extracted, normalized, workers=1)
+
+    assert (stats['processed'], stats['total']) == (2, 7)
+    after = stored_pixels(normalized)
+    assert not np.array_equal(after['class_0/fish_000.png'], before['class_0/fish_000.png'])
+    assert all(np.array_equal(after[key], before[key]) for key in before if key != 'class_0/fish_000.png')
+    # Output names stay stable; the new file continues its folder's numbering
+    manifest = load_manifest(normalized)
+    assert all(manifest[key]['Image Filename'] == name for key, name in names.items())
+    assert manifest['class_0/fish_006.png']['Image Filename'] == 'class_0 (4).jpg'
+    # The touched file is not decoded again on the next run
+    assert run_preprocessing(source, extracted, normalized, workers=1)['processed'] == 0
+
+
+class CrashingWriter(FishDataset.ShardWriter):
+    # Dies right after the first shard is committed, like a run killed halfway
+    def flush(self):
+        shard_id = super().flush()
+        if shard_id is not None:
+            raise KeyboardInterrupt
+        return shard_id
+
+
+def test_interrupted_run_resumes_from_committed_shards(dirs, monkeypatch):
+    source, extracted, normalized = dirs
+    write_images(source, range(10))
+    monkeypatch.setattr(Preprocessing, 'ShardWriter', functools.partial(CrashingWriter, shard_size=4))
+    with pytest.raises(KeyboardInterrupt):
+        run_preprocessing(source, extracted, normalized, workers=1)
+    assert len(load_manifest(normalized)) == 4
+
+    monkeypatch.setattr(Preprocessing, 'ShardWriter', functools.partial(FishDataset.ShardWriter, shard_size=4))
+    stats = run_preprocessing(source, extracted, normalized, workers=1)
+    assert (stats['processed'], stats['total']) == (6, 10)
+    dataset = ShardedDataset(normalized)
+    assert len(dataset) == 10 and dataset.images(np.arange(10)).shape == (10, 224, 224, 3)
+
+
+def test_preprocessing_version_change_rebuilds_everything(dirs):
+    source, extracted, normalized = dirs
+    write_images(source, range(5))
+    run_preprocessing(source, extracted, normalized, workers=1)
+    meta_path = os.path.join(normalized, 'dataset.json')
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['preprocessing_version'] -= 1
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    stats = run_preprocessing(source, extracted, normalized, workers=1)
+    assert (stats['processed'], stats['total']) == (5, 5)
+    assert ShardedDataset(normalized).preprocessing_version == FishDataset.PREPROCESSING_VERSION
@@ -0,0 +1,95 @@
+import time
+import sqlite3
+import threading
+import numpy as np
+import pytest
+from datetime import date, datetime, timedelta
+from ScanHistory import ScanHistory, disease_counts, image_hash, day_of
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = ScanHistory(str(tmp_path / 'history.db'), batch_size=50, flush_seconds=0.05)
+    yield history
+    history.close()
+
+
+def days_ago(n):
+    return time.mktime((datetime.now() - timedelta(days=n)).timetuple())
+
+
+def test_rows_are_written_in_batches(history):
+    for i in range(120):
+        assert history.record('Healthy' if i % 3 else 'Aeromoniasis', 0.9, pred=np.full(5, 0.2), image_hash='abc')
+    assert history.flush()
+
+    stats = history.stats()
+    assert stats['written'] == 120 and stats['dropped'] == 0 and stats['pending'] == 0
+    assert stats['batches'] < 120
+    today = date.today().isoformat()
+    assert disease_counts(history.path) == {(today, 'Aeromoniasis'): 40, (today, 'Healthy'): 80}
+
+    db = sqlite3.connect(history.path)
+    pred, = db.execute("SELECT pred FROM scans LIMIT 1").fetchone()
+    assert np.allclose(np.frombuffer(pred, dtype=np.float32), [0.2] * 5)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+def test_concurrent_writers_lose_nothing(history):
+    threads = [threading.Thread(target=lambda: [history.record('Healthy', 0.8, tank='t1') for _ in range(200)])
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert history.flush()
+    assert sum(disease_counts(history.path, tank='t1').values()) == 800
+    assert disease_counts(history.path, tank='t2') == {}
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    history = ScanHistory(str(tmp_path / 'history.db'), queue_size=5)
+    # Hold the writer on its first batch so the queue fills
+    release = threading.Event()
+    write = history._write
+    history._write = lambda batch: (release.wait(5), write(batch))
+    start = time.perf_counter()
+    results = [history.record('Healthy', 0.9) for _ in range(50)]
+    assert time.perf_counter() - start < 1.0
+    assert not all(results)
+    release.set()
+    assert history.flush()
+    history.close()
+    stats = history.stats()
+    assert stats['dropped'] == results.count(False) and stats['written'] == results.count(True)
+
+
+def test_close_writes_everything_still_queued(tmp_path):
+    path = str(tmp_path / 'history.db')
+    history = ScanHistory(path, batch_size=1000, flush_seconds=10.0)
+    for _ in range(30):
+        history.record('Healthy', 0.9)
+    history.close()
+    assert sum(disease_counts(path).values()) == 30
+
+
+def test_compaction_keeps_the_counts(history):
+    for n, label in [(40, 'Healthy'), (40, 'Aeromoniasis'), (1, 'Healthy')]:
+        history.record(label, 0.7, ts=days_ago(n))
+    assert history.flush()
+    before = disease_counts(history.path)
+
+    assert history.compact(keep_days=30) == 2
+    assert disease_counts(history.path) == before
+    assert sqlite3.connect(history.path).execute("SELECT COUNT(*) FROM scans").fetchone()[0] == 1
+    # Compacting the same days again adds to the rollup instead of replacing it
+    history.record('Healthy', 0.7, ts=days_ago(40))
+    assert history.flush()
+    history.compact(keep_days=30)
+    assert disease_counts(history.path)[(day_of(days_ago(40)), 'Healthy')] == 2
+
+
+def test_image_hash_depends_on_pixels_only():
+    a = np.zeros((224, 224, 3), dtype=np.uint8)
+    assert image_hash(a) == image_hash(a.copy()) and len(image_hash(a)) == 16
+    assert image_hash(a) != image_hash(a + 1)
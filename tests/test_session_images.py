@@ -0,0 +1,67 @@
+import io
+import numpy as np
+from PIL import Image
+import SessionImages
+from SessionImages import SessionImageStore, CompactImage, compact_image, encode_thumbnail
+
+PIXELS_BYTES = 224 * 224 * 3
+
+
+def photo(size=(1600, 1200), seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+
+
+def compact(thumbnail_bytes=1000):
+    return CompactImage(np.zeros((224, 224, 3), dtype=np.uint8), b'x' * thumbnail_bytes)
+
+
+def test_compact_image_keeps_model_input_and_a_small_thumbnail():
+    img = photo()
+    result = compact_image(img, thumbnail_budget=60 * 1024)
+    assert result.pixels.shape == (224, 224, 3) and result.pixels.dtype == np.uint8
+    assert len(result.thumbnail) <= 60 * 1024
+    thumb = Image.open(io.BytesIO(result.thumbnail))
+    assert thumb.format == 'JPEG' and max(thumb.size) <= 480
+    assert result.nbytes == PIXELS_BYTES + len(result.thumbnail)
+
+
+def test_thumbnail_shrinks_until_it_fits():
+    # Noise compresses badly, so a tiny budget forces both lower quality and smaller size
+    data = encode_thumbnail(photo(seed=1), max_bytes=4096)
+    assert len(data) <= 4096
+    assert max(Image.open(io.BytesIO(data)).size) < 480
+
+
+def test_store_budgets_and_replacement():
+    store = SessionImageStore(session_budget=PIXELS_BYTES + 8000, global_budget=3 * (PIXELS_BYTES + 1000))
+    assert store.thumbnail_budget == 8000
+    for session in 'abc':
+        store.put(session, compact())
+    # A new upload replaces the session's previous image instead of adding to it
+    store.put('a', compact(500))
+    assert store.stats()['bytes'] == 3 * PIXELS_BYTES + 2500
+
+    # Over the global budget: the least recently used session goes first
+    store.get('b')
+    store.put('d', compact())
+    assert store.get('c') is None
+    assert all(store.get(s) is not None for s in 'abd')
+    assert store.stats()['evicted'] == 1
+
+    store.discard('a')
+    assert store.get('a') is None and store.stats()['sessions'] == 2
+
+
+def test_idle_sessions_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(SessionImages.time, 'time', lambda: now[0])
+    store = SessionImageStore(idle_seconds=60)
+    store.put('old', compact())
+    now[0] += 30
+    store.put('recent', compact())
+    now[0] += 45
+    assert store.get('old') is None
+    assert store.get('recent') is not None
+    assert store.stats() == {'sessions': 1, 'bytes': PIXELS_BYTES + 1000,
+                             'global_budget': store.global_budget, 'evicted': 1}
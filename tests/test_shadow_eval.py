@@ -0,0 +1,90 @@
+import time
+import threading
+import numpy as np
+import pytest
+import ShadowEval
+from FishInference import labels_list
+from ShadowEval import ShadowEvaluator, parse_candidates, shadow_from_env
+
+
+def one_hot(index, confidence):
+    pred = np.full((1, len(labels_list)), (1.0 - confidence) / (len(labels_list) - 1), dtype=np.float32)
+    pred[0, index] = confidence
+    return pred
+
+
+class FakeBackend:
+    def __init__(self, index, confidence, gate=None):
+        self.pred = one_hot(index, confidence)
+        self.gate = gate
+        self.calls = 0
+
+    def predict(self, batch):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls += 1
+        return np.repeat(self.pred, len(batch), axis=0)
+
+
+def use_backends(monkeypatch, backends):
+    def load_backend(path, num_threads=None):
+        if isinstance(backends[path], Exception):
+            raise backends[path]
+        return backends[path]
+    monkeypatch.setattr(ShadowEval, 'load_backend', load_backend)
+
+
+def pixels():
+    return np.zeros((224, 224, 3), dtype=np.uint8)
+
+
+def test_parse_candidates():
+    assert parse_candidates('int8=models/a.tflite, models/small.keras ,dir/saved/') == {
+        'int8': 'models/a.tflite', 'small.keras': 'models/small.keras', 'saved': 'dir/saved/'}
+    assert parse_candidates('') == {} and parse_candidates(None) == {}
+
+
+def test_candidates_are_compared_with_production(monkeypatch):
+    use_backends(monkeypatch, {'same': FakeBackend(0, 0.9), 'other': FakeBackend(2, 0.6), 'broken': OSError('no file')})
+    shadow = ShadowEvaluator({'same': 'same', 'other': 'other', 'broken': 'broken'})
+    for _ in range(4):
+        assert shadow.submit(pixels(), one_hot(0, 0.8), 0.02)
+    assert shadow.wait(10)
+
+    stats = shadow.stats()
+    same, other, broken = (stats['candidates'][name] for name in ('same', 'other', 'broken'))
+    assert same['compared'] == 4 and same['agreement'] == 1.0
+    assert same['mean_confidence_delta'] == pytest.approx(0.1)
+    assert other['agreement'] == 0.0 and other['mean_confidence_delta'] == pytest.approx(-0.2)
+    assert other['top_disagreements'] == {f'{labels_list[0]} -> {labels_list[2]}': 4}
+    assert broken['state'] == 'failed' and 'no file' in broken['error']
+    assert stats['production_latency']['p50_ms'] == pytest.approx(20.0)
+    assert 'speedup_p50' in same
+
+
+def test_full_queue_drops_instead_of_blocking(monkeypatch):
+    gate = threading.Event()
+    use_backends(monkeypatch, {'slow': FakeBackend(0, 0.9, gate)})
+    shadow = ShadowEvaluator({'slow': 'slow'}, queue_size=2)
+    start = time.perf_counter()
+    accepted = [shadow.submit(pixels(), one_hot(0, 0.9), 0.01) for _ in range(10)]
+    assert time.perf_counter() - start < 1.0
+    gate.set()
+    assert shadow.wait(10)
+    assert shadow.stats()['dropped'] == accepted.count(False) > 0
+    assert shadow.stats()['candidates']['slow']['compared'] == accepted.count(True)
+
+
+def test_sampling_and_environment(monkeypatch):
+    use_backends(monkeypatch, {'a.tflite': FakeBackend(0, 0.9)})
+    shadow = ShadowEvaluator({'a': 'a.tflite'}, sample=0.0)
+    assert not any(shadow.submit(pixels(), one_hot(0, 0.9), 0.01) for _ in range(20))
+
+    monkeypatch.delenv('FINSCAN_SHADOW_MODELS', raising=False)
+    assert shadow_from_env() is None
+    monkeypatch.setenv('FINSCAN_SHADOW_MODELS', 'a=a.tflite')
+    monkeypatch.setenv('FINSCAN_SHADOW_SAMPLE', '0.25')
+    monkeypatch.setenv('FINSCAN_SHADOW_QUEUE', '8')
+    shadow = shadow_from_env()
+    assert shadow.sample == 0.25 and shadow.jobs.maxsize == 8
+    assert [c.name for c in shadow.candidates] == ['a']
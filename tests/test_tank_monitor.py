@@ -0,0 +1,90 @@
+import os
+import time
+import numpy as np
+import pytest
+from PIL import Image
+from FishInference import labels_list
+from TankMonitor import TankMonitor, AlertTracker, open_source, HEALTHY
+
+DISEASE = next(label for label in labels_list if label != HEALTHY)
+
+
+class FakeBackend:
+    # Bright frames look diseased, dark frames healthy; records every batch size
+    version = 'fake'
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batch_sizes = []
+
+    def predict(self, batch):
+        self.batch_sizes.append(len(batch))
+        time.sleep(self.delay)
+        preds = np.full((len(batch), len(labels_list)), 0.025, dtype=np.float32)
+        bright = batch.reshape(len(batch), -1).mean(axis=1) > 0.5
+        preds[np.arange(len(batch)), np.where(bright, labels_list.index(DISEASE), labels_list.index(HEALTHY))] = 0.9
+        return preds
+
+
+def write_frames(folder, values, size=(64, 48)):
+    os.makedirs(folder, exist_ok=True)
+    for i, value in enumerate(values):
+        Image.new('RGB', size, (value, value, value)).save(os.path.join(folder, f'{i:04d}.png'))
+    return str(folder)
+
+
+def test_unchanged_frames_are_skipped_until_the_keyframe_interval(tmp_path):
+    # 5 fps: ten dark frames then ten bright ones; only changes and 1 s keyframes are scored
+    folder = write_frames(tmp_path / 'tank', [0] * 10 + [255] * 10)
+    backend = FakeBackend()
+    monitor = TankMonitor(backend, {'tank': folder}, keyframe_seconds=1.0, folder_fps=5.0)
+    summary = monitor.run()
+
+    tank = summary['tanks']['tank']
+    assert tank['read'] == 20
+    assert tank['scored'] == 4
+    assert tank['skipped'] == 16
+    assert sum(backend.batch_sizes) == 4
+
+
+def test_frames_from_several_tanks_share_batches(tmp_path):
+    # A slow model lets frames pile up, so the worker takes several per call
+    sources = {name: write_frames(tmp_path / name, list(range(0, 200, 10))) for name in ('a', 'b')}
+    backend = FakeBackend(delay=0.05)
+    monitor = TankMonitor(backend, sources, max_batch_size=8, diff_threshold=-1.0)
+    summary = monitor.run()
+
+    assert sum(backend.batch_sizes) == 40
+    assert max(backend.batch_sizes) > 1
+    assert summary['batches'] == len(backend.batch_sizes) < 40
+
+
+def test_alert_needs_a_persistent_detection_and_clears_again():
+    tracker = AlertTracker('tank', window_seconds=5.0, min_frames=3, min_fraction=0.6)
+    # One diseased frame among healthy ones never alerts
+    assert [tracker.update(t, DISEASE if t == 1 else HEALTHY, 0.9) for t in range(4)] == [None] * 4
+
+    events = [tracker.update(t, DISEASE, 0.9) for t in range(4, 10)]
+    alerts = [e for e in events if e is not None]
+    assert len(alerts) == 1 and alerts[0]['event'] == 'alert' and alerts[0]['label'] == DISEASE
+
+    # Low-confidence detections do not count; the episode clears once the window is mostly healthy
+    events = [tracker.update(t, DISEASE if t % 2 else HEALTHY, 0.3) for t in range(10, 20)]
+    clears = [e for e in events if e is not None]
+    assert len(clears) == 1 and clears[0]['event'] == 'clear'
+
+
+def test_monitor_raises_alert_for_diseased_frames(tmp_path):
+    folder = write_frames(tmp_path / 'tank', list(range(0, 60, 6)) + list(range(200, 250, 5)))
+    alerts = []
+    monitor = TankMonitor(FakeBackend(), {'tank': folder}, diff_threshold=-1.0, window_seconds=2.0,
+                          min_frames=3, min_fraction=0.6, on_alert=alerts.append)
+    monitor.run()
+
+    assert [a['event'] for a in alerts] == ['alert']
+    assert alerts[0]['label'] == DISEASE and alerts[0]['time_s'] >= 2.0
+
+
+def test_missing_source_is_reported_before_opencv(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        open_source(str(tmp_path / 'missing.mp4'))